@@ -0,0 +1,44 @@
+""" Precomputed readouts of the current robot state while animation. """
+
+import numpy as np
+
+from robot_solution.buffers import RowBuffer
+from robot_solution.modeling.columns import ANGLE_COLUMNS, TCP_COLUMNS, QUAT_COLUMNS
+from robot_solution.modeling.transform_array import quat2eiler_array
+
+HUD_FIELDS = ['pose', 'quat', 'eiler'] + [f'angle{j + 1}' for j in range(6)]
+# values with 2 decimals centered to 8 symbols
+POSE_FORMAT = '{:^8.2f}' * 3
+QUAT_FORMAT = ' '.join(['{:^8.2f}'] * 4)
+EILER_FORMAT = ' '.join(['{:^8.2f}'] * 3)
+ANGLES_FORMAT = '\n'.join(['{:.2f}'] * 6)
+
+
+def hud_texts(rows):
+    """ Readout texts of the simulation rows [n x len(HUD_FIELDS)]:
+    tool position, quaternion, Euler angles and joint angles.
+    """
+
+    texts = np.empty((rows.shape[0], len(HUD_FIELDS)), dtype=object)
+    texts[:, 0] = [POSE_FORMAT.format(*values) for values in rows[:, TCP_COLUMNS].tolist()]
+    texts[:, 1] = [QUAT_FORMAT.format(*values) for values in rows[:, QUAT_COLUMNS].tolist()]
+    texts[:, 2] = [EILER_FORMAT.format(*values) for values in quat2eiler_array(rows[:, QUAT_COLUMNS]).tolist()]
+    texts[:, 3:] = [ANGLES_FORMAT.format(*values).split('\n') for values in rows[:, ANGLE_COLUMNS].tolist()]
+    return texts
+
+
+class HudTable:
+    """ Readout texts of every frame, computed once per chunk of simulation rows. """
+
+    def __init__(self, capacity=1024):
+        self._texts = RowBuffer((len(HUD_FIELDS),), dtype=object, capacity=capacity)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def append(self, rows):
+        self._texts.append(hud_texts(rows))
+
+    def frame(self, ind):
+        """ Texts of the frame in the order of HUD_FIELDS. """
+        return self._texts.data[ind]
@@ -0,0 +1,97 @@
+""" Levels of detail of the joint traces.
+
+Traces are simplified by the Ramer-Douglas-Peucker algorithm once, chunk by chunk as the trajectory
+is added: every dropped sample is closer to the simplified polyline than the level tolerance.
+The coarser levels simplify the finer ones, so their error is below the sum of the tolerances.
+A full redraw takes the coarsest level whose error is below half of the pixel, so the number of
+drawn vertices depends on the view, not on the trajectory length, and the shown path does not change.
+"""
+
+import numpy as np
+
+from robot_solution.buffers import RowBuffer
+
+LOD_TOLERANCES = (0.5, 2., 8.)  # tolerances of the levels, data units (mm of the plot)
+
+
+def segment_distances(points, start, end):
+    """ Distances of points [n x d] to the segment start-end [d]. """
+    direction = end - start
+    length = direction @ direction
+    offsets = points - start
+    if length == 0:
+        return np.linalg.norm(offsets, axis=1)
+    t = np.clip(offsets @ direction / length, 0, 1)
+    return np.linalg.norm(offsets - t[:, None] * direction, axis=1)
+
+
+def simplify_indices(points, tolerance):
+    """ Indices of the points [n x d] kept by the Ramer-Douglas-Peucker simplification.
+    The first and the last points are always kept.
+    """
+
+    n = points.shape[0]
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = segment_distances(points[first + 1:last], points[first], points[last])
+        k = int(np.argmax(distances))
+        if distances[k] > tolerance:
+            k += first + 1
+            keep[k] = True
+            stack += [(first, k), (k, last)]
+    return np.flatnonzero(keep)
+
+
+class TraceLod:
+    """ Kept sample numbers of every level and trace, extended by every added chunk. """
+
+    def __init__(self, n_traces, tolerances=LOD_TOLERANCES):
+        self.tolerances = tuple(tolerances)
+        self._indices = [[RowBuffer((), dtype=np.int64) for _ in range(n_traces)] for _ in self.tolerances]
+        self._last = None  # the last added sample [3 x n_traces]
+        self.n_samples = 0
+
+    def append(self, positions):
+        """ Simplifies the next samples [k x 3 x n_traces]. The chunk is simplified from the last sample
+        of the previous one, so the joining segment is bounded too.
+        """
+
+        if positions.shape[0] == 0:
+            return
+        offset = self.n_samples
+        if self._last is not None:
+            positions = np.concatenate((self._last[None], positions))
+            offset -= 1
+        for j in range(positions.shape[2]):
+            kept = np.arange(positions.shape[0])
+            for level, tolerance in enumerate(self.tolerances):
+                kept = kept[simplify_indices(positions[kept, :, j], tolerance)]
+                # the first sample is the last kept one of the previous chunk
+                self._indices[level][j].append(kept[1:] + offset if self._last is not None else kept + offset)
+        self._last = positions[-1].copy()
+        self.n_samples = offset + positions.shape[0]
+
+    def level(self, pixel_size):
+        """ The coarsest level with the error below half of the pixel size, None for all samples. """
+        error, level = 0., None
+        for k, tolerance in enumerate(self.tolerances):
+            error += tolerance
+            if error > pixel_size / 2:
+                break
+            level = k
+        return level
+
+    def indices(self, level, trace, end):
+        """ Sample numbers of the trace up to the sample end inclusive (it is always the last). """
+        if level is None:
+            return np.arange(end + 1)
+        kept = self._indices[level][trace].data
+        kept = kept[:np.searchsorted(kept, end)]
+        return np.append(kept, end)
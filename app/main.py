@@ -1,14 +1,46 @@
+import argparse
+import multiprocessing
 import sys
+
+from app.startup import STARTUP
 from PyQt5 import QtWidgets
 
 from app.widget import AnimationWidget
+from robot_solution import instrumentation
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Robot 3D interactive application.')
+    parser.add_argument('--startup-report', nargs='?', const='', metavar='FILE',
+                        help='print the startup stages times (and save them to the JSON file)')
+    parser.add_argument('--profile', nargs='?', const='profile.json', metavar='FILE',
+                        help='time the stages and save their percentiles to the JSON file on exit')
+    return parser.parse_known_args(argv)
+
+
+def report_startup(path):
+    print('\n'.join(STARTUP.report()))
+    if path:
+        STARTUP.save(path)
 
 
 def run_app():
-    q_app = QtWidgets.QApplication(sys.argv)
+    # process pool workers of the frozen application run their task instead of the application
+    multiprocessing.freeze_support()
+    args, qt_args = parse_args(sys.argv[1:])
+    STARTUP.mark('imports')
+    if args.profile is not None:
+        instrumentation.enable()
+    q_app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
     aw = AnimationWidget()
+    STARTUP.mark('window')
     aw.show()
-    sys.exit(q_app.exec_())
+    if args.startup_report is not None:
+        aw.canvas_ready.connect(lambda: report_startup(args.startup_report))
+    status = q_app.exec_()
+    if args.profile is not None:
+        instrumentation.dump(args.profile)
+    sys.exit(status)
 
     
 if __name__ == '__main__':
@@ -0,0 +1,261 @@
+""" Trajectory playback on the 3D axes with blitting.
+
+The static scene and the joint traces drawn so far are kept in a cached background.
+Every frame restores it, draws only the new pieces of the traces and the robot line,
+so the cost of a frame does not depend on the trajectory length.
+Only complete redraws (start, resize, view rotation) draw the full traces: an updater drawn just before
+them sets the traces simplified to the pixel size (app.lod), blitted frames never touch them.
+Frames are chosen by the playback clock, so the trajectory time follows the wall time (multiplied
+by the speed) and frames are dropped when drawing is slower than the frame step.
+"""
+
+import time
+import numpy as np
+
+from app.lod import TraceLod, LOD_TOLERANCES
+from robot_solution.buffers import RowBuffer
+from robot_solution import instrumentation
+from robot_solution.instrumentation import timed
+from robot_solution.modeling.columns import SOLVER_STEP
+
+
+MIN_SPEED, MAX_SPEED = 0.1, 10.
+TRACE_UPDATE_ZORDER = 1.9  # the updater is drawn before the traces (zorder 2 of lines)
+
+
+class PlaybackClock:
+    """ Trajectory time running as the wall time multiplied by the speed. """
+
+    def __init__(self, speed=1., timer=time.perf_counter):
+        self._timer = timer
+        self.speed = float(np.clip(speed, MIN_SPEED, MAX_SPEED))
+        self._origin = 0.  # trajectory time at the wall time _started
+        self._started = None  # None while paused
+
+    @property
+    def running(self):
+        return self._started is not None
+
+    def time(self):
+        """ Current trajectory time, s. """
+        if self._started is None:
+            return self._origin
+        return self._origin + self.speed * (self._timer() - self._started)
+
+    def start(self):
+        if self._started is None:
+            self._started = self._timer()
+
+    def pause(self):
+        self._origin = self.time()
+        self._started = None
+
+    def seek(self, trajectory_time):
+        self._origin = trajectory_time
+        if self._started is not None:
+            self._started = self._timer()
+
+    def set_speed(self, speed):
+        """ Changes the speed (clipped to MIN_SPEED..MAX_SPEED) from the current time. """
+        self.seek(self.time())
+        self.speed = float(np.clip(speed, MIN_SPEED, MAX_SPEED))
+
+
+def draw_hook(callback, zorder):
+    """ Invisible artist calling callback when its axes or figure are drawn completely (not by blitting).
+    It is drawn among the other artists by the zorder.
+    """
+
+    # matplotlib is loaded with the plot canvas, not on the application startup
+    from matplotlib.artist import Artist
+
+    class DrawHook(Artist):
+        def draw(self, renderer):
+            callback()
+
+    hook = DrawHook()
+    hook.set_zorder(zorder)
+    return hook
+
+
+class TrajectoryPlayer:
+    """ Plays robot joint positions x, y, z [T x N] (N points of the robot line).
+    on_frame(ind) is called after every shown frame.
+    If complete is not set, the positions are being computed: the next ones are added by append,
+    playback waits for them at the last known frame until set_complete.
+    Frames are frame_step (s) apart or at the given times [T] (s).
+    """
+
+    def __init__(self, axes, x, y, z, interval=10, on_frame=None, complete=True, lod_tolerances=LOD_TOLERANCES,
+                 times=None, frame_step=SOLVER_STEP, speed=1.):
+        self.axes = axes
+        self.canvas = axes.figure.canvas
+        self._positions = RowBuffer((3, x.shape[1]), capacity=max(x.shape[0], 1024))
+        self.lod = TraceLod(x.shape[1], lod_tolerances)
+        self.frame_step = frame_step
+        # frame times are kept only if they are given, the uniform frames are found by division
+        self._times = None if times is None else RowBuffer((), capacity=max(x.shape[0], 1024))
+        self.clock = PlaybackClock(speed)
+        self.append(x, y, z, times)
+        self.n_points = x.shape[1]
+        self.complete = complete
+        self.on_frame = on_frame
+        self.ind = 0  # current frame
+        self._folded = 0  # the last frame of the traces in the cached background
+        self._background = None
+        # init robot line
+        self.line_init, = axes.plot(
+            x[0, :], y[0, :], z[0, :], lw=2, c='b', marker='.',
+            markersize=8, label='Исходное положение')
+        # current robot line is drawn over the background only
+        self.line, = axes.plot(
+            x[0, :], y[0, :], z[0, :], lw=2, c='g', marker='.',
+            markersize=8, label='Текущее положение', animated=True)
+        # joint traces: full ones for complete redraws and new pieces for blitting
+        self.joint_lines, self.tail_lines = [], []
+        for j in range(self.n_points):
+            self.joint_lines.append(axes.plot(x[:1, j], y[:1, j], z[:1, j], c='#6b6b6b', lw=0.5)[0])
+            self.tail_lines.append(axes.plot(x[:1, j], y[:1, j], z[:1, j], c='#6b6b6b', lw=0.5,
+                                             animated=True)[0])
+        axes.add_artist(draw_hook(self._set_traces, TRACE_UPDATE_ZORDER))
+        self._draw_cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.timer = self.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self._next_frame)
+
+    @property
+    def n_frames(self):
+        return len(self._positions)
+
+    @property
+    def finished(self):
+        return self.complete and self.ind == self.n_frames - 1
+
+    @property
+    def running(self):
+        return self.clock.running
+
+    def append(self, x, y, z, times=None):
+        """ Adds the next computed positions [k x N] and their times [k] if the player has frame times. """
+        positions = np.stack((x, y, z), axis=1)
+        self._positions.append(positions)
+        self.lod.append(positions)
+        if self._times is not None:
+            self._times.append(times)
+        positions = self._positions.data
+        self.x, self.y, self.z = positions[:, 0], positions[:, 1], positions[:, 2]
+
+    def set_complete(self):
+        """ Marks all the positions as added. """
+        self.complete = True
+        if self.finished and self.on_frame is not None:
+            # the last frame was shown before it became the last one
+            self.on_frame(self.ind)
+
+    def frame_time(self, ind):
+        """ Trajectory time of the frame, s. """
+        return ind * self.frame_step if self._times is None else float(self._times.data[ind])
+
+    def frame_at(self, trajectory_time):
+        """ The last frame at the trajectory time (clipped to the known frames). """
+        if self._times is None:
+            ind = int(trajectory_time / self.frame_step + 1e-9)
+        else:
+            ind = int(np.searchsorted(self._times.data, trajectory_time, side='right')) - 1
+        return min(max(ind, 0), self.n_frames - 1)
+
+    def start(self):
+        """ Starts playback from the first frame. """
+        self.ind = 0
+        self.clock.seek(self.frame_time(0))
+        self.clock.start()
+        self.timer.start()
+        self.canvas.draw_idle()
+
+    def pause(self):
+        self.timer.stop()
+        self.clock.pause()
+
+    def resume(self):
+        if not self.finished:
+            self.clock.start()
+            self.timer.start()
+
+    def set_speed(self, speed):
+        self.clock.set_speed(speed)
+
+    def seek(self, ind):
+        """ Shows the frame ind, playback continues from it if it is running. """
+        ind = min(max(int(ind), 0), self.n_frames - 1)
+        self.clock.seek(self.frame_time(ind))
+        self.show_frame(ind)
+
+    def stop(self):
+        """ Stops playback and releases the canvas. """
+        self.timer.stop()
+        self.clock.pause()
+        self.canvas.mpl_disconnect(self._draw_cid)
+        self._background = None
+
+    def _on_draw(self, event):
+        """ Caches the background after a complete redraw (start, resize, view rotation). """
+        self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self._folded = self.ind
+        # the canvas is being painted, drawing to its buffer is enough
+        self.axes.draw_artist(self.line)
+
+    def pixel_size(self):
+        """ Data units per pixel of the widest axis of the view. """
+        width = max(self.axes.bbox.width, 1.)
+        limits = [self.axes.get_xlim(), self.axes.get_ylim(), self.axes.get_zlim()]
+        return max(high - low for low, high in limits) / width
+
+    def _set_traces(self):
+        """ Sets the full traces up to the current frame simplified to the pixel size of the view. """
+        x, y, z = self.x, self.y, self.z
+        level = self.lod.level(self.pixel_size())
+        for j, line in enumerate(self.joint_lines):
+            if level is None:
+                line.set_data_3d(x[:self.ind + 1, j], y[:self.ind + 1, j], z[:self.ind + 1, j])
+            else:
+                samples = self.lod.indices(level, j, self.ind)
+                line.set_data_3d(x[samples, j], y[samples, j], z[samples, j])
+
+    def _next_frame(self):
+        """ Shows the frame of the clock time, the frames between are dropped. """
+        if self.finished:
+            self.pause()
+            return
+        last = self.n_frames - 1
+        ind = self.frame_at(self.clock.time())
+        if ind > self.ind + 1:
+            instrumentation.count('render.dropped_frames', ind - self.ind - 1)
+        if ind == last and not self.complete:
+            # waits for the next computed positions at the last known frame
+            self.clock.seek(self.frame_time(last))
+        if ind != self.ind:
+            self.show_frame(ind)
+
+    @timed('render.frame')
+    def show_frame(self, ind):
+        """ Shows the frame ind, the traces are extended from the previous shown frame. """
+        self.ind = ind
+        x, y, z = self.x, self.y, self.z
+        # full traces are set by the updater of complete redraws only
+        self.line.set_data_3d(x[ind], y[ind], z[ind])
+        if self._background is None or ind < self._folded:
+            self.canvas.draw_idle()
+        else:
+            self.canvas.restore_region(self._background)
+            # add new pieces of the traces to the background
+            for j, line in enumerate(self.tail_lines):
+                line.set_data_3d(x[self._folded:ind + 1, j], y[self._folded:ind + 1, j],
+                                 z[self._folded:ind + 1, j])
+                self.axes.draw_artist(line)
+            self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+            self._folded = ind
+            self.axes.draw_artist(self.line)
+            self.canvas.blit(self.axes.bbox)
+        if self.finished:
+            self.pause()
+        if self.on_frame is not None:
+            self.on_frame(ind)
@@ -0,0 +1,104 @@
+""" Interactive preview of the input point.
+Bursts of input changes are coalesced and solved on worker threads, only the latest state is shown.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PyQt5 import QtCore
+
+from robot_solution import instrumentation
+from robot_solution.instrumentation import timed
+from robot_solution.modeling.point import Point
+from robot_solution.modeling.reachability import get_reachability_index
+from robot_solution.modeling.simulation import find_Trans_JointAngle_joint_pos
+
+
+@timed('preview.solve')
+def solve_point_state(state):
+    """ Solves the point given by widget values on a worker thread.
+    state: ('pose', [7]) or ('angles', [6]).
+    Returns the solved point and its joint positions [3 x 7] or None if the pose is unreachable.
+    """
+
+    kind, value = state
+    point = Point()
+    if kind == 'pose':
+        # poses probably out of the workspace are not previewed, the forward solution is skipped
+        index = get_reachability_index()
+        if index is not None and not index.contains(value):
+            return None
+        if not point.try_solve_forward(value).solved:
+            return None
+    else:
+        point.angles = value
+    _, _, joint_pos = find_Trans_JointAngle_joint_pos(np.hstack((point.angles, 0 * point.angles)))
+    return point, joint_pos
+
+
+class PreviewPipeline(QtCore.QObject):
+    """ Solves the input states on a thread pool.
+    A new request replaces the one not yet started, results of superseded requests are dropped.
+    """
+
+    solved = QtCore.pyqtSignal(object)  # result of the solver for the latest request
+    failed = QtCore.pyqtSignal(str)  # error of the solver for the latest request
+    _finished = QtCore.pyqtSignal(int, object)  # request number, future (emitted by worker threads)
+
+    def __init__(self, solver=solve_point_state, parent=None, max_workers=2, delay=0):
+        QtCore.QObject.__init__(self, parent)
+        self.solver = solver
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='preview')
+        self._pending = None  # the latest not started request
+        self._requested = 0  # number of the latest request
+        self._shown = 0  # number of the latest delivered result
+        self._running = 0  # number of requests being solved
+        # zero delay coalesces all the input events already queued in the event loop
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._submit)
+        self._finished.connect(self._deliver)
+
+    def request(self, state):
+        """ Queues the latest input state. """
+        self._requested += 1
+        instrumentation.count('preview.requests')
+        if self._pending is not None:
+            # the request not yet started is replaced
+            instrumentation.count('preview.replaced')
+        self._pending = (self._requested, state)
+        self._timer.start()
+
+    def _submit(self):
+        """ Starts solving the pending request if there is a free worker. """
+        if self._pending is None or self._running >= self.max_workers:
+            return
+        number, state = self._pending
+        self._pending = None
+        self._running += 1
+        future = self._executor.submit(self.solver, state)
+        future.add_done_callback(lambda done: self._finished.emit(number, done))
+
+    def _deliver(self, number, future):
+        """ Shows the result if no newer one was shown, starts the pending request. """
+        self._running -= 1
+        if number > self._shown:
+            try:
+                result = future.result()
+            except Exception as ex:
+                self._shown = number
+                self.failed.emit(str(ex) or type(ex).__name__)
+            else:
+                self._shown = number
+                self.solved.emit(result)
+        else:
+            # a newer result was shown
+            instrumentation.count('preview.dropped')
+        self._submit()
+
+    def shutdown(self):
+        """ Drops the pending request and stops workers. """
+        self._pending = None
+        self._timer.stop()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,37 @@
+""" Startup time report.
+
+Stages of the application startup are marked with the time from the start of app.main:
+imports, window construction, the first shown window and the deferred plot canvas.
+    python app/main.py --startup-report [startup.json]
+"""
+
+import json
+import time
+
+START = time.perf_counter()
+
+
+class StartupProfile:
+    """ Times of the startup stages, s from START. """
+
+    def __init__(self, start=START):
+        self.start = start
+        self.stages = []  # (name, time)
+
+    def mark(self, name):
+        self.stages.append((name, time.perf_counter() - self.start))
+
+    def report(self):
+        """ Lines of the stages with their own durations. """
+        lines, previous = [], 0.
+        for name, moment in self.stages:
+            lines.append(f'{name:<10} {moment:7.3f} s  (+{moment - previous:.3f} s)')
+            previous = moment
+        return lines
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(dict(self.stages), file, indent=2)
+
+
+STARTUP = StartupProfile()
@@ -0,0 +1,75 @@
+""" Virtual list of the track points for the points list view. """
+
+from PyQt5 import QtCore, QtWidgets
+
+from robot_solution.track import Track
+
+
+class TrackListModel(QtCore.QAbstractListModel):
+    """ Items of the track points and the last "add point" item.
+    Item texts are made only for the visible rows, edits of the track go through the model.
+    """
+
+    def __init__(self, track=None, add_text='добавить точку', parent=None):
+        QtCore.QAbstractListModel.__init__(self, parent)
+        self.track = Track() if track is None else track
+        self.add_text = add_text
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.track) + 1
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        if index.row() == len(self.track):
+            return self.add_text
+        if self.track.is_linear(index.row()):
+            return f'точка {self.track.number(index.row())} (линейно)'
+        return f'точка {self.track.number(index.row())}'
+
+    def append(self, point, linear=False):
+        self.insert(len(self.track), point, linear)
+
+    def insert(self, row, point, linear=False):
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.track.insert(row, point, linear)
+        self.endInsertRows()
+
+    def replace(self, row, point, linear=None):
+        self.track.replace(row, point, linear)
+        self.dataChanged.emit(self.index(row), self.index(row))
+
+    def delete(self, row):
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        self.track.delete(row)
+        self.endRemoveRows()
+
+    def set_track(self, track):
+        self.beginResetModel()
+        self.track = track
+        self.endResetModel()
+
+
+def replace_list_widget(list_widget, model):
+    """ Replaces the list widget loaded from the design by the list view of the model.
+    The "add point" text is taken from the last item of the list widget.
+    """
+
+    if list_widget.count():
+        model.add_text = list_widget.item(list_widget.count() - 1).text()
+    view = QtWidgets.QListView(list_widget.parentWidget())
+    view.setObjectName(list_widget.objectName())
+    view.setSizePolicy(list_widget.sizePolicy())
+    view.setMinimumSize(list_widget.minimumSize())
+    view.setMaximumSize(list_widget.maximumSize())
+    view.setFont(list_widget.font())
+    view.setStyleSheet(list_widget.styleSheet())
+    view.setUniformItemSizes(True)  # rows are not measured one by one
+    view.setModel(model)
+    layout = list_widget.parentWidget().layout()
+    if layout is None or layout.replaceWidget(list_widget, view) is None:
+        view.setGeometry(list_widget.geometry())
+    list_widget.hide()
+    list_widget.deleteLater()
+    view.show()
+    return view
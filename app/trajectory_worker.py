@@ -0,0 +1,112 @@
+""" Background computation of trajectories. """
+
+import time
+from PyQt5 import QtCore
+
+import numpy as np
+
+from robot_solution import instrumentation
+from robot_solution.modeling.collision import check_trajectory
+from robot_solution.segments import iter_trajectory, count_segments
+from robot_solution.timing import iter_time_optimal
+
+
+class TrajectoryWorker(QtCore.QThread):
+    """ Computes the trajectory of the track and sends simulation rows chunk by chunk.
+    Saving to files needs the whole trajectory, so it is computed as one chunk then.
+    Otherwise segments are taken from segment_cache (create_segment_cache) if given.
+    If time_limits (velocity, acceleration and jerk of the joints) are given, the time-optimal
+    timing replaces the solver (robot_solution.timing).
+    Segments ending at the points marked in linear are linear moves between the poses, in the solver mode
+    they are timed by linear_time_limits (velocity, acceleration and jerk of the joints).
+    A trajectory taken from the cache is given by rows, it is sent as one chunk.
+    If obstacles are given, the whole trajectory is checked for collisions (collision.check_trajectory)
+    before completed is emitted, the result is kept in collisions.
+    """
+
+    SEGMENTS = {'segments': True}  # settings of the segment-wise computation
+
+    chunk_ready = QtCore.pyqtSignal(object, int, int)  # rows, number of computed chunks, total number
+    completed = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, track, save=False, file_in='traj_in.csv', file_out='traj_out.csv', segment_cache=None,
+                 time_limits=None, poses=None, linear=None, rows=None, obstacles=None, linear_time_limits=None,
+                 parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.track = track.copy()
+        self.poses = None if poses is None else poses.copy()
+        self.linear = None if linear is None or not linear.any() else linear.copy()
+        self.save = save
+        self.segment_cache = segment_cache
+        self.time_limits = time_limits
+        self.linear_time_limits = None if self.linear is None else linear_time_limits
+        self.file_in, self.file_out = file_in, file_out
+        self.rows = rows
+        self.obstacles = obstacles
+        self.collisions = None
+        self._cancelled = False
+
+    @property
+    def settings(self):
+        """ Solver settings of the computed trajectory (for the trajectory cache). """
+        if self.time_limits is not None:
+            return self.time_optimal_settings(self.time_limits, self.linear)
+        return {} if self.save else self.segments_settings(self.linear, self.linear_time_limits)
+
+    @staticmethod
+    def time_optimal_settings(time_limits, linear=None):
+        settings = {'time_optimal': [list(map(float, limits)) for limits in time_limits]}
+        return TrajectoryWorker._add_linear(settings, linear)
+
+    @staticmethod
+    def segments_settings(linear=None, linear_time_limits=None):
+        settings = TrajectoryWorker._add_linear(dict(TrajectoryWorker.SEGMENTS), linear)
+        if 'linear' in settings and linear_time_limits is not None:
+            settings['linear_time_limits'] = [list(map(float, limits)) for limits in linear_time_limits]
+        return settings
+
+    @staticmethod
+    def _add_linear(settings, linear):
+        """ Numbers of the points reached by linear moves are the settings too. """
+        if linear is not None and linear.any():
+            settings['linear'] = [int(k) for k in linear.nonzero()[0]]
+        return settings
+
+    def cancel(self):
+        """ Stops sending chunks, the current chunk is finished in background. """
+        self._cancelled = True
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            if self.rows is not None:
+                chunks, total = [self.rows], 1
+            elif self.time_limits is not None:
+                chunks = iter_time_optimal(self.track, *self.time_limits, poses=self.poses, linear=self.linear)
+                total = max(len(self.track) - 1, 1)
+            elif self.save:
+                from robot_solution.trajectory import get_trajectory
+                chunks, total = [get_trajectory(self.track, save=True, fileIn=self.file_in,
+                                                fileOut=self.file_out)], 1
+            else:
+                chunks = iter_trajectory(self.track, self.segment_cache, self.poses, self.linear,
+                                         self.linear_time_limits)
+                total = count_segments(self.track, self.linear)
+            computed = []
+            for k, rows in enumerate(chunks):
+                if self._cancelled:
+                    return
+                if k == 0:
+                    # latency of the animation start
+                    instrumentation.record('trajectory.first_chunk', time.perf_counter() - start)
+                computed.append(rows)
+                self.chunk_ready.emit(rows, k + 1, total)
+            if not self._cancelled:
+                instrumentation.record('trajectory.total', time.perf_counter() - start)
+                if self.obstacles is not None:
+                    with instrumentation.measure('trajectory.collisions'):
+                        self.collisions = check_trajectory(np.vstack(computed), self.obstacles)
+                self.completed.emit()
+        except Exception as ex:
+            self.failed.emit(str(ex))
@@ -0,0 +1,24 @@
+""" Background import of waypoint files. """
+
+from PyQt5 import QtCore
+
+from robot_solution.waypoints_io import import_waypoints
+
+
+class WaypointsImportWorker(QtCore.QThread):
+    """ Reads, validates and solves waypoints of the file (robot_solution.waypoints_io),
+    Cartesian waypoints are solved on the process pool. The report is sent on completion.
+    """
+
+    completed = QtCore.pyqtSignal(object)  # ImportReport
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, path, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.path = path
+
+    def run(self):
+        try:
+            self.completed.emit(import_waypoints(self.path))
+        except Exception as ex:
+            self.failed.emit(f'{self.path}: {ex}')
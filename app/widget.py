@@ -2,24 +2,44 @@
 """
 
 import os
+import sys
+import time
 import numpy as np
-from PyQt5 import QtWidgets, QtGui
+from PyQt5 import QtWidgets, QtGui, QtCore
 from PyQt5.uic import loadUi
-from matplotlib.figure import Figure
-from matplotlib.animation import FuncAnimation
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, \
-    NavigationToolbar2QT as NavigationToolbar
 
+from app.hud import HudTable
+from app.playback import TrajectoryPlayer, MIN_SPEED, MAX_SPEED, draw_hook
+from app.preview import PreviewPipeline
+from app.startup import STARTUP
+from app.track_model import TrackListModel, replace_list_widget
+from app.trajectory_worker import TrajectoryWorker
+from app.waypoints_worker import WaypointsImportWorker
+from robot_solution import instrumentation
+from robot_solution.buffers import RowBuffer
+from robot_solution.segments import create_segment_cache
+from robot_solution.track import Track
+from robot_solution.trajectory_io import write_trajectory
+from robot_solution.trajectory_cache import TrajectoryCache
+from robot_solution.waypoints_io import export_waypoints, default_kind
 from robot_solution.modeling.point import Point
+from robot_solution.modeling.branches import select_track_branches
+from robot_solution.modeling.limits import get_joint_limits
+from robot_solution.modeling.collision import load_obstacles
+from robot_solution.timing import DEFAULT_VELOCITY, DEFAULT_ACCELERATION, DEFAULT_JERK, load_time_limits
+from robot_solution.modeling.columns import SOLVER_STEP, TIME_COLUMN, JOINT_POS_COLUMNS
 from robot_solution.modeling.simulation import find_Trans_JointAngle_joint_pos
 from robot_solution.modeling.transform import myquat2eiler, myeiler2quat
-from robot_solution.trajectory import get_trajectory
+
+MAX_LISTED_COLLISIONS = 20  # collisions listed in the status bar tooltip
 
 
 class AnimationWidget(QtWidgets.QMainWindow):
     """ Class for building an application.
     """
 
+    canvas_ready = QtCore.pyqtSignal()  # the deferred plot canvas is built
+
     def __init__(self):
         QtWidgets.QMainWindow.__init__(self)
 
@@ -44,18 +64,87 @@ class AnimationWidget(QtWidgets.QMainWindow):
         # set init params
         self.N_act = 6  # number of actuators
         self.unit_len = 1000  # m -> mm
+        # input point coordinates spin boxes
+        self.position_boxes = [getattr(self, f'{axes}_value') for axes in ['x', 'y', 'z']]
+        self.quat_boxes = [getattr(self, f'quat{j + 1}_value') for j in range(4)]
+        self.eiler_boxes = [getattr(self, f'eiler{j + 1}_value') for j in range(3)]
+        self.angle_boxes = [getattr(self, f'angle{j + 1}') for j in range(self.N_act)]
+        self.coord_boxes = self.position_boxes + self.quat_boxes + self.eiler_boxes + self.angle_boxes
+        # current coordinates labels in the order of HUD_FIELDS
+        self.hud_labels = [self.cur_pose, self.cur_quat_value, self.cur_eiler_value]
+        self.hud_labels += [getattr(self, f'cur_angle{j + 1}') for j in range(self.N_act)]
         self.input_point = Point()  # set default point, given by user
         self.set_point_to_widget()
-        self.input_point_updated = True
-        self.track_angles = np.empty((0, 6))
-        self.track_points = []
+        # the widget shows the values of the point, nothing is solved on the startup mode switch
+        self.input_point_updated = False
+        # track points are shown by the virtual list of the track
+        self.track_model = TrackListModel(Track(), parent=self)
+        self.output_points = replace_list_widget(self.output_points, self.track_model)
         self.saved_tracks = []
-        self.add_canvas()
+        # matplotlib and the 3D axes are loaded after the window is shown (add_canvas)
+        self.figure = self.axes = self.canvas = None
         self.state_line = None
+        self.player = None
+        self.trajectory_worker = None
+        self.simulation = None  # computed simulation rows
+        self.hud = None  # current coordinates texts of the simulation rows
+        self.timed_playback = False  # frames are played by the time column (time-optimal trajectory)
+        self.playback_speed = 1.
+        # edited track recomputes only segments with changed waypoints
+        self.segment_cache = create_segment_cache()
+        # per-user directory, the application directory can be read-only
+        self.trajectory_cache = TrajectoryCache()
+        # obstacles of the robot cell, checked with self-collisions by every computed trajectory
+        self.obstacles_path = os.path.join(self.application_path, 'obstacles.json')
+        self.obstacles = None  # loaded by the first check
 
         # add icons
         icons_folder = build_path + 'icons' + os.sep
         self.statusbar.showMessage('Готов к работе')
+        # progress of the trajectory computation
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setMaximumWidth(150)
+        self.progress_bar.setVisible(False)
+        self.statusbar.addPermanentWidget(self.progress_bar)
+        # trajectory is saved to the binary file, CSV files are written on demand
+        self.file_menu = self.menuBar().addMenu('Файл')
+        self.csv_action = self.file_menu.addAction('Сохранять траекторию в CSV')
+        self.csv_action.setCheckable(True)
+        # waypoint lists are imported in background, errors are collected into the report
+        self.import_action = self.file_menu.addAction('Импорт точек...')
+        self.import_action.triggered.connect(self.import_waypoints)
+        self.export_action = self.file_menu.addAction('Экспорт точек...')
+        self.export_action.triggered.connect(self.export_waypoints)
+        # stage timers (robot_solution.instrumentation) with the frame rate and latencies in the status bar
+        self.profile_action = self.file_menu.addAction('Замер производительности')
+        self.profile_action.setCheckable(True)
+        self.profile_action.setChecked(instrumentation.enabled())
+        self.profile_action.toggled.connect(self.enable_profiling)
+        self.profile_dump_action = self.file_menu.addAction('Сохранить замеры...')
+        self.profile_dump_action.triggered.connect(self.dump_profile)
+        self.profile_label = QtWidgets.QLabel()
+        self.statusbar.addPermanentWidget(self.profile_label)
+        self.profile_timer = QtCore.QTimer(self)
+        self.profile_timer.setInterval(500)
+        self.profile_timer.timeout.connect(self.update_profile_label)
+        self.enable_profiling(instrumentation.enabled())
+        self.import_worker = None
+        self.import_report = None  # report of the last import
+        # robot configurations of Cartesian points are chosen for the whole track
+        self.track_menu = self.menuBar().addMenu('Путь')
+        self.branch_action = self.track_menu.addAction('Выбирать конфигурации по минимуму перемещений')
+        self.branch_action.setCheckable(True)
+        self.branch_action.setChecked(True)
+        # joint velocity, acceleration and jerk limits of the time-optimal motion are read from
+        # time_limits.json, without it the typical limits are used (they are not the limits of the robot)
+        self.time_limits_path = os.path.join(self.application_path, 'time_limits.json')
+        self.time_limits = None  # loaded by the first time-optimal computation
+        self.typical_time_limits = False
+        self.time_optimal_action = self.track_menu.addAction('Оптимальное по времени движение')
+        self.time_optimal_action.setCheckable(True)
+        # added and modified points are reached by the straight tool path (robot_solution.modeling.linear)
+        self.linear_action = self.track_menu.addAction('Линейное перемещение')
+        self.linear_action.setCheckable(True)
         self.setWindowIcon(QtGui.QIcon(icons_folder + 'diakont.png'))
         self.play_button.setIcon(QtGui.QIcon(icons_folder + 'play.png'))
         self.pause_button.setIcon(QtGui.QIcon(icons_folder + 'pause.png'))
@@ -89,6 +178,10 @@ class AnimationWidget(QtWidgets.QMainWindow):
         self.cartesian_mode_button.setChecked(True)
         # self.orient_select_box.setCurrentIndex(0)
         self.embed_position_changed_actions()
+        # interactive mode solves input changes off the GUI thread
+        self.preview = PreviewPipeline(parent=self)
+        self.preview.solved.connect(self.show_preview)
+        self.preview.failed.connect(self.on_preview_failed)
 
         # define point track buttons actions
         self.add_point_button.clicked.connect(self.add_point_to_track)
@@ -96,12 +189,16 @@ class AnimationWidget(QtWidgets.QMainWindow):
         self.delete_point_button.clicked.connect(self.delete_point_from_track)
         self.modify_point_button.clicked.connect(self.modify_point)
         self.create_track_button.clicked.connect(self.create_track)
-        self.output_points.currentRowChanged.connect(self.set_point_selected)
+        self.output_points.selectionModel().currentRowChanged.connect(lambda *_: self.set_point_selected())
         # set point track widget init state
-        self.output_points.setCurrentRow(0)
+        self.set_current_row(0)
         self.set_point_selected()
 
     # Internal operations
+    @property
+    def track(self):
+        return self.track_model.track
+
     @property
     def input_point(self):
         return self._input_point
@@ -110,20 +207,40 @@ class AnimationWidget(QtWidgets.QMainWindow):
     def input_point(self, value, plot=False):
         self._input_point = value
 
-    def set_point_to_widget(self):
+    def set_point_to_widget(self, block_signals=False):
         """ Sets all point coordinates to the widget.
+        Value changed signals are not emitted if block_signals is set.
         """
 
+        for spin_box in self.coord_boxes:
+            spin_box.blockSignals(block_signals)
         # update input point coordinates widget
-        for j, coord in enumerate(['x', 'y', 'z']):
-            eval(f'self.{coord}_value.setValue(self.input_point.pose[{j}] * self.unit_len)')
-        for j in range(4):
-            eval(f'self.quat{j + 1}_value.setValue(self.input_point.pose[{3 + j}])')
-        eiler = myquat2eiler(self.input_point.pose[3:])
-        for j in range(3):
-            eval(f'self.eiler{j + 1}_value.setValue(eiler[{j}])')
-        for j in range(6):
-            eval(f'self.angle{j + 1}.setValue(self.input_point.angles[{j}])')
+        pose = self.input_point.pose
+        for spin_box, value in zip(self.position_boxes, pose[:3] * self.unit_len):
+            spin_box.setValue(value)
+        for spin_box, value in zip(self.quat_boxes, pose[3:]):
+            spin_box.setValue(value)
+        for spin_box, value in zip(self.eiler_boxes, myquat2eiler(pose[3:])):
+            spin_box.setValue(value)
+        for spin_box, value in zip(self.angle_boxes, self.input_point.angles):
+            spin_box.setValue(value)
+        for spin_box in self.coord_boxes:
+            spin_box.blockSignals(False)
+
+    def read_point_state(self):
+        """ Reads input point values from the widget.
+        Returns ('pose', [7]) in Cartesian mode or ('angles', [6]) in joint mode.
+        """
+
+        if self.coord_widget.currentIndex() == 0:
+            pose = np.empty(7)
+            pose[:3] = [spin_box.value() / self.unit_len for spin_box in self.position_boxes]
+            if self.orient_select_box.currentIndex() == 1:
+                pose[3:] = myeiler2quat(np.array([spin_box.value() for spin_box in self.eiler_boxes]))
+            else:
+                pose[3:] = [spin_box.value() for spin_box in self.quat_boxes]
+            return 'pose', pose
+        return 'angles', np.array([spin_box.value() for spin_box in self.angle_boxes])
 
     def get_point_from_widget(self):
         """ Gets current input point coordinates and counts all others.
@@ -131,66 +248,89 @@ class AnimationWidget(QtWidgets.QMainWindow):
 
         try:
             point = self.input_point
-            if self.coord_widget.currentIndex() == 0:
-                pose = np.empty(7)
-                for j, axes in enumerate(['x', 'y', 'z']):
-                    pose[j] = eval(f'self.{axes}_value.value() / self.unit_len')
-                if self.orient_select_box.currentIndex() == 1:
-                    eiler = np.empty(3)
-                    for j in range(3):
-                        eiler[j] = eval(f'self.eiler{j + 1}_value.value()')
-                    quat = myeiler2quat(eiler)
-                else:
-                    quat = np.empty(4)
-                    for j in range(4):
-                        quat[j] = eval(f'self.quat{j + 1}_value.value()')
-                pose[3:] = quat
-                point.pose = pose
+            kind, value = self.read_point_state()
+            if kind == 'pose':
+                result = point.try_solve_forward(value)
+                if not result.solved:
+                    self.show_unreachable(result.pose)
             else:
-                angles = np.empty(6)
-                for j in range(6):
-                    angles[j] = eval(f'self.angle{j + 1}.value()')
-                point.angles = angles
+                point.angles = value
             self.input_point = point
             self.set_point_to_widget()
         except Exception as excep:
             print('get_point_from_widget:', excep)
 
+    def show_unreachable(self, pose):
+        """ Shows error dialog of the unreachable pose.
+        """
+
+        pose = np.hstack((pose[:3] * self.unit_len, pose[3:]))
+        error_dialog = QtWidgets.QMessageBox(self)
+        error_dialog.setWindowTitle("Ошибка")
+        error_dialog.setText(f"Точка ({', '.join(list(map(str, pose)))}) недостижима!")
+        error_dialog.setIcon(QtWidgets.QMessageBox.Warning)
+        error_dialog.exec_()
+
     def position_changed_action(self):
         """ Function embedded to the user input point change event.
         """
 
         if self.interactive_checkBox.isChecked():
-            self.get_point_from_widget()
-            self.plot_state()
+            self.preview.request(self.read_point_state())
         self.input_point_updated = True
 
-    @staticmethod
-    def embed_position_changed_actions():
+    def show_preview(self, result):
+        """ Shows the latest solved input point of the interactive mode: the robot on the plot and the solved
+        coordinates in the status bar. The input boxes are not changed, newer values may be being entered.
+        """
+
+        if result is None:
+            self.statusbar.showMessage('Точка недостижима')
+            return
+        point, joint_pos = result
+        if point.given_by_pose:
+            self.statusbar.showMessage('Углы осей: ' + ', '.join(f'{angle:.2f}' for angle in point.angles))
+        else:
+            x, y, z = point.pose[:3] * self.unit_len
+            self.statusbar.showMessage(f'Положение: {x:.2f}, {y:.2f}, {z:.2f}')
+        self.plot_state(joint_pos)
+
+    def on_preview_failed(self, message):
+        """ Reports the error of the interactive mode solution.
+        """
+
+        print('show_preview:', message)
+        self.statusbar.showMessage('Ошибка расчета точки')
+
+    def embed_position_changed_actions(self):
         """ Sets actions for widget input point coordinates changing events.
         """
 
-        coord_names = [f'{axes}_value' for axes in ['x', 'y', 'z']]
-        coord_names += [f'quat{j + 1}_value' for j in range(4)]
-        coord_names += [f'eiler{j + 1}_value' for j in range(3)]
-        coord_names += [f'angle{j + 1}' for j in range(6)]
-        for name in coord_names:
-            # eval(f'self.{name}.editingFinished.connect(self.position_changed_action)')
-            eval(f'self.{name}.valueChanged.connect(self.position_changed_action)')
+        for spin_box in self.coord_boxes:
+            spin_box.valueChanged.connect(self.position_changed_action)
 
     def set_point_selected(self):
         """ Sets selected by user point coordinates to corresponding spin boxes.
         """
 
-        cur_row = self.output_points.currentRow()
-        if cur_row == self.output_points.count() - 1:
+        cur_row = self.current_row()
+        if cur_row < 0 or cur_row == len(self.track):
             self.point_action_widget.setCurrentWidget(self.add_point_widget)
             self.input_point = Point()
         else:
             self.point_action_widget.setCurrentWidget(self.modify_point_widget)
-            self.input_point = self.track_points[cur_row]
+            self.input_point = self.track.point(cur_row)
         self.set_point_to_widget()
 
+    def current_row(self):
+        """ Row of the selected item of the points list, the last row is the "add point" item.
+        """
+
+        return self.output_points.currentIndex().row()
+
+    def set_current_row(self, row):
+        self.output_points.setCurrentIndex(self.track_model.index(row))
+
     # Interactive actionsMO
     def select_cartesian_mode(self, enabled):
         """Sets Cartesian position by given joint angles.
@@ -237,14 +377,8 @@ class AnimationWidget(QtWidgets.QMainWindow):
         """
 
         self.get_point_from_widget()
-        self.track_angles = np.vstack((self.track_angles, self.input_point.angles))
-        self.track_points.append(self.input_point)
-        # add point to track widget
-        num_items = self.output_points.count()
-        item = QtWidgets.QListWidgetItem()
-        last_num = int(self.output_points.item(num_items - 2).text().split()[-1]) if num_items > 1 else 0
-        item.setText(f"точка {last_num + 1}")
-        self.output_points.insertItem(num_items - 1, item)
+        self.track_model.append(self.input_point, self.linear_action.isChecked())
+        self.set_current_row(len(self.track))
         self.set_point_selected()  # update values
         self.play_button.setEnabled(True)
         self.statusbar.showMessage('Точка добавлена')
@@ -254,34 +388,25 @@ class AnimationWidget(QtWidgets.QMainWindow):
         """
 
         self.get_point_from_widget()
-        cur_row = self.output_points.currentRow()
+        cur_row = self.current_row()
         if self.input_point.solved:
-            self.track_points[cur_row] = self.input_point
-            self.track_angles[cur_row, :] = self.input_point.angles
+            self.track_model.replace(cur_row, self.input_point, self.linear_action.isChecked())
             # set "add point" as current item
-            self.output_points.setCurrentRow(self.output_points.count() - 1)
+            self.set_current_row(len(self.track))
         self.statusbar.showMessage('Точка изменена')
 
     def delete_point_from_track(self):
-        cur_row = self.output_points.currentRow()
-        # delete point from track
-        self.track_angles = np.delete(self.track_angles, cur_row, 0)
-        del self.track_points[cur_row]
-        # set "add point" item as selected
-        self.output_points.setCurrentRow(self.output_points.count() - 1)
-        # delete selected item and select the "add point" item
-        self.output_points.takeItem(cur_row)
-        if self.track_angles.shape[0] == 0:
+        cur_row = self.current_row()
+        # delete point from track and select the "add point" item
+        self.track_model.delete(cur_row)
+        self.set_current_row(len(self.track))
+        if len(self.track) == 0:
             self.play_button.setEnabled(False)
         self.statusbar.showMessage('Точка удалена')
 
     def clear_track(self):
-        self.track_angles = np.empty((0, 6))
-        self.track_points = []
-        # clear output_points widget
-        for step in range(self.output_points.count() - 1):
-            self.output_points.takeItem(0)
-        self.output_points.setCurrentRow(0)
+        self.track_model.set_track(Track())
+        self.set_current_row(0)
         self.play_button.setEnabled(False)
         self.statusbar.showMessage('Путь удалён')
 
@@ -289,7 +414,7 @@ class AnimationWidget(QtWidgets.QMainWindow):
         """ Creates track by points added by user.
         """
 
-        self.saved_tracks.append(self.track_angles)
+        self.saved_tracks.append(self.track.snapshot())
         # add track to track list
         num_items = self.track_list.count()
         item = QtWidgets.QListWidgetItem()
@@ -297,34 +422,318 @@ class AnimationWidget(QtWidgets.QMainWindow):
         self.track_list.insertItem(num_items, item)
         self.statusbar.showMessage('Путь создан')
 
+    def import_waypoints(self):
+        """ Starts import of the waypoints file chosen by user.
+        """
+
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Импорт точек', self.application_path,
+                                                        'Точки (*.csv *.rtraj)')
+        if not path or self.import_worker is not None:
+            return
+        self.import_worker = WaypointsImportWorker(path, parent=self)
+        self.import_worker.completed.connect(self.on_waypoints_imported)
+        self.import_worker.failed.connect(self.on_waypoints_import_failed)
+        self.import_worker.finished.connect(self.import_worker.deleteLater)
+        self.import_action.setEnabled(False)
+        self.statusbar.showMessage('Импорт точек...')
+        self.import_worker.start()
+
+    def on_waypoints_imported(self, report):
+        """ Replaces the track by the imported waypoints, errors of the rows are shown in the report dialog.
+        """
+
+        self.import_worker = None
+        self.import_action.setEnabled(True)
+        self.import_report = report
+        if report.errors or report.warnings:
+            self.show_import_report(report)
+        if len(report.track):
+            self.track_model.set_track(report.track)
+            self.set_current_row(len(self.track))
+            self.set_point_selected()
+            self.play_button.setEnabled(True)
+        self.statusbar.showMessage(f'Импортировано точек: {len(report.track)} из {report.n_rows}, '
+                                   f'ошибок: {len(report.errors)}')
+
+    def on_waypoints_import_failed(self, message):
+        self.import_worker = None
+        self.import_action.setEnabled(True)
+        self.statusbar.showMessage('Ошибка импорта точек')
+        QtWidgets.QMessageBox.critical(self, 'Ошибка импорта точек', message)
+
+    def show_import_report(self, report):
+        """ Shows the numbers of imported points and errors, messages of the rows are in the details.
+        """
+
+        dialog = QtWidgets.QMessageBox(self)
+        dialog.setWindowTitle('Импорт точек')
+        dialog.setText(f'Импортировано точек: {len(report.track)} из {report.n_rows}\n'
+                       f'Ошибок: {len(report.errors)}, предупреждений: {len(report.warnings)}')
+        dialog.setDetailedText('\n'.join(report.lines()))
+        dialog.setIcon(QtWidgets.QMessageBox.Warning if report.errors else QtWidgets.QMessageBox.Information)
+        dialog.exec_()
+
+    def export_waypoints(self):
+        """ Exports the track waypoints: by poses if all points are given by Cartesian coordinates.
+        """
+
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Экспорт точек', self.application_path,
+                                                        'CSV (*.csv);;Бинарный файл (*.rtraj)')
+        if not path:
+            return
+        try:
+            export_waypoints(path, self.track, default_kind(self.track))
+        except OSError as ex:
+            print('export_waypoints:', ex)
+            self.statusbar.showMessage('Ошибка экспорта точек')
+            return
+        self.statusbar.showMessage(f'Экспортировано точек: {len(self.track)}')
+
+    def enable_profiling(self, enabled):
+        instrumentation.enable(enabled)
+        self.profile_label.setVisible(enabled)
+        self._profile_frames = (instrumentation.stage_count('render.frame'), time.perf_counter())
+        if enabled:
+            self.profile_timer.start()
+        else:
+            self.profile_timer.stop()
+
+    def update_profile_label(self):
+        """ Shows the frame rate, median frame time and median forward solution time of the last ones.
+        """
+
+        frames, moment = instrumentation.stage_count('render.frame'), time.perf_counter()
+        fps = (frames - self._profile_frames[0]) / (moment - self._profile_frames[1])
+        self._profile_frames = (frames, moment)
+        frame_ms, forward_ms = [1e3 * np.median(instrumentation.recent(stage, 100)) if
+                                instrumentation.stage_count(stage) else 0. for stage in
+                                ['render.frame', 'kinematics.forward']]
+        self.profile_label.setText(f'FPS {fps:.0f} | кадр {frame_ms:.1f} мс | ОЗК {forward_ms:.1f} мс')
+
+    def dump_profile(self):
+        """ Saves the stage percentiles to the JSON file chosen by user.
+        """
+
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Сохранить замеры', self.application_path, 'JSON (*.json)')
+        if not path:
+            return
+        try:
+            instrumentation.dump(path)
+        except OSError as ex:
+            print('dump_profile:', ex)
+            self.statusbar.showMessage('Ошибка сохранения замеров')
+
+    def select_track_branches(self):
+        """ Joint angles of the track points to compute the trajectory by: the solutions within the joint limits
+        with the minimal joint travel for the points given by Cartesian coordinates. Points given by joint angles
+        are kept. The track itself is not changed, its angles are returned if the solutions are not found.
+        """
+
+        if len(self.track) < 2:
+            return self.track.angles
+        fixed_angles = np.where(self.track.given_by_pose[:, None], np.nan, self.track.angles)
+        try:
+            with instrumentation.measure('track.branches'):
+                return select_track_branches(self.track.poses, fixed_angles, limits=get_joint_limits())
+        except ValueError as ex:
+            print('select_track_branches:', ex)
+            self.statusbar.showMessage('Конфигурации точек в пределах осей не найдены, используются заданные')
+            return self.track.angles
+
     def on_start(self):
         """ Starts animation.
         """
 
         self.statusbar.showMessage('Подсчет траектории...')
+        self.stop_playback()
+        self.add_canvas()
         self.clear_axes()
-        self.uxSim = get_trajectory(self.track_angles, save=self.save_to_file.isChecked(),
-                                    fileIn=self.application_path + os.sep + 'traj_in.csv',
-                                    fileOut=self.application_path + os.sep + 'traj_out.csv')
-        self.create_plot_lines()
-        # SolverStep = 0.01 s = 10 ms: interval = 10
-        self.ani = FuncAnimation(
-            self.canvas.figure, self.update_line, repeat=False,
-            frames=self.points.shape[0], blit=False, interval=10)
+        self.simulation = None
         # set buttons statuses
         self.play_button.setEnabled(False)
         self.pause_button.setEnabled(True)
         self.stop_button.setEnabled(True)
-        # update figure
-        self.figure.canvas.draw()
-        self.figure.canvas.flush_events()
-        self.statusbar.showMessage('Анимация запущена')
+        angles = self.select_track_branches() if self.branch_action.isChecked() else self.track.angles
+        time_limits = self.get_time_limits() if self.time_optimal_action.isChecked() else None
+        self.timed_playback = time_limits is not None
+        linear = self.track.linear
+        # linear moves are timed by the joint limits in the solver mode too
+        linear_time_limits = self.get_time_limits() if linear.any() else None
+        # saving to CSV files requires computation of the whole track by the solver
+        save_csv = self.save_to_file.isChecked() and self.csv_action.isChecked() and time_limits is None \
+            and not linear.any()
+        if time_limits is not None:
+            settings = TrajectoryWorker.time_optimal_settings(time_limits, linear)
+        else:
+            settings = TrajectoryWorker.segments_settings(linear, linear_time_limits)
+        uxSim = None
+        if not save_csv:
+            try:
+                uxSim = self.trajectory_cache.get(angles, settings)
+            except OSError as ex:
+                print('on_start:', ex)
+            instrumentation.count('trajectory_cache.miss' if uxSim is None else 'trajectory_cache.hit')
+        # trajectory is computed (or only checked for collisions if cached) in background,
+        # animation starts by its first chunk
+        self.trajectory_worker = TrajectoryWorker(
+            angles, save=save_csv,
+            file_in=self.application_path + os.sep + 'traj_in.csv',
+            file_out=self.application_path + os.sep + 'traj_out.csv', segment_cache=self.segment_cache,
+            time_limits=time_limits, poses=self.track.poses, linear=linear, rows=uxSim,
+            obstacles=self.get_obstacles(), linear_time_limits=linear_time_limits, parent=self)
+        self.trajectory_worker.chunk_ready.connect(self.add_trajectory_chunk)
+        self.trajectory_worker.completed.connect(self.on_trajectory_computed)
+        self.trajectory_worker.failed.connect(self.on_trajectory_failed)
+        self.trajectory_worker.finished.connect(self.trajectory_worker.deleteLater)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.trajectory_worker.start()
+
+    def add_trajectory_chunk(self, rows, done, total):
+        """ Adds chunk of the computed trajectory.
+        """
+
+        if self.sender() is self.trajectory_worker:  # not a chunk of the cancelled computation
+            self.add_trajectory_rows(rows, done, total)
+
+    def add_trajectory_rows(self, rows, done, total):
+        """ Adds simulation rows to animation, starts it by the first chunk.
+        """
+
+        if self.simulation is None:
+            self.simulation = RowBuffer(rows.shape[1:], capacity=rows.shape[0] * total)
+            self.hud = HudTable(capacity=rows.shape[0] * total)
+            self.simulation.append(rows)
+            self.hud.append(rows)
+            self.uxSim = self.simulation.data
+            self.create_plot_lines()
+            self.player.start()
+            self.statusbar.showMessage('Анимация запущена')
+        else:
+            self.simulation.append(rows)
+            self.hud.append(rows)
+            self.uxSim = self.simulation.data
+            self.player.append(*self.joint_lines_data(rows), rows[:, TIME_COLUMN] if self.timed_playback else None)
+            self.update_seek_slider()
+        self.progress_bar.setValue(int(100 * done / total))
+
+    def on_trajectory_computed(self):
+        """ Marks animation data as complete when the whole trajectory is computed.
+        """
+
+        worker = self.sender()
+        if worker is self.trajectory_worker:
+            self.trajectory_worker = None
+            self.progress_bar.setVisible(False)
+            self.player.set_complete()
+            if worker.rows is None:
+                try:
+                    self.trajectory_cache.put(worker.track, self.uxSim, worker.settings)
+                except OSError as ex:
+                    print('on_trajectory_computed:', ex)
+            self.save_trajectory()
+            self.show_cycle_time()
+            self.show_collisions(worker.collisions)
+
+    def show_cycle_time(self):
+        """ Shows duration of the computed trajectory.
+        """
+
+        if self.time_optimal_action.isChecked():
+            duration = self.uxSim[-1, TIME_COLUMN]
+        else:
+            duration = (self.uxSim.shape[0] - 1) * SOLVER_STEP
+        if self.time_optimal_action.isChecked() and self.typical_time_limits:
+            self.statusbar.showMessage(f'Время цикла: {duration:.2f} с (типовые ограничения приводов, '
+                                       f'не ограничения робота: задайте их в time_limits.json)')
+        else:
+            self.statusbar.showMessage(f'Время цикла: {duration:.2f} с')
+
+    def get_time_limits(self):
+        """ Joint limits of the time-optimal motion from time_limits.json or the typical ones.
+        """
+
+        if self.time_limits is None:
+            self.time_limits = (DEFAULT_VELOCITY, DEFAULT_ACCELERATION, DEFAULT_JERK)
+            self.typical_time_limits = True
+            if os.path.exists(self.time_limits_path):
+                try:
+                    self.time_limits = load_time_limits(self.time_limits_path)
+                    self.typical_time_limits = False
+                except (OSError, ValueError, KeyError) as ex:
+                    print('get_time_limits:', ex)
+        return self.time_limits
+
+    def get_obstacles(self):
+        """ Obstacles of the robot cell from obstacles.json, none without the file.
+        """
+
+        if self.obstacles is None:
+            self.obstacles = []
+            if os.path.exists(self.obstacles_path):
+                try:
+                    self.obstacles = load_obstacles(self.obstacles_path)
+                except (OSError, ValueError, KeyError) as ex:
+                    print('get_obstacles:', ex)
+                    self.statusbar.showMessage('Ошибка чтения obstacles.json')
+        return self.obstacles
+
+    def show_collisions(self, collisions):
+        """ Shows the first collision of the computed trajectory in the status bar and all of them in its tooltip.
+        """
+
+        if not collisions:
+            self.statusbar.setToolTip('')
+            return
+        texts = []
+        for collision in collisions:
+            other = f'звено {collision.other + 1}' if isinstance(collision.other, int) else collision.other
+            texts.append(f'кадры {collision.first_frame}-{collision.last_frame}: звено {collision.link + 1} и {other}')
+        self.statusbar.showMessage(f'Столкновение: {texts[0]} (всего {len(collisions)}, список в подсказке)')
+        self.statusbar.setToolTip('\n'.join(texts[:MAX_LISTED_COLLISIONS]))
+
+    def save_trajectory(self):
+        """ Saves the computed trajectory to the binary file if saving is on.
+        """
+
+        if not self.save_to_file.isChecked():
+            return
+        try:
+            write_trajectory(os.path.join(self.application_path, 'traj_out.rtraj'), self.uxSim)
+        except OSError as ex:
+            print('save_trajectory:', ex)
+            self.statusbar.showMessage('Ошибка сохранения траектории')
+
+    def on_trajectory_failed(self, message):
+        """ Reports the trajectory computation error.
+        """
+
+        if self.sender() is self.trajectory_worker:
+            self.trajectory_worker = None
+            print('on_start:', message)
+            self.on_stop()
+            self.statusbar.showMessage('Ошибка подсчета траектории')
+
+    def stop_playback(self):
+        """ Cancels trajectory computation and stops animation.
+        """
+
+        if self.trajectory_worker is not None:
+            self.trajectory_worker.cancel()
+            self.trajectory_worker = None
+        if self.player is not None:
+            self.player.stop()
+            self.player = None
+        if self.figure is not None:
+            self.update_seek_slider()
+        self.progress_bar.setVisible(False)
 
     def on_pause(self):
         """ Pauses animation.
         """
 
-        self.ani.pause()
+        if self.player is not None:
+            self.player.pause()
         self.pause_button.setEnabled(False)
         self.resume_button.setEnabled(True)
         self.statusbar.showMessage('Анимация остановлена')
@@ -333,7 +742,8 @@ class AnimationWidget(QtWidgets.QMainWindow):
         """ Resumes animation.
         """
 
-        self.ani.resume()
+        if self.player is not None:
+            self.player.resume()
         self.pause_button.setEnabled(True)
         self.resume_button.setEnabled(False)
         self.statusbar.showMessage('Анимация возобновлена')
@@ -342,7 +752,7 @@ class AnimationWidget(QtWidgets.QMainWindow):
         """ Stops animation and clears plot window.
         """
 
-        self.ani.event_source.stop()
+        self.stop_playback()
         self.clear_axes()
         self.state_line = []
         self.play_button.setEnabled(True)
@@ -352,12 +762,38 @@ class AnimationWidget(QtWidgets.QMainWindow):
         self.set_undefined_current_position()
         self.statusbar.showMessage('Готов к работе')
 
+    def closeEvent(self, event):
+        """ Stops background workers on closing the window.
+        """
+
+        self.preview.shutdown()
+        for worker in self.findChildren(TrajectoryWorker):
+            worker.cancel()
+            worker.wait()
+        for worker in self.findChildren(WaypointsImportWorker):
+            worker.wait()
+        QtWidgets.QMainWindow.closeEvent(self, event)
+
     ''' Functions for animation '''
 
+    def showEvent(self, event):
+        """ Builds the plot canvas by the first event loop iteration after the window is shown.
+        """
+
+        QtWidgets.QMainWindow.showEvent(self, event)
+        if self.figure is None:
+            QtCore.QTimer.singleShot(0, self.add_canvas)
+
     def add_canvas(self):
-        """ Builds window for plots.
+        """ Builds window for plots (once, on the first use or after the window is shown).
         """
 
+        if self.figure is not None:
+            return
+        STARTUP.mark('shown')
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, \
+            NavigationToolbar2QT as NavigationToolbar
         self.figure = Figure(facecolor=(200 / 255, 228 / 255, 255 / 255), tight_layout=True, frameon=False)
         self.axes = self.figure.add_subplot(111, projection='3d', facecolor=(231 / 255, 239 / 255, 249 / 255))
         self.axes.set_xlabel('x')
@@ -366,13 +802,77 @@ class AnimationWidget(QtWidgets.QMainWindow):
         self.clear_axes()
         # add to widget
         self.canvas = FigureCanvas(self.figure)
+        # complete redraws (start, resize, view rotation) are timed from the first drawn artist to draw_event
+        self._draw_started = None
+        self.figure.add_artist(draw_hook(self.on_draw_started, zorder=-1))
+        self.canvas.mpl_connect('draw_event', self.on_draw_finished)
         self.mplvl.addWidget(NavigationToolbar(self.canvas, self))
         self.mplvl.addWidget(self.canvas)
+        self.add_playback_controls()
+        STARTUP.mark('canvas')
+        self.canvas_ready.emit()
 
+    def on_draw_started(self):
+        self._draw_started = time.perf_counter() if instrumentation.enabled() else None
+
+    def on_draw_finished(self, event):
+        if self._draw_started is not None:
+            instrumentation.record('render.draw', time.perf_counter() - self._draw_started)
+            self._draw_started = None
+
+    def add_playback_controls(self):
+        """ Adds the slider of the current frame and the playback speed box under the plot.
+        """
+
+        layout = QtWidgets.QHBoxLayout()
+        self.speed_box = QtWidgets.QComboBox()
+        speeds = [speed for speed in [0.1, 0.25, 0.5, 1, 2, 5, 10] if MIN_SPEED <= speed <= MAX_SPEED]
+        for speed in speeds:
+            self.speed_box.addItem(f'{speed:g}×', speed)
+        self.speed_box.setCurrentIndex(speeds.index(1))
+        self.speed_box.currentIndexChanged.connect(lambda: self.set_playback_speed(self.speed_box.currentData()))
+        self.seek_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.seek_slider.setEnabled(False)
+        self.seek_slider.valueChanged.connect(self.seek_frame)
+        layout.addWidget(QtWidgets.QLabel('Скорость'))
+        layout.addWidget(self.speed_box)
+        layout.addWidget(self.seek_slider)
+        self.mplvl.addLayout(layout)
+
+    def set_playback_speed(self, speed):
+        self.playback_speed = speed
+        if self.player is not None:
+            self.player.set_speed(speed)
+
+    def seek_frame(self, ind):
+        """ Shows the frame chosen by the slider, paused playback stays paused.
+        """
+
+        if self.player is None:
+            return
+        self.player.seek(ind)
+        if not self.player.running and not self.player.finished:
+            self.pause_button.setEnabled(False)
+            self.resume_button.setEnabled(True)
+            self.stop_button.setEnabled(True)
+
+    def update_seek_slider(self):
+        """ Sets the slider range to the computed frames and its position to the current one.
+        """
+
+        self.seek_slider.blockSignals(True)
+        self.seek_slider.setEnabled(self.player is not None)
+        self.seek_slider.setMaximum(0 if self.player is None else self.player.n_frames - 1)
+        self.seek_slider.setValue(0 if self.player is None else self.player.ind)
+        self.seek_slider.blockSignals(False)
+
+    @instrumentation.timed('render.clear')
     def clear_axes(self):
         """ Clears plot window and resets axes.
         """
 
+        if self.axes is None:
+            return
         self.axes.clear()
         # TODO: set real bounds of robot space
         xlim = (-1.7 * self.unit_len, 1.7 * self.unit_len)
@@ -384,13 +884,17 @@ class AnimationWidget(QtWidgets.QMainWindow):
         self.figure.canvas.draw()
         self.figure.canvas.flush_events()
 
-    def plot_state(self):
+    @instrumentation.timed('render.state')
+    def plot_state(self, joint_pos=None):
         """ Plots interactive robot position by changing coordinates.
+        Joint positions [3 x 7] are counted by the input point if not given.
         """
 
         try:
-            initial = np.hstack((self.input_point.angles, 0 * self.input_point.angles))
-            _, _, joint_pos = find_Trans_JointAngle_joint_pos(initial)
+            self.add_canvas()
+            if joint_pos is None:
+                initial = np.hstack((self.input_point.angles, 0 * self.input_point.angles))
+                _, _, joint_pos = find_Trans_JointAngle_joint_pos(initial)
             joint_pos = np.hstack((np.zeros((3, 1)), joint_pos * self.unit_len))
             x, y, z = joint_pos
             if not self.state_line:
@@ -398,8 +902,7 @@ class AnimationWidget(QtWidgets.QMainWindow):
                 self.state_line, = self.axes.plot(x, y, z, lw=2, c='#a63f41', marker='.', markersize=8)
             self.state_line.set_data(np.vstack((x, y)))
             self.state_line.set_3d_properties(z)
-            self.figure.canvas.draw()
-            self.figure.canvas.flush_events()
+            self.figure.canvas.draw_idle()
         except Exception as ex:
             # Here could be Exception "maximum recursion depth exceeded in comparison. It requires just do nothing."
             pass
@@ -408,55 +911,44 @@ class AnimationWidget(QtWidgets.QMainWindow):
         """ Creates base plot objects.
         """
 
-        # add a zero point of the center of absolute system
-        self.points = np.hstack((np.zeros((self.uxSim.shape[0], 3)), self.uxSim[:, 43:64])) * self.unit_len
-        self.N = self.points.shape[1] // 3
-        # self.points = self.uxSim[:, 43:63] * self.unit_len
-        self.x, self.y, self.z = [
-            self.points[:, [i * 3 + j for i in range(self.N)]] for j in [0, 1, 2]]
-        # create current robot line
-        self.line, = self.axes.plot(
-            self.x[0, :], self.y[0, :], self.z[0, :], lw=2, c='g', marker='.',
-            markersize=8, label='Текущее положение')
-        # create init robot line
-        self.line_init, = self.axes.plot(
-            self.x[0, :], self.y[0, :], self.z[0, :], lw=2, c='b', marker='.',
-            markersize=8, label='Исходное положение')
-        # create lines of joints track
-        self.joint_lines = np.empty(self.N, dtype=object)
-        for j in range(self.N):
-            self.joint_lines[j], = self.axes.plot(
-                self.x[0, j], self.y[0, j], self.z[0, j], c='#6b6b6b', lw=0.5)
+        self.x, self.y, self.z = self.joint_lines_data(self.uxSim)
+        self.N = self.x.shape[1]
+        # create robot lines and lines of joints track
+        # SolverStep = 0.01 s = 10 ms: interval = 10
+        times = self.uxSim[:, TIME_COLUMN] if self.timed_playback else None
+        self.player = TrajectoryPlayer(self.axes, self.x, self.y, self.z, interval=10,
+                                       on_frame=self.update_current_position, complete=False, times=times,
+                                       frame_step=SOLVER_STEP, speed=self.playback_speed)
+        self.update_seek_slider()
         self.axes.legend(loc='upper right', fontsize=8)
 
-    def update_line(self, ind):
-        """ Updates lines while animation.
-        """
-
-        self.ani_ind = ind
-        # update robot position
-        self.line.set_data(np.vstack((self.x[ind, :], self.y[ind, :])))
-        self.line.set_3d_properties(self.z[ind, :])
-        # update joint lines
-        for j in range(self.N):
-            self.joint_lines[j].set_data(np.vstack((self.x[:ind + 1, j], self.y[:ind + 1, j])))
-            self.joint_lines[j].set_3d_properties(self.z[:ind + 1, j])
-        # show current x, y, z
-        to_str = lambda el: f"{el :.2f}".center(8)
-        self.cur_pose.setText(''.join(map(to_str, self.uxSim[ind, 61:64])))
-        self.cur_quat_value.setText(' '.join(map(to_str, self.uxSim[ind, 64: 68])))
-        # self.cur_eiler_value.setText(text) #TODO
-        for j in range(self.N_act):
-            eval(f'self.cur_angle{j + 1}.setText(str({self.uxSim[ind, 37 + j] :.2f}))')
+    def joint_lines_data(self, rows):
+        """ Returns x, y, z coordinates [n x 8] of the robot line points by simulation rows.
+        """
+
+        # add a zero point of the center of absolute system
+        points = np.hstack((np.zeros((rows.shape[0], 3)), rows[:, JOINT_POS_COLUMNS])) * self.unit_len
+        n_points = points.shape[1] // 3
+        return [points[:, [i * 3 + j for i in range(n_points)]] for j in [0, 1, 2]]
+
+    def update_current_position(self, ind):
+        """ Updates current coordinates while animation.
+        """
+
+        # show current x, y, z, orientation and joint angles
+        for label, text in zip(self.hud_labels, self.hud.frame(ind)):
+            label.setText(text)
+        self.seek_slider.blockSignals(True)
+        self.seek_slider.setValue(ind)
+        self.seek_slider.blockSignals(False)
         # actiond after animation stops
-        if ind == self.uxSim.shape[0] - 1:
+        if self.player.finished:
             self.play_button.setEnabled(True)
             self.pause_button.setEnabled(False)
             self.resume_button.setEnabled(False)
             self.stop_button.setEnabled(True)
             self.state_line = []
             self.statusbar.showMessage('Готов к работе')
-        return [self.line]
 
     def set_undefined_current_position(self):
         """ Sets undefined values of current coordinates.
@@ -464,6 +956,6 @@ class AnimationWidget(QtWidgets.QMainWindow):
 
         self.cur_pose.setText('Не определено')
         self.cur_quat_value.setText('Не определено')
-        self.cur_eiler_value.setText('Не определено')  # TODO
-        for j in range(self.N_act):
-            eval(f"self.cur_angle{j + 1}.setText('-')")
+        self.cur_eiler_value.setText('Не определено')
+        for label in self.hud_labels[3:]:
+            label.setText('-')
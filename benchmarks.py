@@ -0,0 +1,192 @@
+""" Headless benchmarks of the kinematics and trajectory solvers.
+
+Every benchmark is timed several times, a timed sample repeats the call until it lasts
+MIN_SAMPLE_TIME, so short calls are not lost in the timer noise. The best time per call
+is compared with the stored baseline. A slower benchmark is timed once more (a noisy machine
+slows down single benchmarks for a while), the run fails if it is slower by more than the threshold again.
+
+Usage:
+    python benchmarks.py --save-baseline      # store results as the baseline
+    python benchmarks.py                      # compare with the baseline, exit code 1 on regression
+    python benchmarks.py -k forward --threshold 0.3 -o results.json
+The baseline depends on the machine, store it on the machine the benchmarks are run on.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+import numpy as np
+
+from robot_solution.modeling.transform import myquat2rotm, myquat2eiler, myeiler2quat
+from robot_solution.modeling.transform_array import quat2rotm_array, rotm2quat_array
+from robot_solution.modeling.simulation import find_Trans_JointAngle_joint_pos
+from robot_solution.modeling.solution import solve_straight, solve_forward
+from robot_solution.modeling.chain import solve_forward_batch, find_joint_pos_batch
+from robot_solution.trajectory import get_trajectory, generate_random_track
+
+DEFAULT_BASELINE = 'benchmarks_baseline.json'
+DEFAULT_THRESHOLD = 0.3  # allowed relative slowdown
+DEFAULT_REPEAT = 9  # number of timed samples
+MIN_SAMPLE_TIME = 0.2  # minimal duration of a timed sample, s
+
+
+def random_x(n):
+    """ Solver inputs [n x 12]: random joint angles (degrees) and zero backlash. """
+    angles = np.random.uniform(-170, 170, (n, 6))
+    return np.hstack((angles, 0 * angles))
+
+
+def random_poses(n):
+    """ Reachable poses [n x 7] of random joint angles. """
+    return np.array([solve_straight(x) for x in random_x(n)])
+
+
+def random_tracks(n):
+    return [generate_random_track() for _ in range(n)]
+
+
+def loop(function):
+    """ Calls the scalar function for every input row. """
+    return lambda inputs: [function(value) for value in inputs]
+
+
+def solve_forward_loop(poses):
+    return [solve_forward(pose[:3], myquat2rotm(pose[3:])) for pose in poses]
+
+
+def get_trajectory_loop(tracks):
+    return [get_trajectory(track) for track in tracks]
+
+
+# name: (inputs generator, benchmarked function, input sizes)
+BENCHMARKS = {
+    'solve_straight': (random_x, loop(solve_straight), [100, 1000]),
+    'solve_forward': (random_poses, solve_forward_loop, [20]),
+    'find_Trans_JointAngle_joint_pos': (random_x, loop(find_Trans_JointAngle_joint_pos), [100, 1000]),
+    'find_joint_pos_batch': (random_x, find_joint_pos_batch, [100, 10000, 100000]),
+    'solve_forward_batch': (random_poses, solve_forward_batch, [100, 1000]),
+    'myquat2rotm': (lambda n: random_poses(n)[:, 3:], loop(myquat2rotm), [1000]),
+    'myquat2eiler': (lambda n: random_poses(n)[:, 3:], loop(myquat2eiler), [1000]),
+    'myeiler2quat': (lambda n: np.random.uniform(-180, 180, (n, 3)), loop(myeiler2quat), [1000]),
+    'quat2rotm_array': (lambda n: random_poses(1000)[np.arange(n) % 1000, 3:], quat2rotm_array, [100000]),
+    'rotm2quat_array': (lambda n: quat2rotm_array(random_poses(1000)[np.arange(n) % 1000, 3:]),
+                        rotm2quat_array, [100000]),
+    'get_trajectory': (random_tracks, get_trajectory_loop, [5]),
+}
+
+
+def calls_per_sample(function, inputs, min_time=MIN_SAMPLE_TIME):
+    """ Number of calls lasting at least min_time (1, 2, 5, 10, 20, ...). """
+    number, factors = 1, (2, 2.5, 2)
+    for k in range(100):
+        start = time.perf_counter()
+        for _ in range(number):
+            function(inputs)
+        if time.perf_counter() - start >= min_time:
+            return number
+        number = int(number * factors[k % 3])
+    return number
+
+
+def time_call(function, inputs, repeat, number=1):
+    """ Returns times per call of the repeated samples of number calls, s. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function(inputs)
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+
+def run_benchmark(name, size, repeat=DEFAULT_REPEAT, seed=0):
+    """ Times the benchmark on the input size. Returns its result. """
+    generate, function, _ = BENCHMARKS[name]
+    np.random.seed(seed)
+    inputs = generate(size)
+    number = calls_per_sample(function, inputs)  # warms up too
+    times = time_call(function, inputs, repeat, number)
+    print(f'{name}[{size}]: best {min(times) * 1e3:.3f} ms, {min(times) / size * 1e6:.2f} us per item', flush=True)
+    return {'name': name, 'size': size, 'best': min(times), 'median': float(np.median(times)),
+            'per_item': min(times) / size, 'repeat': repeat, 'number': number}
+
+
+def run_benchmarks(pattern='', repeat=DEFAULT_REPEAT, seed=0):
+    """ Runs benchmarks with names containing pattern. Returns {'name[size]': result}. """
+    results = {}
+    for name, (_, _, sizes) in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        for size in sizes:
+            results[f'{name}[{size}]'] = run_benchmark(name, size, repeat, seed)
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """ Returns regressions {'name[size]': ratio} of the best times slower than baseline by the threshold. """
+    regressions = {}
+    for key, result in results.items():
+        if key in baseline:
+            ratio = result['best'] / baseline[key]['best']
+            if ratio > 1 + threshold:
+                regressions[key] = ratio
+    return regressions
+
+
+def environment():
+    """ Description of the machine and libraries the results were taken on. """
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'system': platform.platform(),
+            'time': datetime.now().isoformat(timespec='seconds')}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the kinematics and trajectory solvers.')
+    parser.add_argument('-k', dest='pattern', default='', help='run benchmarks with names containing the pattern')
+    parser.add_argument('-o', '--output', default='benchmarks_results.json', help='results file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='store results as the baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed relative slowdown against the baseline')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='number of timed calls')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {'environment': environment(), 'results': run_benchmarks(args.pattern, args.repeat)}
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    except OSError:
+        baseline = None
+    if args.save_baseline:
+        # results of the selected benchmarks replace their baseline, others are kept
+        report['results'] = {**(baseline or {}), **report['results']}
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print('Baseline saved to', args.baseline)
+        return 0
+    if baseline is None:
+        print('No baseline', args.baseline, 'to compare with')
+    report['regressions'] = {} if baseline is None else compare(report['results'], baseline, args.threshold)
+    if report['regressions']:
+        print('Timing the slower benchmarks again')
+        for key in report['regressions']:
+            result = report['results'][key]
+            report['results'][key] = run_benchmark(result['name'], result['size'], args.repeat)
+        report['regressions'] = compare({key: report['results'][key] for key in report['regressions']},
+                                        baseline, args.threshold)
+    report['threshold'] = args.threshold
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    for key, ratio in report['regressions'].items():
+        print(f'REGRESSION {key}: {ratio:.2f}x of baseline')
+    return 1 if report['regressions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+""" Headless batch simulation of many tracks on a process pool.
+
+Tracks are read from files (.npy or text with 6 joint angles per row, degrees) or generated
+randomly. Every track is simulated by get_trajectory in a separate process, its trajectory
+is saved to the binary file and its metrics are collected to results.csv and summary.json.
+
+Usage:
+    python -m robot_solution.batch_run tracks/*.csv -o results
+    python -m robot_solution.batch_run --random 500 --seed 1 -o results -j 16
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from robot_solution.modeling.columns import SOLVER_STEP, ANGLE_COLUMNS, TCP_COLUMNS
+from robot_solution.trajectory import get_trajectory, generate_random_track
+from robot_solution.trajectory_io import write_trajectory, EXTENSION
+
+
+def load_track(path):
+    """ Reads the track [n x 6] of joint angles (degrees) from .npy or a text file. """
+    if path.endswith('.npy'):
+        track = np.load(path)
+    else:
+        track = np.loadtxt(path, delimiter=',' if path.endswith('.csv') else None, ndmin=2)
+    if track.ndim != 2 or track.shape[1] != 6:
+        raise ValueError(f'{path}: track must have 6 joint angles per row, got shape {track.shape}')
+    return track
+
+
+def trajectory_metrics(uxSim, step=SOLVER_STEP):
+    """ Duration, joint travel and peak velocities of the simulation rows. """
+    angles = uxSim[:, ANGLE_COLUMNS]
+    joint_steps = np.abs(np.diff(angles, axis=0))
+    tcp_steps = np.linalg.norm(np.diff(uxSim[:, TCP_COLUMNS], axis=0), axis=1)
+    has_steps = uxSim.shape[0] > 1
+    return {
+        'rows': uxSim.shape[0],
+        'duration': (uxSim.shape[0] - 1) * step,  # s
+        'joint_travel': joint_steps.sum(axis=0).tolist(),  # degrees
+        'peak_velocity': (joint_steps.max(axis=0) / step if has_steps else np.zeros(6)).tolist(),  # degrees/s
+        'tcp_path': float(tcp_steps.sum()),  # m
+        'peak_tcp_velocity': float(tcp_steps.max() / step) if has_steps else 0.,  # m/s
+    }
+
+
+def simulate_track(name, track, output_dir=None):
+    """ Simulates the track (array or file path), saves its trajectory to output_dir (if given)
+    and returns its metrics. Errors are returned in the result, so one bad track does not stop the batch.
+    """
+
+    start = time.perf_counter()
+    result = {'name': name, 'points': None}
+    try:
+        track = load_track(track) if isinstance(track, str) else track
+        result['points'] = len(track)
+        uxSim = get_trajectory(track)
+        result.update(trajectory_metrics(uxSim))
+        if output_dir is not None:
+            write_trajectory(os.path.join(output_dir, name + EXTENSION), uxSim)
+        result['error'] = None
+    except Exception as ex:
+        result['error'] = f'{type(ex).__name__}: {ex}'
+        result['traceback'] = traceback.format_exc()
+    result['solve_time'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(tracks, output_dir=None, workers=None, on_result=None):
+    """ Simulates tracks given as (name, track or file path) pairs on the process pool.
+    on_result(result) is called as soon as a track is done. Returns results in the order of tracks.
+    """
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(simulate_track, name, track, output_dir): name for name, track in tracks}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if on_result is not None:
+                on_result(result)
+    return [results[name] for name, _ in tracks]
+
+
+def summarize(results, wall_time):
+    """ Summary metrics of the batch. """
+    done = [result for result in results if result['error'] is None]
+    summary = {
+        'tracks': len(results),
+        'failed': len(results) - len(done),
+        'wall_time': wall_time,
+        'tracks_per_second': len(results) / wall_time if wall_time else 0.,
+    }
+    if done:
+        summary['total_duration'] = sum(result['duration'] for result in done)
+        summary['max_duration'] = max(result['duration'] for result in done)
+        summary['peak_velocity'] = np.max([result['peak_velocity'] for result in done], axis=0).tolist()
+        summary['joint_travel'] = np.sum([result['joint_travel'] for result in done], axis=0).tolist()
+    return summary
+
+
+def write_results(results, summary, output_dir):
+    """ Writes per-track metrics to results.csv and the summary to summary.json. """
+    with open(os.path.join(output_dir, 'results.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name', 'points', 'rows', 'duration', 'tcp_path', 'peak_tcp_velocity', 'solve_time']
+                        + [f'travel{j + 1}' for j in range(6)] + [f'peak_velocity{j + 1}' for j in range(6)]
+                        + ['error'])
+        for result in results:
+            if result['error'] is None:
+                writer.writerow([result['name'], result['points'], result['rows'], result['duration'],
+                                 result['tcp_path'], result['peak_tcp_velocity'], result['solve_time']]
+                                + result['joint_travel'] + result['peak_velocity'] + [''])
+            else:
+                writer.writerow([result['name'], result['points']] + [''] * 17 + [result['error']])
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as file:
+        json.dump({'summary': summary, 'errors': {result['name']: result['traceback'] for result in results
+                                                  if result['error'] is not None}}, file, indent=2)
+
+
+def collect_tracks(args):
+    """ Returns (name, track or file path) pairs given by the command line arguments,
+    files are read by the workers.
+    """
+
+    tracks = []
+    for path in args.tracks:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if any(name == other for other, _ in tracks):
+            name = f'{name}_{len(tracks)}'
+        tracks.append((name, path))
+    if args.random:
+        np.random.seed(args.seed)
+        tracks += [(f'random_{k:05d}', generate_random_track()) for k in range(args.random)]
+    return tracks
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m robot_solution.batch_run',
+                                     description='Simulates many robot tracks in parallel.')
+    parser.add_argument('tracks', nargs='*', help='track files: .npy or text, 6 joint angles (degrees) per row')
+    parser.add_argument('-n', '--random', type=int, default=0, help='number of random tracks to simulate')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random tracks')
+    parser.add_argument('-o', '--output', default='batch_results', help='output folder')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes (CPU count by default)')
+    parser.add_argument('--no-trajectories', action='store_true', help='save metrics only')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tracks = collect_tracks(args)
+    if not tracks:
+        print('No tracks given: pass track files or --random N', file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+    done = []
+
+    def report(result):
+        done.append(result)
+        status = 'ok' if result['error'] is None else result['error']
+        print(f'[{len(done)}/{len(tracks)}] {result["name"]}: {status}', flush=True)
+
+    start = time.perf_counter()
+    results = run_batch(tracks, None if args.no_trajectories else args.output, args.workers, report)
+    summary = summarize(results, time.perf_counter() - start)
+    write_results(results, summary, args.output)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
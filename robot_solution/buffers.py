@@ -0,0 +1,118 @@
+""" Preallocated array buffers. """
+
+import numpy as np
+
+
+class RowBuffer:
+    """ Array of rows [n x ...] growing with amortized O(1) append.
+    data is a view of the filled rows, it is invalidated by the next append.
+    """
+
+    def __init__(self, row_shape, dtype=float, capacity=1024):
+        self._array = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def data(self):
+        return self._array[:self._size]
+
+    def append(self, rows):
+        """ Appends rows [k x ...], doubles the capacity if needed. """
+        rows = np.asarray(rows)
+        size = self._size + rows.shape[0]
+        if size > self._array.shape[0]:
+            capacity = max(size, 2 * self._array.shape[0])
+            array = np.empty((capacity,) + self._array.shape[1:], dtype=self._array.dtype)
+            array[:self._size] = self._array[:self._size]
+            self._array = array
+        self._array[self._size:size] = rows
+        self._size = size
+
+
+class GapBuffer:
+    """ Array of rows [n x ...] with a gap at the last edit position.
+    Insert and delete near the previous edit (append, editing in place) are amortized O(1),
+    an edit elsewhere moves the rows between the edits.
+    """
+
+    def __init__(self, row_shape, dtype=float, capacity=1024):
+        self._array = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+        self._gap_start = 0
+        self._gap_end = capacity
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Buffer of the copied rows with the gap at the end. """
+        rows = np.asarray(rows)
+        buffer = cls(rows.shape[1:], rows.dtype, capacity=max(2 * rows.shape[0], 16))
+        buffer._array[:rows.shape[0]] = rows
+        buffer._gap_start = rows.shape[0]
+        return buffer
+
+    def __len__(self):
+        return self._array.shape[0] - (self._gap_end - self._gap_start)
+
+    def _position(self, index):
+        """ Position of the row in the array. """
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError(f'row {index} out of {size} rows')
+        return index if index < self._gap_start else index + self._gap_end - self._gap_start
+
+    def _move_gap(self, index):
+        """ Moves the gap to the row index. """
+        if index < self._gap_start:
+            moved = self._gap_start - index
+            self._array[self._gap_end - moved:self._gap_end] = self._array[index:self._gap_start]
+            self._gap_start, self._gap_end = index, self._gap_end - moved
+        elif index > self._gap_start:
+            moved = index - self._gap_start
+            self._array[self._gap_start:index] = self._array[self._gap_end:self._gap_end + moved]
+            self._gap_start, self._gap_end = index, self._gap_end + moved
+
+    def _grow(self):
+        """ Doubles the capacity, the gap is widened. """
+        capacity = max(2 * self._array.shape[0], 16)
+        array = np.empty((capacity,) + self._array.shape[1:], dtype=self._array.dtype)
+        tail = self._array.shape[0] - self._gap_end
+        array[:self._gap_start] = self._array[:self._gap_start]
+        array[capacity - tail:] = self._array[self._gap_end:]
+        self._array, self._gap_end = array, capacity - tail
+
+    def __getitem__(self, index):
+        return self._array[self._position(index)]
+
+    def __setitem__(self, index, row):
+        self._array[self._position(index)] = row
+
+    def insert(self, index, row):
+        if not 0 <= index <= len(self):
+            raise IndexError(f'row {index} out of {len(self)} rows')
+        if self._gap_start == self._gap_end:
+            self._grow()
+        self._move_gap(index)
+        self._array[self._gap_start] = row
+        self._gap_start += 1
+
+    def append(self, row):
+        self.insert(len(self), row)
+
+    def delete(self, index):
+        self._position(index)
+        self._move_gap(index % len(self))
+        self._gap_end += 1
+
+    def clear(self):
+        self._gap_start, self._gap_end = 0, self._array.shape[0]
+
+    @property
+    def data(self):
+        """ Contiguous view of the rows, the gap is moved to the end.
+        The view is invalidated by the next edit. """
+        self._move_gap(len(self))
+        return self._array[:self._gap_start]
@@ -0,0 +1,149 @@
+""" Timers and counters of the application stages.
+
+Stages are timed by the timed decorator or the measure context, counters by count. Nothing is
+recorded until enable() is called (or ROBOT_PROFILE=1 is set): a disabled timer costs one flag check.
+The last MAX_SAMPLES durations of every stage are kept for percentiles, dump writes them to JSON.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+MAX_SAMPLES = 10000  # durations kept per stage
+PERCENTILES = (50, 90, 99)
+
+_enabled = os.environ.get('ROBOT_PROFILE', '') not in ('', '0')
+_lock = threading.Lock()
+_durations = {}  # stage -> deque of the last durations, s
+_totals = {}  # stage -> [count, total time]
+_counters = {}  # name -> value
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _totals.clear()
+        _counters.clear()
+
+
+def record(stage, seconds):
+    """ Adds the duration of the stage. """
+    if not _enabled:
+        return
+    with _lock:
+        if stage not in _durations:
+            _durations[stage] = deque(maxlen=MAX_SAMPLES)
+            _totals[stage] = [0, 0.]
+        _durations[stage].append(seconds)
+        totals = _totals[stage]
+        totals[0] += 1
+        totals[1] += seconds
+
+
+def count(name, value=1):
+    """ Increases the counter. """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class _Measure:
+    """ Context timing the stage. """
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullMeasure:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_MEASURE = _NullMeasure()
+
+
+def measure(stage):
+    """ Context timing the stage: with measure('render.draw'): ... """
+    return _Measure(stage) if _enabled else _NULL_MEASURE
+
+
+def timed(stage):
+    """ Decorator timing every call of the function as the stage. """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def stage_count(stage):
+    """ Number of the recorded durations of the stage since reset. """
+    with _lock:
+        return _totals.get(stage, [0])[0]
+
+
+def recent(stage, n):
+    """ The last n durations of the stage [<= n], s. """
+    with _lock:
+        durations = list(_durations.get(stage, ()))
+    return np.array(durations[-n:]) if n > 0 else np.empty(0)
+
+
+def stats():
+    """ Statistics of the stages (count, total, mean, percentiles and max in ms of the kept durations)
+    and the counters.
+    """
+
+    with _lock:
+        durations = {stage: np.array(values) for stage, values in _durations.items()}
+        totals = {stage: list(values) for stage, values in _totals.items()}
+        counters = dict(_counters)
+    stages = {}
+    for stage, values in sorted(durations.items()):
+        n, total = totals[stage]
+        stages[stage] = {'count': n, 'total_s': total, 'mean_ms': 1e3 * total / n, 'max_ms': 1e3 * float(values.max())}
+        for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            stages[stage][f'p{percentile}_ms'] = 1e3 * float(value)
+    return {'stages': stages, 'counters': counters}
+
+
+def dump(path):
+    """ Writes stats to the JSON file. """
+    with open(path, 'w') as file:
+        json.dump(stats(), file, indent=2)
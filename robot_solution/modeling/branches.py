@@ -0,0 +1,69 @@
+""" Selection of the forward solution branches along the track.
+
+Every Cartesian waypoint has up to 8 joint solutions (shoulder, elbow and wrist configurations).
+The sequence of solutions minimizing the total weighted joint travel is found by dynamic
+programming over all branches of all waypoints (Viterbi algorithm): O(N x B x B) for
+N waypoints and B branches, every step is a vectorized [B x B] cost matrix.
+"""
+
+import numpy as np
+
+from robot_solution.modeling.chain import solve_forward_batch
+
+DEFAULT_WEIGHTS = np.ones(6)  # weights of the joint travels, 1 / degree
+
+
+def travel_costs(previous, following, weights=DEFAULT_WEIGHTS):
+    """ Weighted joint travels [B1 x B2] between branches [B1 x 6] and [B2 x 6] (inf for missing branches). """
+    costs = np.abs(following[None, :, :] - previous[:, None, :]) @ np.asarray(weights, dtype=float)
+    return np.where(np.isnan(costs), np.inf, costs)
+
+
+def select_branches(candidates, weights=DEFAULT_WEIGHTS, start=None):
+    """ Selects one branch per waypoint minimizing the total weighted joint travel.
+    candidates: [N x B x 6] joint angles in degrees, nan for missing branches.
+    start: optional joint angles [6] the robot moves from to the first waypoint.
+    Returns selected angles [N x 6] and branch numbers [N].
+    """
+
+    candidates = np.asarray(candidates, dtype=float)
+    valid = ~np.isnan(candidates).any(axis=-1)
+    unsolved = np.flatnonzero(~valid.any(axis=1))
+    if unsolved.size:
+        raise ValueError(f'Waypoints {unsolved.tolist()} have no solutions')
+    if start is None:
+        cost = np.where(valid[0], 0., np.inf)
+    else:
+        cost = travel_costs(np.asarray(start, dtype=float)[None, :], candidates[0], weights)[0]
+    back = np.zeros(candidates.shape[:2], dtype=int)
+    for k in range(1, candidates.shape[0]):
+        total = cost[:, None] + travel_costs(candidates[k - 1], candidates[k], weights)
+        back[k] = np.argmin(total, axis=0)
+        cost = total[back[k], np.arange(total.shape[1])]
+    branches = np.empty(candidates.shape[0], dtype=int)
+    branches[-1] = np.argmin(cost)
+    for k in range(candidates.shape[0] - 1, 0, -1):
+        branches[k - 1] = back[k, branches[k]]
+    return candidates[np.arange(candidates.shape[0]), branches], branches
+
+
+def track_candidates(poses, fixed_angles=None, limits=None):
+    """ Branches of the waypoints [N x B x 6]: all forward solutions of poses [N x 7]
+    or the only one given by fixed_angles [N x 6] (rows of nan for Cartesian waypoints).
+    """
+
+    candidates, _ = solve_forward_batch(poses, limits)
+    if fixed_angles is not None:
+        fixed_angles = np.asarray(fixed_angles, dtype=float)
+        fixed = ~np.isnan(fixed_angles).any(axis=1)
+        candidates[fixed] = np.nan
+        candidates[fixed, 0] = fixed_angles[fixed]
+    return candidates
+
+
+def select_track_branches(poses, fixed_angles=None, weights=DEFAULT_WEIGHTS, start=None, limits=None):
+    """ Joint angles [N x 6] of the waypoints poses [N x 7] with the minimal total weighted joint travel.
+    Waypoints with fixed_angles rows (not nan) keep them.
+    """
+
+    return select_branches(track_candidates(poses, fixed_angles, limits), weights, start)[0]
@@ -0,0 +1,79 @@
+""" Memoization of kinematic solutions. """
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MAX_SIZE = 4096  # number of stored solutions
+DEFAULT_TOLERANCE = 1e-6  # quantization step of the key values
+
+
+class KinematicsCache:
+    """ Bounded LRU cache of solutions keyed by values quantized to the tolerance.
+    Values closer than the tolerance share the same solution. Safe to use from several threads.
+    The number of solutions is bounded by max_size, their total size by max_bytes if given.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, tolerance=DEFAULT_TOLERANCE, max_bytes=None):
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0  # total size of the stored solutions
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size=None, tolerance=None, max_bytes=None):
+        """ Changes cache parameters. Stored solutions are dropped. """
+        if max_size is not None:
+            self.max_size = max_size
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if tolerance is not None:
+            self.tolerance = tolerance
+        self.clear()
+
+    def key(self, values):
+        """ Quantized key of the values. """
+        return np.round(np.asarray(values, dtype=float) / self.tolerance).astype(np.int64).tobytes()
+
+    def get(self, values):
+        """ Returns a copy of the stored solution or None. """
+        key = self.key(values)
+        with self._lock:
+            result = self._items.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+        return result.copy()
+
+    def put(self, values, result):
+        """ Stores a copy of the solution and evicts the least recently used one if full. """
+        key = self.key(values)
+        result = np.array(result)
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items[key].nbytes
+            self._items[key] = result
+            self._items.move_to_end(key)
+            self._bytes += result.nbytes
+            while len(self._items) > self.max_size or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes and self._items):
+                self._bytes -= self._items.popitem(last=False)[1].nbytes
+
+    def clear(self):
+        """ Drops stored solutions and statistics. """
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """ Returns hit/miss statistics. """
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._items), 'bytes': self._bytes,
+                'hit_rate': self.hits / requests if requests else 0.}
@@ -0,0 +1,365 @@
+""" Vectorized kinematics of the 6-axis robot.
+
+The robot is described as a product of exponentials: six revolute screw axes
+(and six more for backlash angles) and the tool pose at zero joint angles, all
+given in the base frame. The axes are not hard-coded, they are calibrated once
+from solution.solve_straight and simulation.find_Trans_JointAngle_joint_pos,
+so the batch functions follow exactly the same geometry as the scalar ones.
+"""
+
+import functools
+import numpy as np
+
+from robot_solution.instrumentation import timed
+from robot_solution.modeling.transform_array import quat2rotm_array, rotm2quat_array
+from robot_solution.modeling.solution import solve_straight, solve_forward
+from robot_solution.modeling.simulation import find_Trans_JointAngle_joint_pos
+
+N_JOINTS = 6
+N_BRANCHES = 8  # shoulder (2) x elbow (2) x wrist (2)
+CALIBRATION_ANGLE = 90  # deg
+GEOMETRY_TOL = 1e-6  # tolerance of the robot structure checks, m
+SOLUTION_TOL = 1e-6  # tolerance of the inverse solution check
+
+
+def skew(vector):
+    """ Skew-symmetric matrix of the vector [3]. """
+    x, y, z = vector
+    return np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+
+
+def rotation(axis, angle):
+    """ Rotation matrices [... x 3 x 3] about the unit axis [3] by angles [...] in radians. """
+    cross = skew(axis)
+    angle = np.asarray(angle)[..., None, None]
+    return np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * (cross @ cross)
+
+
+def rotate(axis, angle, vectors):
+    """ Rotates vectors [... x 3] about the unit axis [3] by angles [...] in radians. """
+    cos, sin = np.cos(angle)[..., None], np.sin(angle)[..., None]
+    return vectors * cos + np.cross(axis, vectors) * sin + axis * (vectors @ axis)[..., None] * (1 - cos)
+
+
+def apply(rotm, vectors):
+    """ Multiplies stacked matrices [... x 3 x 3] by stacked vectors [... x 3]. """
+    return np.einsum('...ij,...j->...i', rotm, vectors)
+
+
+def pose2transform(pose):
+    """ Converts poses [... x 7] (x, y, z, quat1..quat4) to homogeneous matrices [... x 4 x 4]. """
+    pose = np.asarray(pose, dtype=float)
+    transform = np.zeros(pose.shape[:-1] + (4, 4))
+    transform[..., :3, :3] = quat2rotm_array(pose[..., 3:])
+    transform[..., :3, 3] = pose[..., :3]
+    transform[..., 3, 3] = 1
+    return transform
+
+
+def _perp(vectors, axis):
+    """ Component of vectors [... x 3] perpendicular to the unit axis [3]. """
+    return vectors - (vectors @ axis)[..., None] * axis
+
+
+def _rotation_angle(axis, u, v):
+    """ Angle of the rotation about the axis, which takes vector u to vector v
+    (Paden-Kahan subproblem 1). """
+    u, v = _perp(u, axis), _perp(v, axis)
+    return np.arctan2(np.cross(u, v) @ axis, np.sum(u * v, axis=-1))
+
+
+def _solve_trig(a, b, c):
+    """ Both roots of a * cos(x) + b * sin(x) = c [... x 2], nan if there are none. """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = c / np.hypot(a, b)
+    ratio = np.where(np.abs(ratio) <= 1 + SOLUTION_TOL, np.clip(ratio, -1, 1), np.nan)
+    base, delta = np.arctan2(b, a), np.arccos(ratio)
+    return np.stack([base + delta, base - delta], axis=-1)
+
+
+def _multiply_components(quat1, quat2):
+    """ Hamilton product of quaternions given by components (w, x, y, z). """
+    w1, x1, y1, z1 = quat1
+    w2, x2, y2, z2 = quat2
+    return [w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+            w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+            w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2]
+
+
+def _rotate_components(quat, vector):
+    """ Rotates vector by unit quaternion, both given by components. """
+    w, qx, qy, qz = quat
+    x, y, z = vector
+    # t = 2 q x v, v' = v + w t + q x t
+    tx, ty, tz = 2 * (qy * z - qz * y), 2 * (qz * x - qx * z), 2 * (qx * y - qy * x)
+    return [x + w * tx + qy * tz - qz * ty,
+            y + w * ty + qz * tx - qx * tz,
+            z + w * tz + qx * ty - qy * tx]
+
+
+class KinematicChain:
+    """ Screw axes of the robot joints and tool pose at zero joint angles. """
+
+    def __init__(self, axes, points, home, backlash_axes=None, backlash_points=None,
+                 joint_pos=None, joint_links=None):
+        self.axes = axes  # unit joint axes [6 x 3]
+        self.points = points  # a point of every joint axis [6 x 3], m
+        self.home = home  # tool pose at zero joint angles [4 x 4]
+        # backlash rotation axes, zero axis if the backlash angle is not used [6 x 3]
+        self.backlash_axes = np.zeros_like(axes) if backlash_axes is None else backlash_axes
+        self.backlash_points = np.zeros_like(points) if backlash_points is None else backlash_points
+        self.joint_pos = joint_pos  # joint positions at zero angles [3 x 7], m
+        self.joint_links = joint_links  # the last joint moving every joint position [7]
+        self.wrist_center = None  # intersection of the axes 4..6, m
+        self.tool_offset = None  # wrist center in the tool frame, m
+        self.closed_form = self._check_structure()
+
+    @staticmethod
+    def _screw(motion):
+        """ Unit axis and the point of the axis closest to the origin by the rigid motion [4 x 4].
+        Zero axis if the motion does not rotate. """
+        rotm, shift = motion[:3, :3], motion[:3, 3]
+        axis = np.array([rotm[2, 1] - rotm[1, 2], rotm[0, 2] - rotm[2, 0], rotm[1, 0] - rotm[0, 1]])
+        if np.linalg.norm(axis) < GEOMETRY_TOL:
+            return np.zeros(3), np.zeros(3)
+        # (I - R) q = t
+        return axis / np.linalg.norm(axis), np.linalg.lstsq(np.eye(3) - rotm, shift, rcond=None)[0]
+
+    @classmethod
+    def from_solution(cls):
+        """ Calibrates the chain by the scalar straight solution and joint positions.
+        Every joint (and backlash) angle is rotated alone, the tool motion gives its screw axis,
+        the moved joint positions give the links they belong to.
+        """
+
+        zero = np.zeros(2 * N_JOINTS)
+        home = pose2transform(solve_straight(zero))
+        inv_home = np.linalg.inv(home)
+        _, _, joint_pos = find_Trans_JointAngle_joint_pos(zero)
+        joint_pos = np.asarray(joint_pos, dtype=float)
+        screws = []
+        joint_links = np.full(joint_pos.shape[1], -1)
+        for j in range(2 * N_JOINTS):
+            x = zero.copy()
+            x[j] = CALIBRATION_ANGLE
+            screws.append(cls._screw(pose2transform(solve_straight(x)) @ inv_home))
+            _, _, moved_pos = find_Trans_JointAngle_joint_pos(x)
+            moved = np.linalg.norm(np.asarray(moved_pos) - joint_pos, axis=0) > GEOMETRY_TOL
+            joint_links[moved] = np.maximum(joint_links[moved], j % N_JOINTS)
+        axes, points = map(np.array, zip(*screws))
+        return cls(axes[:N_JOINTS], points[:N_JOINTS], home, axes[N_JOINTS:], points[N_JOINTS:],
+                   joint_pos, joint_links)
+
+    def _check_structure(self):
+        """ Checks the structure required by the closed-form forward solution:
+        parallel axes 2, 3 and spherical wrist (axes 4..6 intersect in one point).
+        """
+
+        axes, points = self.axes, self.points
+        if np.linalg.norm(np.cross(axes[1], axes[2])) > GEOMETRY_TOL:
+            return False
+        if np.linalg.norm(np.cross(axes[3], axes[4])) < GEOMETRY_TOL:
+            return False
+        # least squares intersection of the wrist axes
+        projectors = np.eye(3) - axes[3:, :, None] * axes[3:, None, :]
+        center = np.linalg.solve(projectors.sum(axis=0), apply(projectors, points[3:]).sum(axis=0))
+        if np.linalg.norm(apply(projectors, center - points[3:]), axis=-1).max() > GEOMETRY_TOL:
+            return False
+        self.wrist_center = center
+        self.tool_offset = self.home[:3, :3].T @ (center - self.home[:3, 3])
+        return True
+
+    def _motions(self, x):
+        """ Rigid motions of the links by joint angles [... x 6] or angles with backlash [... x 12]
+        in degrees. Yields components of the rotation quaternion (w, x, y, z) and of the shift
+        (x, y, z) of the links 1..6, every component is an array [...]. """
+        x = np.radians(np.moveaxis(x, -1, 0))
+        quat = [np.ones(x.shape[1:]), np.zeros(x.shape[1:]), np.zeros(x.shape[1:]), np.zeros(x.shape[1:])]
+        shift = [np.zeros(x.shape[1:]) for _ in range(3)]
+        for j in range(N_JOINTS):
+            screws = [(self.axes[j], self.points[j], x[j])]
+            if x.shape[0] > N_JOINTS:
+                screws.append((self.backlash_axes[j], self.backlash_points[j], x[N_JOINTS + j]))
+            for axis, point, angle in screws:
+                # zero backlash is the usual case, skip the screws which do not move
+                if not axis.any() or not angle.any():
+                    continue
+                # shift of the rotation about the axis through the point: q - R q
+                cos, sin = np.cos(angle), np.sin(angle)
+                across, normal = _perp(point, axis), np.cross(axis, point)
+                joint_shift = _rotate_components(quat, [(1 - cos) * across[i] - sin * normal[i] for i in range(3)])
+                shift = [shift[i] + joint_shift[i] for i in range(3)]
+                quat = _multiply_components(quat, [np.cos(angle / 2)] + [np.sin(angle / 2) * a for a in axis])
+            yield quat, shift
+
+    def straight(self, x):
+        """ Solves straight task by joint angles [... x 6] or angles with backlash [... x 12] in degrees.
+        Returns joint positions [... x 3 x 7] and tool poses [... x 7] (x, y, z, quat1..quat4).
+        """
+
+        x = np.asarray(x, dtype=float)
+        joint_pos = np.empty(x.shape[:-1] + self.joint_pos.shape)
+        unmoved = self.joint_links < 0
+        joint_pos[..., unmoved] = self.joint_pos[:, unmoved]
+        for j, (quat, shift) in enumerate(self._motions(x)):
+            for k in np.flatnonzero(self.joint_links == j):
+                rotated = _rotate_components(quat, self.joint_pos[:, k])
+                for i in range(3):
+                    joint_pos[..., i, k] = rotated[i] + shift[i]
+        pose = np.empty(x.shape[:-1] + (7,))
+        rotated = _rotate_components(quat, self.home[:3, 3])
+        tool_quat = _multiply_components(quat, rotm2quat_array(self.home[:3, :3]))
+        sign = np.where(tool_quat[0] < 0, -1, 1)
+        for i in range(3):
+            pose[..., i] = rotated[i] + shift[i]
+        for i in range(4):
+            pose[..., 3 + i] = sign * tool_quat[i]
+        return joint_pos, pose
+
+    def tool_transform(self, x):
+        """ Solves straight task: tool poses [... x 4 x 4] by joint angles [... x 6]
+        or angles with backlash [... x 12] in degrees. """
+        return pose2transform(self.straight(x)[1])
+
+    def solve_forward(self, poses, limits=None, branch=None):
+        """ Solves forward task for poses [N x 7] in closed form (Paden-Kahan subproblems).
+        Returns angles in degrees [N x 8 x 6]: all shoulder, elbow and wrist branches,
+        nan for branches that do not exist or are out of limits [6 x 2] (deg).
+        If the branch number (0..7) is given, only its angles are solved [N x 1 x 6].
+        """
+
+        # roots of the joints 1, 3 and signs of the wrist solution: the branch is 4 * root1 + 2 * root3 + sign
+        if branch is None:
+            roots1, roots3, signs = [0, 1], [0, 1], [1, -1]
+        else:
+            roots1, roots3, signs = [branch // 4], [branch // 2 % 2], [1 - 2 * (branch % 2)]
+        target = pose2transform(poses)
+        n_poses = target.shape[0]
+        axes, points, center = self.axes, self.points, self.wrist_center
+        wrist = target[:, :3, 3] + apply(target[:, :3, :3], self.tool_offset)
+
+        # joint 1: turning back the wrist center must bring it to the plane of joints 2, 3
+        radius = wrist - points[0]
+        along = (radius @ axes[0])[:, None] * axes[0]
+        across = radius - along
+        theta1 = -_solve_trig(across @ axes[1], np.cross(axes[0], across) @ axes[1],
+                              (center - points[0] - along) @ axes[1])[:, roots1]
+        theta1 = theta1.reshape(-1)
+        arm_wrist = points[0] + rotate(axes[0], -theta1, np.repeat(radius, len(roots1), axis=0))
+
+        # joint 3: distance from the wrist center to the axis 2 depends on it only
+        offset = _perp(points[2] - points[1], axes[1])
+        arm = _perp(center - points[2], axes[1])
+        distance = np.sum(_perp(arm_wrist - points[1], axes[1]) ** 2, axis=-1)
+        theta3 = _solve_trig(2 * offset @ arm, 2 * offset @ np.cross(axes[2], arm),
+                             distance - offset @ offset - arm @ arm)[:, roots3]
+        theta3 = theta3.reshape(-1)
+        theta1, arm_wrist = np.repeat(theta1, len(roots3)), np.repeat(arm_wrist, len(roots3), axis=0)
+
+        # joint 2: turns the elbow-rotated wrist center to its place
+        elbow_wrist = points[2] + rotate(axes[2], theta3, center - points[2])
+        theta2 = _rotation_angle(axes[1], elbow_wrist - points[1], arm_wrist - points[1])
+
+        # joints 4, 5: R4 R5 R6 = (R1 R2 R3)^T R Rhome^T, R6 keeps the axis 6
+        arm_rotm = rotation(axes[0], theta1) @ rotation(axes[1], theta2) @ rotation(axes[2], theta3)
+        n_arms = len(roots1) * len(roots3)
+        wrist_rotm = np.swapaxes(arm_rotm, -1, -2) @ np.repeat(target[:, :3, :3], n_arms, axis=0) \
+            @ self.home[:3, :3].T
+        tool_axis = apply(wrist_rotm, axes[5])
+        cos45, cos56 = axes[3] @ axes[4], axes[4] @ axes[5]
+        alpha = (tool_axis @ axes[3] - cos45 * cos56) / (1 - cos45 ** 2)
+        beta = (cos56 - cos45 * (tool_axis @ axes[3])) / (1 - cos45 ** 2)
+        normal = np.cross(axes[3], axes[4])
+        gamma = (1 - alpha ** 2 - beta ** 2 - 2 * alpha * beta * cos45) / (normal @ normal)
+        gamma = np.sqrt(np.where(gamma > -SOLUTION_TOL, np.clip(gamma, 0, None), np.nan))
+        gamma = np.stack([sign * gamma for sign in signs], axis=-1).reshape(-1)
+        alpha, beta = np.repeat(alpha, len(signs)), np.repeat(beta, len(signs))
+        tool_axis, wrist_rotm = np.repeat(tool_axis, len(signs), axis=0), np.repeat(wrist_rotm, len(signs), axis=0)
+        middle = alpha[:, None] * axes[3] + beta[:, None] * axes[4] + gamma[:, None] * normal
+        theta5 = _rotation_angle(axes[4], axes[5], middle)
+        theta4 = _rotation_angle(axes[3], middle, tool_axis)
+
+        # joint 6: the rest of the rotation
+        rest_rotm = rotation(axes[4], -theta5) @ rotation(axes[3], -theta4) @ wrist_rotm
+        reference = np.cross(axes[5], np.eye(3)[np.argmin(np.abs(axes[5]))])
+        theta6 = _rotation_angle(axes[5], reference, apply(rest_rotm, reference))
+
+        angles = np.stack([np.repeat(theta1, len(signs)), np.repeat(theta2, len(signs)),
+                           np.repeat(theta3, len(signs)), theta4, theta5, theta6], axis=-1)
+        angles = (np.degrees(angles) + 180) % 360 - 180
+        angles = angles.reshape(n_poses, n_arms * len(signs), N_JOINTS)
+
+        # drop degenerated branches by the residual of the straight solution
+        solved = self.tool_transform(angles)
+        error = np.abs(solved - target[:, None]).reshape(n_poses, angles.shape[1], -1).max(axis=-1)
+        valid = error < SOLUTION_TOL
+        if limits is not None:
+            valid &= _within_limits(angles, limits)
+        angles[~valid] = np.nan
+        return angles
+
+
+def _within_limits(angles, limits):
+    """ Mask of the joint angles [... x 6] within limits [6 x 2]. """
+    limits = np.asarray(limits, dtype=float)
+    return np.all((angles >= limits[:, 0]) & (angles <= limits[:, 1]), axis=-1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_chain():
+    """ Returns the kinematic chain calibrated by the scalar solution (once per process). """
+    return KinematicChain.from_solution()
+
+
+def _solve_forward_loop(poses):
+    """ Solves forward task by the scalar solution pose by pose.
+    Used when the robot structure does not allow the closed-form solution. """
+    orient_matrices = quat2rotm_array(poses[:, 3:])
+    solutions = []
+    for pos_coord, orient_matrix in zip(poses[:, :3], orient_matrices):
+        try:
+            all_solutions_deg, _, _, _ = solve_forward(pos_coord, orient_matrix)
+            solutions.append(np.atleast_2d(all_solutions_deg))
+        except Exception:
+            solutions.append(np.empty((0, N_JOINTS)))
+    n_branches = max([N_BRANCHES] + [branches.shape[0] for branches in solutions])
+    angles = np.full((poses.shape[0], n_branches, N_JOINTS), np.nan)
+    for i, branches in enumerate(solutions):
+        angles[i, :branches.shape[0]] = branches
+    return angles
+
+
+@timed('kinematics.forward_batch')
+def solve_forward_batch(poses, limits=None, branch=None):
+    """ Solves forward task for many poses at once.
+    poses: [N x 7] x, y, z, quat1, quat2, quat3, quat4.
+    limits: optional joint limits [6 x 2] in degrees.
+    branch: optional branch number, only its solutions are returned then [N x 1 x 6].
+    Returns all solutions in degrees [N x n_branches x 6] (nan for missing branches)
+    and reachability mask [N].
+    """
+
+    poses = np.atleast_2d(np.asarray(poses, dtype=float))
+    chain = get_chain()
+    if chain.closed_form:
+        solutions = chain.solve_forward(poses, limits, branch)
+    else:
+        solutions = _solve_forward_loop(poses)
+        if branch is not None:
+            solutions = solutions[:, branch:branch + 1]
+        if limits is not None:
+            solutions[~_within_limits(solutions, limits)] = np.nan
+    reachable = np.any(~np.isnan(solutions).any(axis=-1), axis=-1)
+    return solutions, reachable
+
+
+@timed('kinematics.straight_batch')
+def find_joint_pos_batch(x):
+    """ Counts joint positions and tool poses for many joint states at once.
+    x: [T x 12] joint angles 1..6 and backlash angles 1..6 in degrees (or [T x 6] without backlash).
+    Returns joint positions [T x 3 x 7] in m and tool poses [T x 7]: x, y, z, quat1..quat4.
+    """
+
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    return get_chain().straight(x)
@@ -0,0 +1,180 @@
+""" Self-collision and obstacle checking of trajectories.
+
+The robot links are capsules (segments with radii) between consecutive joint positions: the base
+origin, joints 1..6 and the tool (joint 7). Obstacles are boxes (axis-aligned) and planes (the half-space
+behind the plane is the obstacle). All frames are checked at once: a broad phase compares bounding
+spheres of the links, exact distances are computed only for the pairs it passes.
+Neighbour links are joined by a joint and are not checked against each other, nor are the pairs
+of EXCLUDED_SELF_PAIRS joined by the structure of the robot (e.g. the links around a zero-length link
+of a spherical wrist).
+"""
+
+import json
+from collections import namedtuple
+import numpy as np
+
+from robot_solution.modeling.columns import JOINT_POS_COLUMNS
+
+N_LINKS = 7
+# typical radii of the links base-joint1, joint1-joint2, ..., joint6-tool, set the ones of the robot
+DEFAULT_RADII = np.array([0.1, 0.08, 0.07, 0.06, 0.05, 0.04, 0.03])  # m
+DEFAULT_OBSTACLE_LINKS = list(range(1, N_LINKS))  # the base link does not move
+# not neighbour link pairs (i, j), i < j, joined by the structure of the robot, set the ones of the robot
+EXCLUDED_SELF_PAIRS = []
+BOX_ITERATIONS = 30  # golden section steps of the segment to box distance
+EPS = 1e-12
+
+# frames first..last (inclusive) of the collision of the link with the link or the obstacle (by name)
+Collision = namedtuple('Collision', ['first_frame', 'last_frame', 'link', 'other'])
+
+
+class Box:
+    """ Axis-aligned box obstacle, corners in m. """
+
+    def __init__(self, low, high, name='box'):
+        self.low = np.asarray(low, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.name = name
+
+    def distances(self, points):
+        """ Distances of points [..., 3] to the box (0 inside). """
+        return np.linalg.norm(np.maximum(np.maximum(self.low - points, points - self.high), 0), axis=-1)
+
+    def segment_distances(self, starts, ends):
+        """ Distances of segments [K x 3] to the box: the point distance is convex along the segment,
+        so its minimum is found by the golden section search. """
+        ratio = (np.sqrt(5) - 1) / 2
+        low, high = np.zeros(starts.shape[0]), np.ones(starts.shape[0])
+        direction = ends - starts
+        for _ in range(BOX_ITERATIONS):
+            left, right = high - ratio * (high - low), low + ratio * (high - low)
+            closer = self.distances(starts + left[:, None] * direction) < \
+                self.distances(starts + right[:, None] * direction)
+            high, low = np.where(closer, right, high), np.where(closer, low, left)
+        return self.distances(starts + ((low + high) / 2)[:, None] * direction)
+
+    def sphere_distances(self, centers):
+        return self.distances(centers)
+
+
+class Plane:
+    """ Plane obstacle: points behind the plane (against the normal) are inside. """
+
+    def __init__(self, point, normal, name='plane'):
+        self.point = np.asarray(point, dtype=float)
+        self.normal = np.asarray(normal, dtype=float) / np.linalg.norm(normal)
+        self.name = name
+
+    def signed_distances(self, points):
+        return (points - self.point) @ self.normal
+
+    def segment_distances(self, starts, ends):
+        return np.maximum(np.minimum(self.signed_distances(starts), self.signed_distances(ends)), 0)
+
+    def sphere_distances(self, centers):
+        return np.maximum(self.signed_distances(centers), 0)
+
+
+def load_obstacles(path):
+    """ Reads obstacles from the JSON list of
+    {"type": "box", "low": [x, y, z], "high": [x, y, z]} and {"type": "plane", "point": [...], "normal": [...]},
+    every obstacle can have a "name".
+    """
+
+    with open(path) as file:
+        items = json.load(file)
+    obstacles = []
+    for k, item in enumerate(items):
+        name = item.get('name', f'{item["type"]} {k + 1}')
+        if item['type'] == 'box':
+            obstacles.append(Box(item['low'], item['high'], name))
+        elif item['type'] == 'plane':
+            obstacles.append(Plane(item['point'], item['normal'], name))
+        else:
+            raise ValueError(f'{path}: unknown obstacle type {item["type"]}')
+    return obstacles
+
+
+def link_points(uxSim):
+    """ Points of the robot line [T x 8 x 3]: the base origin and joints 1..7 of simulation rows. """
+    joint_pos = np.asarray(uxSim)[:, JOINT_POS_COLUMNS].reshape(-1, N_LINKS, 3)
+    return np.concatenate((np.zeros((joint_pos.shape[0], 1, 3)), joint_pos), axis=1)
+
+
+def self_collision_pairs(excluded=EXCLUDED_SELF_PAIRS):
+    """ Link pairs checked for self-collisions: all but the neighbours and the excluded pairs. """
+    excluded = {tuple(sorted(pair)) for pair in excluded}
+    return [(i, j) for i in range(N_LINKS) for j in range(i + 2, N_LINKS) if (i, j) not in excluded]
+
+
+def segment_distances(p1, q1, p2, q2):
+    """ Distances between segments p1-q1 and p2-q2 [K x 3] (closest points with clamping). """
+    d1, d2, r = q1 - p1, q2 - p2, p1 - p2
+    a, e = np.einsum('ij,ij->i', d1, d1), np.einsum('ij,ij->i', d2, d2)
+    b, c, f = np.einsum('ij,ij->i', d1, d2), np.einsum('ij,ij->i', d1, r), np.einsum('ij,ij->i', d2, r)
+    a_safe, e_safe = np.maximum(a, EPS), np.maximum(e, EPS)
+    denom = a * e - b * b
+    # parallel segments take any s, then the best t and s for it
+    s = np.where(denom > EPS, np.clip((b * f - c * e) / np.maximum(denom, EPS), 0, 1), 0)
+    t = (b * s + f) / e_safe
+    s = np.where(t < 0, np.clip(-c / a_safe, 0, 1), np.where(t > 1, np.clip((b - c) / a_safe, 0, 1), s))
+    t = np.clip(t, 0, 1)
+    # degenerate segments are points
+    s = np.where(a <= EPS, 0, s)
+    t = np.where(e <= EPS, 0, np.where(a <= EPS, np.clip(f / e_safe, 0, 1), t))
+    s = np.where((e <= EPS) & (a > EPS), np.clip(-c / a_safe, 0, 1), s)
+    return np.linalg.norm(p1 + s[:, None] * d1 - p2 - t[:, None] * d2, axis=1)
+
+
+def _events(mask, first, others):
+    """ Collisions of the runs of frames in the mask [T x P] of the pairs (first[p], others[p]). """
+    padded = np.vstack((np.zeros((1, mask.shape[1]), dtype=bool), mask, np.zeros((1, mask.shape[1]), dtype=bool)))
+    changes = np.diff(padded.astype(np.int8), axis=0)
+    starts, ends = np.nonzero(changes.T == 1), np.nonzero(changes.T == -1)
+    return [Collision(int(start), int(end) - 1, first[pair], others[pair])
+            for pair, start, end in zip(starts[0], starts[1], ends[1])]
+
+
+def check_collisions(points, obstacles=(), radii=DEFAULT_RADII, self_pairs=None,
+                     obstacle_links=DEFAULT_OBSTACLE_LINKS):
+    """ Finds collisions of the robot line points [T x 8 x 3] (see link_points).
+    self_pairs: link pairs checked for self-collisions, self_collision_pairs() by default.
+    Returns Collision list sorted by the first frame: other is a link number (0 is the base link)
+    or the obstacle name.
+    """
+
+    self_pairs = self_collision_pairs() if self_pairs is None else self_pairs
+    points = np.asarray(points, dtype=float)
+    n_frames = points.shape[0]
+    radii = np.asarray(radii, dtype=float)
+    starts, ends = points[:, :-1], points[:, 1:]
+    centers = (starts + ends) / 2
+    # bounding spheres of the capsules
+    bounds = np.linalg.norm(ends - starts, axis=-1) / 2 + radii
+    events = []
+    if self_pairs:
+        first, second = np.array(self_pairs).T
+        offsets = centers[:, first] - centers[:, second]
+        reach = bounds[:, first] + bounds[:, second]
+        candidates = np.einsum('ijk,ijk->ij', offsets, offsets) <= reach * reach
+        frames, pairs = np.nonzero(candidates)
+        mask = np.zeros((n_frames, first.size), dtype=bool)
+        distances = segment_distances(starts[frames, first[pairs]], ends[frames, first[pairs]],
+                                      starts[frames, second[pairs]], ends[frames, second[pairs]])
+        mask[frames, pairs] = distances < radii[first[pairs]] + radii[second[pairs]]
+        events += _events(mask, first.tolist(), second.tolist())
+    links = np.asarray(obstacle_links, dtype=int)
+    for obstacle in obstacles:
+        candidates = obstacle.sphere_distances(centers[:, links]) <= bounds[:, links]
+        frames, k = np.nonzero(candidates)
+        mask = np.zeros((n_frames, links.size), dtype=bool)
+        if frames.size:
+            distances = obstacle.segment_distances(starts[frames, links[k]], ends[frames, links[k]])
+            mask[frames, k] = distances < radii[links[k]]
+        events += _events(mask, links.tolist(), [obstacle.name] * links.size)
+    return sorted(events, key=lambda event: (event.first_frame, event.link, str(event.other)))
+
+
+def check_trajectory(uxSim, obstacles=(), **kwargs):
+    """ Collisions of the simulation rows (see check_collisions). """
+    return check_collisions(link_points(uxSim), obstacles, **kwargs)
@@ -0,0 +1,22 @@
+""" Layout of the simulation rows uxSim given by get_trajectory.
+
+Joint positions 1..7 (7 is the tool) are in m, angles in degrees. The solver gives a row
+every SOLVER_STEP, the time-optimal timing keeps its times in the TIME_COLUMN.
+"""
+
+SOLVER_STEP = 0.01  # time step of the simulation rows, s
+N_COLUMNS = 68
+TIME_COLUMN = 0  # s
+ANGLE_COLUMNS = slice(37, 43)  # joint angles 1..6, degrees
+JOINT_POS_COLUMNS = slice(43, 64)  # x, y, z of the joints 1..7, m
+TCP_COLUMNS = slice(61, 64)  # x, y, z of the tool (joint 7), m
+QUAT_COLUMNS = slice(64, 68)  # tool orientation quat1..quat4
+
+
+def uxsim_columns(n_columns=N_COLUMNS):
+    """ Column names of the simulation rows. """
+    names = [f'col{k}' for k in range(max(n_columns, N_COLUMNS))]
+    names[ANGLE_COLUMNS] = [f'angle{j + 1}' for j in range(6)]
+    names[JOINT_POS_COLUMNS] = [f'joint{k + 1}_{axis}' for k in range(7) for axis in 'xyz']
+    names[QUAT_COLUMNS] = [f'quat{j + 1}' for j in range(4)]
+    return names[:n_columns]
@@ -0,0 +1,35 @@
+""" Joint limits of the robot.
+
+The limits are read from joint_limits.json next to this module: 6 pairs [low, high] of degrees
+    [[-170, 170], [-90, 150], ...]
+Without the file every joint is limited by the full turn of the forward solution, [-180, 180].
+"""
+
+import functools
+import json
+import os
+import numpy as np
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'joint_limits.json')
+FULL_TURN_LIMITS = np.array([[-180., 180.]] * 6)  # angles of the forward solution, degrees
+
+
+def load_joint_limits(path):
+    """ Reads the joint limits [6 x 2] (degrees) from the JSON list of [low, high] pairs. """
+    with open(path) as file:
+        limits = np.asarray(json.load(file), dtype=float)
+    if limits.shape != (6, 2) or not np.all(limits[:, 0] < limits[:, 1]):
+        raise ValueError(f'{path}: joint limits must be 6 pairs [low, high] with low < high')
+    return limits
+
+
+@functools.lru_cache(maxsize=None)
+def get_joint_limits(path=DEFAULT_PATH):
+    """ Returns the joint limits [6 x 2] loaded on the first call or the full turns if there is no valid file.
+    The returned array is shared, it must not be changed.
+    """
+
+    try:
+        return load_joint_limits(path)
+    except (OSError, ValueError, TypeError):
+        return FULL_TURN_LIMITS
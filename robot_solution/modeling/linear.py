@@ -0,0 +1,93 @@
+""" Linear moves: the straight tool path with the slerped orientation.
+
+The path is sampled densely and all samples are solved by one batch closed-form forward solution
+of the branch the move starts on, so the joints move continuously. Near a singularity the branches
+can swap, then all branches are solved and every sample takes the one nearest to the previous sample
+(the previous solution is the warm start of the next one).
+"""
+
+import numpy as np
+
+from robot_solution.modeling.chain import solve_forward_batch
+from robot_solution.modeling.transform_array import slerp_array
+
+DEFAULT_SAMPLE_STEP = 0.001  # distance between the path samples, m
+DEFAULT_ANGLE_STEP = 0.5  # rotation between the path samples, degrees
+MAX_SAMPLE_STEP = 10.  # joint move between the samples, degrees: larger ones mean a singularity
+
+
+def path_length(start_pose, end_pose):
+    """ Distance (m) and rotation angle (degrees) of the move between poses [7]. """
+    start_pose, end_pose = np.asarray(start_pose, dtype=float), np.asarray(end_pose, dtype=float)
+    cos = abs(start_pose[3:] @ end_pose[3:]) / np.linalg.norm(start_pose[3:]) / np.linalg.norm(end_pose[3:])
+    return np.linalg.norm(end_pose[:3] - start_pose[:3]), np.degrees(2 * np.arccos(min(cos, 1.)))
+
+
+def interpolate_poses(start_pose, end_pose, s):
+    """ Poses [n x 7] of the path at the fractions s [n] (0 is the start, 1 is the end). """
+    start_pose, end_pose = np.asarray(start_pose, dtype=float), np.asarray(end_pose, dtype=float)
+    s = np.asarray(s, dtype=float)
+    poses = np.empty((s.size, 7))
+    poses[:, :3] = start_pose[:3] + s[:, None] * (end_pose[:3] - start_pose[:3])
+    poses[:, 3:] = slerp_array(start_pose[3:], end_pose[3:], s)
+    return poses
+
+
+def sample_path(start_pose, end_pose, step=DEFAULT_SAMPLE_STEP, angle_step=DEFAULT_ANGLE_STEP):
+    """ Fractions [n] and poses [n x 7] of the path samples, the start and the end included. """
+    distance, angle = path_length(start_pose, end_pose)
+    n = max(int(np.ceil(distance / step)), int(np.ceil(angle / angle_step)), 1) + 1
+    s = np.linspace(0, 1, n)
+    return s, interpolate_poses(start_pose, end_pose, s)
+
+
+def _wrapped(angles):
+    return (angles + 180) % 360 - 180
+
+
+def _track_branches(candidates, start_angles):
+    """ Angles [n x 6] taking the branch nearest to the previous sample. """
+    angles = np.empty(candidates.shape[::2])
+    previous = start_angles
+    for k in range(candidates.shape[0]):
+        distances = np.abs(_wrapped(candidates[k] - previous)).max(axis=-1)
+        previous = angles[k] = candidates[k, np.nanargmin(distances)]
+    return angles
+
+
+def solve_path(poses, start_angles, limits=None, max_step=MAX_SAMPLE_STEP):
+    """ Joint angles [n x 6] of the path poses [n x 7] moving continuously from start_angles [6] (degrees).
+    Raises ValueError if a sample is unreachable or the joints jump (a singularity).
+    """
+
+    start_angles = np.asarray(start_angles, dtype=float)
+    candidates, reachable = solve_forward_batch(poses[:1])
+    if not reachable[0]:
+        raise ValueError('Linear move start is unreachable')
+    # only the branch of the start is solved while it is continuous
+    branch = int(np.nanargmin(np.abs(_wrapped(candidates[0] - start_angles)).max(axis=-1)))
+    angles = solve_forward_batch(poses, branch=branch)[0][:, 0]
+    steps = np.abs(_wrapped(np.diff(angles, axis=0)))
+    if np.isnan(angles).any() or steps.max(initial=0) > max_step:
+        candidates, reachable = solve_forward_batch(poses)
+        if not reachable.all():
+            raise ValueError(f'Linear move sample {int(np.argmin(reachable))} of {len(poses)} is unreachable')
+        angles = _track_branches(candidates, start_angles)
+    # angles continue from the start without jumps at +-180
+    angles = start_angles + np.cumsum(_wrapped(np.diff(np.vstack((start_angles, angles)), axis=0)), axis=0)
+    steps = np.abs(np.diff(angles, axis=0)).max(axis=-1)
+    if steps.max(initial=0) > max_step:
+        raise ValueError(f'Linear move passes a singularity near sample {int(np.argmax(steps))} of {len(poses)}')
+    if limits is not None:
+        limits = np.asarray(limits, dtype=float)
+        outside = ~np.all((angles >= limits[:, 0]) & (angles <= limits[:, 1]), axis=-1)
+        if outside.any():
+            raise ValueError(f'Linear move sample {int(np.argmax(outside))} of {len(poses)} is out of joint limits')
+    return angles
+
+
+def linear_move(start_pose, end_pose, start_angles, step=DEFAULT_SAMPLE_STEP, angle_step=DEFAULT_ANGLE_STEP,
+                limits=None):
+    """ Dense poses [n x 7] and joint angles [n x 6] of the linear move. """
+    _, poses = sample_path(start_pose, end_pose, step, angle_step)
+    return poses, solve_path(poses, start_angles, limits)
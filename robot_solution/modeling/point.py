@@ -1,19 +1,45 @@
+from collections import namedtuple
 import numpy as np
-from PyQt5 import QtWidgets
 
+from robot_solution.instrumentation import timed
+from robot_solution.modeling.cache import KinematicsCache
 from robot_solution.modeling.transform import myquat2rotm
 from robot_solution.modeling.solution import solve_straight as solve_straight_imported, solve_forward
 
+# result of the forward solution: error is None if solved, otherwise the message
+SolveResult = namedtuple('SolveResult', ['solved', 'pose', 'error'])
+
 
 class Point:
-    """ Class that describes point, given by user."""
+    """ Class that describes point, given by user.
+    Points keep only their values (no Qt, picklable), so they are used in worker processes too.
+    """
+
+    __slots__ = ('_pose', '_angles', 'given_by_pose', 'solved', 'error')
+
+    # solutions shared by all points: angles -> pose and pose -> angles
+    straight_cache = KinematicsCache()
+    forward_cache = KinematicsCache()
 
     def __init__(self):
         # init point value corresponds to the init position of the robot with zero joint angles.
         self._pose = None  # x, y, z, quat1, quat2, quat3, quat4
+        self.given_by_pose = False  # angles are one of the forward solutions of the pose, not given by user
         # look angles.setter
         self.angles = np.array([0] * 6)  # joint angles 1..6
         self.solved = False
+        self.error = None  # error of the last forward solution
+
+    @classmethod
+    def from_state(cls, pose, angles, given_by_pose=False):
+        """ Point with the known pose and joint angles, nothing is solved. """
+        point = cls.__new__(cls)
+        point._pose = np.array(pose, dtype=float)
+        point._angles = np.array(angles, dtype=float)
+        point.given_by_pose = given_by_pose
+        point.solved = True
+        point.error = None
+        return point
 
     @property
     def pose(self):
@@ -32,32 +58,52 @@ class Point:
     @angles.setter
     def angles(self, value):
         self._angles = value
+        self.given_by_pose = False
         self.solve_straight()
 
+    @timed('kinematics.straight')
     def solve_straight(self):
         """ Solves straight task and updates values. The solution always exists.
         Backlash angles are supposed to be equal to 0. TODO: if not"""
-        pose = solve_straight_imported(np.hstack([self._angles, 0 * self._angles]))
+        pose = self.straight_cache.get(self._angles)
+        if pose is None:
+            pose = solve_straight_imported(np.hstack([self._angles, 0 * self._angles]))
+            self.straight_cache.put(self._angles, pose)
         self._pose = pose
 
+    @timed('kinematics.forward')
     def try_solve_forward(self, pose):
         """ Solves forward kinematic problem and updates values in case the solution exists.
+        Returns SolveResult, the values are kept if the pose is unreachable.
         """
 
         try:
-            pos_coord, quat = pose[:3], pose[3:]
-            orient_matrix = myquat2rotm(quat)
-            all_solutions_deg, _, _, _ = solve_forward(pos_coord, orient_matrix)
-            # TODO: concrete selection of angles solution
-            angles_value = all_solutions_deg[0, :]  # choose the first solution
-            self._angles = angles_value
-            self._pose = pose
-            self.solved = True
+            angles_value = self.forward_cache.get(pose)
+            if angles_value is None:
+                pos_coord, quat = pose[:3], pose[3:]
+                orient_matrix = myquat2rotm(quat)
+                all_solutions_deg, _, _, _ = solve_forward(pos_coord, orient_matrix)
+                # the first solution, the track branches are selected by robot_solution.modeling.branches
+                angles_value = all_solutions_deg[0, :]
+                self.forward_cache.put(pose, angles_value)
         except Exception as ex:
-            if ex != 'maximum recursion depth exceeded':
-                pose[:3] = pose[:3] * 1000
-                error_dialog = QtWidgets.QMessageBox()
-                error_dialog.setWindowTitle("Ошибка")
-                error_dialog.setText(f"Точка ({', '.join(list(map(str, pose)))}) недостижима!")
-                error_dialog.setIcon(QtWidgets.QMessageBox.Warning)
-                error_dialog.exec_()
+            self.error = str(ex) or type(ex).__name__
+            return SolveResult(False, pose, self.error)
+        self._angles = angles_value
+        self._pose = pose
+        self.given_by_pose = True
+        self.solved = True
+        self.error = None
+        return SolveResult(True, pose, None)
+
+    @classmethod
+    def configure_cache(cls, max_size=None, pose_tolerance=None, angles_tolerance=None):
+        """ Sets size and tolerances of the solution caches: pose tolerance in m (and quaternion units),
+        angles tolerance in degrees. """
+        cls.forward_cache.configure(max_size, pose_tolerance)
+        cls.straight_cache.configure(max_size, angles_tolerance)
+
+    @classmethod
+    def cache_stats(cls):
+        """ Returns hit/miss statistics of the solution caches. """
+        return {'straight': cls.straight_cache.stats(), 'forward': cls.forward_cache.stats()}
@@ -0,0 +1,208 @@
+""" Workspace reachability index.
+
+The index marks bins of tool poses reached by random joint states within the robot joint limits.
+A pose bin is a cubic voxel of the tool position and a bin of the tool approach direction
+(tool z axis, polar x azimuth angle bins), the rotation about the approach is not binned.
+The index is built offline by the batch straight solution and stored as packed bits:
+    python -m robot_solution.modeling.reachability --samples 4000000
+Queries take microseconds and need no forward solution. The answer is a hint: sampling can miss
+bins at the workspace boundary (the reached bins are dilated by one bin, but the misses are not
+bounded), so a negative answer means the pose is probably unreachable and a positive one still has
+to be confirmed by the forward solution. The index keeps the fingerprint of the robot geometry and
+the joint limits it was built for and is not used with other ones.
+"""
+
+import argparse
+import functools
+import hashlib
+import math
+import os
+import numpy as np
+
+from robot_solution.modeling.chain import get_chain
+from robot_solution.modeling.limits import get_joint_limits
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reachability.npz')
+DEFAULT_VOXEL = 0.1  # m
+DEFAULT_POLAR_BINS = 4
+DEFAULT_AZIMUTH_BINS = 8
+DEFAULT_SAMPLES = 4000000
+CHUNK_SIZE = 100000  # joint states solved at once
+INDEX_VERSION = 2
+GEOMETRY_DECIMALS = 6  # rounding of the chain geometry in its fingerprint, m
+
+
+def approach_bins(quat, n_polar, n_azimuth):
+    """ Numbers of the approach direction bins of quaternions [..., 4]. """
+    quat = np.asarray(quat, dtype=float)
+    w, x, y, z = np.moveaxis(quat / np.linalg.norm(quat, axis=-1, keepdims=True), -1, 0)
+    # the third column of the rotation matrix
+    polar = np.arccos(np.clip(1 - 2 * (x * x + y * y), -1, 1))
+    azimuth = np.arctan2(2 * (y * z - w * x), 2 * (x * z + w * y))
+    polar_bin = np.minimum((polar / np.pi * n_polar).astype(int), n_polar - 1)
+    azimuth_bin = np.minimum(((azimuth + np.pi) / (2 * np.pi) * n_azimuth).astype(int), n_azimuth - 1)
+    return polar_bin * n_azimuth + azimuth_bin
+
+
+def chain_reach(chain):
+    """ Upper bound of the tool distance from the base origin, m.
+    Distances between consecutive joint axis points do not change with joint angles. """
+    points = np.vstack((chain.points, chain.home[:3, 3]))
+    return np.linalg.norm(points[0]) + np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+
+
+def chain_fingerprint(chain):
+    """ Hash of the joint axes, their points and the tool pose at zero joint angles. """
+    digest = hashlib.sha256()
+    for values in (chain.axes, chain.points, chain.home):
+        # + 0. turns -0. into 0.
+        digest.update((np.round(np.asarray(values, dtype=float), GEOMETRY_DECIMALS) + 0.).tobytes())
+    return digest.hexdigest()
+
+
+def _dilate(mask, axis, wrap=False):
+    """ Marks the neighbours of the marked bins along the axis. """
+    result = mask.copy()
+    for shift in (-1, 1):
+        shifted = np.roll(mask, shift, axis=axis)
+        if not wrap:
+            edge = [slice(None)] * mask.ndim
+            edge[axis] = 0 if shift == 1 else -1
+            shifted[tuple(edge)] = False
+        result |= shifted
+    return result
+
+
+class ReachabilityIndex:
+    """ Packed bits of the reached bins [nx x ny x nz x n_polar x n_azimuth]. """
+
+    def __init__(self, bits, shape, origin, voxel, limits=None, geometry=''):
+        self.bits = bits  # packed bits, uint8
+        self.shape = tuple(int(n) for n in shape)
+        self.origin = np.asarray(origin, dtype=float)  # the corner of the voxel grid, m
+        self.voxel = float(voxel)
+        self.limits = None if limits is None else np.asarray(limits, dtype=float)  # sampled joint limits [6 x 2]
+        self.geometry = str(geometry)  # chain_fingerprint of the robot
+        self._strides = np.array([int(np.prod(self.shape[k + 1:])) for k in range(len(self.shape))])
+        # python numbers are faster than numpy scalars in the scalar query
+        self._origin = self.origin.tolist()
+        self._scalar_strides = self._strides.tolist()
+
+    @classmethod
+    def build(cls, samples=DEFAULT_SAMPLES, voxel=DEFAULT_VOXEL, n_polar=DEFAULT_POLAR_BINS,
+              n_azimuth=DEFAULT_AZIMUTH_BINS, limits=None, seed=0, chunk_size=CHUNK_SIZE):
+        """ Builds the index by the tool poses of random joint states within limits [6 x 2] (degrees),
+        the robot joint limits by default.
+        """
+
+        chain = get_chain()
+        reach = chain_reach(chain)
+        n_voxels = int(math.ceil(2 * reach / voxel))
+        limits = get_joint_limits() if limits is None else np.asarray(limits, dtype=float)
+        index = cls(None, (n_voxels,) * 3 + (n_polar, n_azimuth), -reach * np.ones(3), voxel, limits,
+                    chain_fingerprint(chain))
+        random = np.random.RandomState(seed)
+        mask = np.zeros(index.shape, dtype=bool)
+        for start in range(0, samples, chunk_size):
+            angles = random.uniform(limits[:, 0], limits[:, 1], (min(chunk_size, samples - start), 6))
+            _, poses = chain.straight(angles)
+            mask.reshape(-1)[index.flat_bins(poses)] = True
+        for axis in range(mask.ndim):
+            mask = _dilate(mask, axis, wrap=axis == mask.ndim - 1)
+        index.bits = np.packbits(mask.reshape(-1))
+        return index
+
+    def flat_bins(self, poses):
+        """ Flat bin numbers of poses [N x 7], -1 for poses out of the grid or with zero quaternions. """
+        poses = np.atleast_2d(poses)
+        voxels = np.floor((poses[:, :3] - self.origin) / self.voxel).astype(int)
+        oriented = np.linalg.norm(poses[:, 3:], axis=1) > 0
+        inside = np.all((voxels >= 0) & (voxels < self.shape[0]), axis=1) & oriented
+        orientation = approach_bins(np.where(oriented[:, None], poses[:, 3:], [1., 0., 0., 0.]), *self.shape[3:])
+        bins = voxels @ self._strides[:3] + orientation
+        return np.where(inside, bins, -1)
+
+    def query(self, poses):
+        """ Mask of the possibly reachable poses [N x 7]. """
+        bins = self.flat_bins(poses)
+        safe = np.maximum(bins, 0)
+        reached = (self.bits[safe >> 3] >> (7 - (safe & 7))) & 1
+        return (bins >= 0) & (reached == 1)
+
+    def contains(self, pose):
+        """ Whether a single pose [7] is possibly reachable (scalar fast path of query). """
+        values = pose.tolist() if isinstance(pose, np.ndarray) else list(pose)
+        w, x, y, z = values[3:]
+        norm = math.sqrt(w * w + x * x + y * y + z * z)
+        if not norm > 0:  # zero quaternion is no orientation
+            return False
+        w, x, y, z = w / norm, x / norm, y / norm, z / norm
+        flat = 0
+        for k in range(3):
+            voxel = math.floor((values[k] - self._origin[k]) / self.voxel)
+            if not 0 <= voxel < self.shape[k]:
+                return False
+            flat += voxel * self._scalar_strides[k]
+        n_polar, n_azimuth = self.shape[3:]
+        polar = math.acos(max(-1., min(1., 1 - 2 * (x * x + y * y))))
+        azimuth = math.atan2(2 * (y * z - w * x), 2 * (x * z + w * y))
+        flat += min(int(polar / math.pi * n_polar), n_polar - 1) * n_azimuth
+        flat += min(int((azimuth + math.pi) / (2 * math.pi) * n_azimuth), n_azimuth - 1)
+        return bool((self.bits[flat >> 3] >> (7 - (flat & 7))) & 1)
+
+    def reachable_positions(self):
+        """ Centers of the voxels reached with any approach direction [k x 3], m. """
+        mask = np.unpackbits(self.bits, count=int(np.prod(self.shape))).reshape(self.shape)
+        voxels = np.argwhere(mask.any(axis=(3, 4)))
+        return self.origin + (voxels + 0.5) * self.voxel
+
+    def save(self, path=DEFAULT_PATH):
+        np.savez_compressed(path, bits=self.bits, shape=self.shape, origin=self.origin, voxel=self.voxel,
+                            limits=self.limits, geometry=self.geometry, version=INDEX_VERSION)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with np.load(path) as data:
+            if int(data['version']) != INDEX_VERSION:
+                raise ValueError(f'{path}: reachability index version {int(data["version"])} '
+                                 f'instead of {INDEX_VERSION}')
+            return cls(data['bits'], data['shape'], data['origin'], data['voxel'], data['limits'],
+                       data['geometry'])
+
+    def matches(self, chain, limits):
+        """ Whether the index was built for the chain geometry and the joint limits [6 x 2]. """
+        return self.geometry == chain_fingerprint(chain) and self.limits is not None and \
+            self.limits.shape == np.shape(limits) and np.allclose(self.limits, limits)
+
+
+@functools.lru_cache(maxsize=None)
+def get_reachability_index(path=DEFAULT_PATH):
+    """ Returns the index loaded on the first call or None if it is not built
+    or built for other robot geometry or joint limits.
+    """
+
+    try:
+        index = ReachabilityIndex.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return index if index.matches(get_chain(), get_joint_limits()) else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m robot_solution.modeling.reachability',
+                                     description='Builds the workspace reachability index.')
+    parser.add_argument('-o', '--output', default=DEFAULT_PATH, help='index file')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='number of random joint states')
+    parser.add_argument('--voxel', type=float, default=DEFAULT_VOXEL, help='voxel size, m')
+    parser.add_argument('--polar-bins', type=int, default=DEFAULT_POLAR_BINS)
+    parser.add_argument('--azimuth-bins', type=int, default=DEFAULT_AZIMUTH_BINS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    index = ReachabilityIndex.build(args.samples, args.voxel, args.polar_bins, args.azimuth_bins, seed=args.seed)
+    index.save(args.output)
+    print(f'Index {index.shape} saved to {args.output}: {index.bits.nbytes / 2 ** 20:.1f} MB packed, '
+          f'reachable voxels: {len(index.reachable_positions())}')
+
+
+if __name__ == '__main__':
+    main()
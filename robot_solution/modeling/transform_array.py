@@ -0,0 +1,85 @@
+""" Array versions of the orientation transforms.
+
+Every function accepts a single value or a stack of values along the leading
+axes and keeps the conventions of robot_solution.modeling.transform:
+quaternions are scalar-first (quat1 is the scalar part), Euler angles are
+the ZYX sequence in degrees (eiler1 is the rotation about z).
+tests.test_orientation_arrays checks the conventions against the scalar functions.
+"""
+
+import numpy as np
+
+
+def quat2rotm_array(quat):
+    """ Converts quaternions [..., 4] to rotation matrices [..., 3, 3]. """
+    quat = np.asarray(quat, dtype=float)
+    quat = quat / np.linalg.norm(quat, axis=-1, keepdims=True)
+    w, x, y, z = np.moveaxis(quat, -1, 0)
+    rotm = np.empty(quat.shape[:-1] + (3, 3))
+    rotm[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    rotm[..., 0, 1] = 2 * (x * y - w * z)
+    rotm[..., 0, 2] = 2 * (x * z + w * y)
+    rotm[..., 1, 0] = 2 * (x * y + w * z)
+    rotm[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    rotm[..., 1, 2] = 2 * (y * z - w * x)
+    rotm[..., 2, 0] = 2 * (x * z - w * y)
+    rotm[..., 2, 1] = 2 * (y * z + w * x)
+    rotm[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return rotm
+
+
+def rotm2quat_array(rotm):
+    """ Converts rotation matrices [..., 3, 3] to quaternions [..., 4] with non-negative scalar part. """
+    rotm = np.asarray(rotm, dtype=float)
+    m = [[rotm[..., i, j] for j in range(3)] for i in range(3)]
+    # 4 * squared components, the largest one gives the best conditioned formula
+    squares = np.stack([1 + m[0][0] + m[1][1] + m[2][2], 1 + m[0][0] - m[1][1] - m[2][2],
+                        1 - m[0][0] + m[1][1] - m[2][2], 1 - m[0][0] - m[1][1] + m[2][2]], axis=-1)
+    largest = np.argmax(squares, axis=-1)[..., None]
+    # 4 * (largest component) * (every component)
+    diffs = [m[2][1] - m[1][2], m[0][2] - m[2][0], m[1][0] - m[0][1]]
+    sums = [m[0][1] + m[1][0], m[0][2] + m[2][0], m[1][2] + m[2][1]]
+    products = np.stack([
+        np.stack([squares[..., 0], diffs[0], diffs[1], diffs[2]], axis=-1),
+        np.stack([diffs[0], squares[..., 1], sums[0], sums[1]], axis=-1),
+        np.stack([diffs[1], sums[0], squares[..., 2], sums[2]], axis=-1),
+        np.stack([diffs[2], sums[1], sums[2], squares[..., 3]], axis=-1)], axis=-2)
+    products = np.take_along_axis(products, largest[..., None], axis=-2)[..., 0, :]
+    quat = products / (2 * np.sqrt(np.take_along_axis(squares, largest, axis=-1)))
+    return quat * np.where(quat[..., :1] < 0, -1, 1)
+
+
+def quat2eiler_array(quat):
+    """ Converts quaternions [..., 4] to Euler angles [..., 3], degrees. """
+    quat = np.asarray(quat, dtype=float)
+    quat = quat / np.linalg.norm(quat, axis=-1, keepdims=True)
+    w, x, y, z = np.moveaxis(quat, -1, 0)
+    sin_y = np.clip(-2 * (x * z - w * y), -1, 1)
+    eiler = np.stack([np.arctan2(2 * (x * y + w * z), w * w + x * x - y * y - z * z),
+                      np.arcsin(sin_y),
+                      np.arctan2(2 * (y * z + w * x), w * w - x * x - y * y + z * z)], axis=-1)
+    return np.degrees(eiler)
+
+
+def eiler2quat_array(eiler):
+    """ Converts Euler angles [..., 3] (degrees) to quaternions [..., 4]. """
+    z, y, x = np.moveaxis(np.radians(np.asarray(eiler, dtype=float)) / 2, -1, 0)
+    cz, sz, cy, sy, cx, sx = np.cos(z), np.sin(z), np.cos(y), np.sin(y), np.cos(x), np.sin(x)
+    return np.stack([cz * cy * cx + sz * sy * sx, cz * cy * sx - sz * sy * cx,
+                     cz * sy * cx + sz * cy * sx, sz * cy * cx - cz * sy * sx], axis=-1)
+
+
+def slerp_array(quat1, quat2, t):
+    """ Spherical linear interpolation from quaternion quat1 [4] to quat2 [4] at t [n] in 0..1 [n x 4].
+    The shorter arc is taken (quat2 is negated if needed). """
+    quat1 = np.asarray(quat1, dtype=float) / np.linalg.norm(quat1)
+    quat2 = np.asarray(quat2, dtype=float) / np.linalg.norm(quat2)
+    t = np.asarray(t, dtype=float)[..., None]
+    cos = quat1 @ quat2
+    if cos < 0:
+        quat2, cos = -quat2, -cos
+    if cos > 1 - 1e-9:
+        quat = quat1 + t * (quat2 - quat1)
+        return quat / np.linalg.norm(quat, axis=-1, keepdims=True)
+    angle = np.arccos(cos)
+    return (np.sin((1 - t) * angle) * quat1 + np.sin(t * angle) * quat2) / np.sin(angle)
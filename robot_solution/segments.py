@@ -0,0 +1,120 @@
+""" Segment-wise trajectory computation.
+
+A track is simulated segment by segment, a segment is the point-to-point move between
+two consecutive waypoints. If the robot stops at every waypoint, a segment starts in
+the final state of the previous one and the simulation rows of the whole track are
+the rows of its segments joined at the waypoints (the times of the TIME_COLUMN continued).
+This is checked once per process on a test track (segments_match_solver), the whole
+track is simulated at once if the joined rows differ.
+
+The rows of a segment depend only on its waypoints, so they are cached by the pair of
+waypoints: an edited point makes only its neighbouring segments to be recomputed.
+Linear moves (robot_solution.modeling.linear) are timed by robot_solution.timing with the given
+joint limits and not cached, their batch solution is fast enough to repeat.
+"""
+
+import functools
+import numpy as np
+
+from robot_solution import instrumentation
+from robot_solution.instrumentation import timed
+from robot_solution.modeling.cache import KinematicsCache
+from robot_solution.timing import TIME_COLUMN, linear_segment_angles, simulation_rows
+
+SEGMENT_CACHE_SIZE = 1024  # number of stored segments
+SEGMENT_CACHE_BYTES = 256 * 2 ** 20  # total size of the stored segment rows, 256 MB
+SEGMENT_TOLERANCE = 1e-9  # quantization step of the waypoint angles, degrees
+# joint angles of the track checking the joined segments against the whole track, degrees
+CHECK_TRACK = np.array([[0., 0, 0, 0, 0, 0], [30, -20, 25, 40, -30, 60], [-20, 15, -10, -50, 35, -40]])
+CHECK_TOL = 1e-6  # allowed difference of the joined rows
+
+
+def create_segment_cache(max_size=SEGMENT_CACHE_SIZE, max_bytes=SEGMENT_CACHE_BYTES):
+    """ LRU cache of segment rows keyed by the waypoints pair, bounded by the number of segments
+    and their total size (long segments take many rows). """
+    return KinematicsCache(max_size=max_size, tolerance=SEGMENT_TOLERANCE, max_bytes=max_bytes)
+
+
+@timed('trajectory.segment')
+def get_segment(start, end):
+    """ Simulation rows of the move between two waypoints (joint angles [6]). """
+    # the solver is loaded on the first computation, not on the application startup
+    from robot_solution.trajectory import get_trajectory
+    return get_trajectory(np.vstack((start, end)))
+
+
+def get_cached_segment(start, end, cache=None):
+    """ Simulation rows of the move taken from the cache or computed and stored. """
+    if cache is None:
+        return get_segment(start, end)
+    key = np.hstack((start, end))
+    rows = cache.get(key)
+    if rows is None:
+        instrumentation.count('segments.cache_miss')
+        rows = get_segment(start, end)
+        cache.put(key, rows)
+    else:
+        instrumentation.count('segments.cache_hit')
+    return rows
+
+
+@functools.lru_cache(maxsize=None)
+def segments_match_solver():
+    """ Whether the rows of CHECK_TRACK joined from its segments are the rows of the whole track. """
+    from robot_solution.trajectory import get_trajectory
+    full = get_trajectory(CHECK_TRACK)
+    joined = np.vstack(list(_iter_segments(CHECK_TRACK)))
+    return full.shape == joined.shape and np.allclose(joined, full, rtol=0, atol=CHECK_TOL)
+
+
+def _whole_track(track, linear=None):
+    """ Whether the track [n x 6] is simulated at once, not by segments. Linear moves need segments. """
+    return len(track) < 2 or (linear is None or not np.any(linear)) and not segments_match_solver()
+
+
+def iter_trajectory(track, cache=None, poses=None, linear=None, time_limits=None):
+    """ Streaming mode of get_trajectory: yields simulation rows of the waypoints track [n x 6]
+    segment by segment (or all rows at once, see segments_match_solver).
+    The first row of every next segment repeats the waypoint and is dropped, its times continue
+    the times of the previous one. Segments are reused from the cache (create_segment_cache) if given.
+    Segments ending at the points marked in linear [n] are linear moves between the poses [n x 7],
+    timed by time_limits (velocity, acceleration and jerk [6] of the joints, the defaults of timing if None).
+    """
+
+    track = np.asarray(track, dtype=float)
+    if _whole_track(track, linear):
+        from robot_solution.trajectory import get_trajectory
+        yield get_trajectory(track)
+        return
+    yield from _iter_segments(track, cache, poses, linear, time_limits)
+
+
+def _iter_segments(track, cache=None, poses=None, linear=None, time_limits=None):
+    """ Simulation rows of the segments of the track [n x 6], n >= 2, joined at the waypoints. """
+    elapsed, start = 0., track[0]
+    for k in range(track.shape[0] - 1):
+        if linear is not None and linear[k + 1]:
+            # the next segment starts from the angles the joints come to along the line
+            times, angles = linear_segment_angles(poses[k], poses[k + 1], start, *(time_limits or ()))
+            rows, start = simulation_rows(times, angles), angles[-1]
+        else:
+            rows, start = get_cached_segment(start, track[k + 1], cache), track[k + 1]
+        # cached rows are shared, the shifted times go to a copy
+        shift = elapsed - rows[0, TIME_COLUMN]
+        elapsed = rows[-1, TIME_COLUMN] + shift
+        if k == 0:
+            yield rows if shift == 0 else _shifted(rows, shift)
+        else:
+            yield _shifted(rows[1:], shift)
+
+
+def _shifted(rows, shift):
+    """ Copy of the rows with the times shifted. """
+    rows = rows.copy()
+    rows[:, TIME_COLUMN] += shift
+    return rows
+
+
+def count_segments(track, linear=None):
+    """ Number of chunks yielded by iter_trajectory (the first call checks the solver). """
+    return 1 if _whole_track(track, linear) else len(track) - 1
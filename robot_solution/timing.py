@@ -0,0 +1,219 @@
+""" Time-optimal timing of the track under joint velocity, acceleration and jerk limits.
+
+The robot stops at every waypoint, so every segment is a rest-to-rest move. Every joint gets its
+minimal time jerk-limited profile (7 phases: jerk up, constant acceleration, jerk down, cruise
+and the mirrored deceleration), the segment lasts as long as the slowest joint and the profiles of
+other joints are stretched in time to arrive together. Stretching only lowers velocity,
+acceleration and jerk, so the timing stays feasible and no segment can be shorter.
+
+Linear segments (robot_solution.modeling.linear) move the tool along the straight line: the path
+parameter gets the jerk-limited profile of the tool travel and rotation, and the move is slowed down
+uniformly if the joints exceed their velocity or acceleration limits on the way.
+"""
+
+import json
+import numpy as np
+
+from robot_solution.instrumentation import timed
+from robot_solution.modeling.columns import (SOLVER_STEP, N_COLUMNS, TIME_COLUMN, ANGLE_COLUMNS, JOINT_POS_COLUMNS,
+                                             QUAT_COLUMNS)
+from robot_solution.modeling.chain import find_joint_pos_batch
+from robot_solution.modeling.linear import path_length, interpolate_poses, solve_path
+
+# typical limits of the joints 1..6, not the limits of the robot: set them by load_time_limits
+DEFAULT_VELOCITY = np.array([180., 180., 180., 360., 360., 360.])  # degrees/s
+DEFAULT_ACCELERATION = np.array([720., 720., 720., 1440., 1440., 1440.])  # degrees/s^2
+DEFAULT_JERK = np.array([3600., 3600., 3600., 7200., 7200., 7200.])  # degrees/s^3
+# typical limits of the tool on linear moves: travel (m) and rotation (degrees)
+DEFAULT_LINEAR_LIMITS = (0.25, 1., 10.)  # m/s, m/s^2, m/s^3
+DEFAULT_ROTATION_LIMITS = (90., 360., 3600.)  # degrees/s, degrees/s^2, degrees/s^3
+
+
+def load_time_limits(path):
+    """ Reads the joint limits from the JSON {"velocity": [6], "acceleration": [6], "jerk": [6]}
+    (degrees/s, degrees/s^2, degrees/s^3). Returns (velocity, acceleration, jerk) arrays [6].
+    """
+
+    with open(path) as file:
+        values = json.load(file)
+    limits = tuple(np.asarray(values[name], dtype=float) for name in ('velocity', 'acceleration', 'jerk'))
+    for name, value in zip(('velocity', 'acceleration', 'jerk'), limits):
+        if value.shape != (6,) or not np.all(value > 0):
+            raise ValueError(f'{path}: {name} must be 6 positive values')
+    return limits
+
+
+def min_time_profile(distance, velocity, acceleration, jerk):
+    """ Minimal time rest-to-rest profile of the distance >= 0.
+    Returns durations [7] (s) and jerks [7] of its phases.
+    """
+
+    durations, jerks = np.zeros(7), np.array([jerk, 0, -jerk, 0, -jerk, 0, jerk])
+    if distance <= 0:
+        return durations, jerks
+    # acceleration phase to the peak velocity v lasts 2 tj + t_const and passes v (2 tj + t_const) / 2
+    peak = velocity
+    tj = acceleration / jerk if velocity * jerk >= acceleration ** 2 else np.sqrt(velocity / jerk)
+    if velocity * (tj + max(velocity / acceleration - tj, 0.) + tj) > distance:
+        # the peak velocity is not reached: without the constant acceleration phase
+        peak = (distance / 2 * np.sqrt(jerk)) ** (2 / 3)
+        if peak * jerk > acceleration ** 2:
+            # with the constant acceleration phase
+            ratio = acceleration / jerk
+            peak = acceleration * (-ratio + np.sqrt(ratio ** 2 + 4 * distance / acceleration)) / 2
+    if peak * jerk >= acceleration ** 2:
+        tj, t_const = acceleration / jerk, peak / acceleration - acceleration / jerk
+    else:
+        tj, t_const = np.sqrt(peak / jerk), 0.
+    cruise = max(distance / peak - (2 * tj + t_const), 0.)
+    durations[:] = [tj, t_const, tj, cruise, tj, t_const, tj]
+    return durations, jerks
+
+
+def evaluate_profile(durations, jerks, times):
+    """ Positions of the profile at times [M] (from 0, clipped to the profile duration). """
+    bounds = np.concatenate(([0.], np.cumsum(durations)))
+    # position, velocity and acceleration at the phase starts
+    state = np.zeros((8, 3))
+    for k in range(7):
+        p, v, a = state[k]
+        t, j = durations[k], jerks[k]
+        state[k + 1] = [p + v * t + a * t ** 2 / 2 + j * t ** 3 / 6, v + a * t + j * t ** 2 / 2, a + j * t]
+    times = np.clip(times, 0, bounds[-1])
+    phase = np.clip(np.searchsorted(bounds, times, side='right') - 1, 0, 6)
+    dt = times - bounds[phase]
+    p, v, a = state[phase].T
+    return p + v * dt + a * dt ** 2 / 2 + jerks[phase] * dt ** 3 / 6
+
+
+def segment_profiles(start, end, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION,
+                     jerk=DEFAULT_JERK):
+    """ Minimal time profiles of the joints between waypoints [6]: list of (durations, jerks). """
+    distances = np.abs(np.asarray(end, dtype=float) - np.asarray(start, dtype=float))
+    return [min_time_profile(*limits) for limits in zip(distances, velocity, acceleration, jerk)]
+
+
+def segment_duration(start, end, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION,
+                     jerk=DEFAULT_JERK):
+    """ Minimal time of the move between waypoints, s. """
+    return max(durations.sum() for durations, _ in segment_profiles(start, end, velocity, acceleration, jerk))
+
+
+def cycle_time(track, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION, jerk=DEFAULT_JERK,
+               poses=None, linear=None):
+    """ Minimal time of the track [n x 6] (degrees) and durations of its segments [n - 1], s.
+    Segments ending at the points marked in linear [n] are linear moves between the poses [n x 7].
+    """
+
+    track = np.asarray(track, dtype=float)
+    durations = []
+    start = track[0] if track.shape[0] else None
+    for k in range(track.shape[0] - 1):
+        if linear is not None and linear[k + 1]:
+            times, angles = linear_segment_angles(poses[k], poses[k + 1], start, velocity, acceleration, jerk)
+            durations.append(times[-1])
+            start = angles[-1]
+        else:
+            durations.append(segment_duration(start, track[k + 1], velocity, acceleration, jerk))
+            start = track[k + 1]
+    durations = np.array(durations)
+    return durations.sum(), durations
+
+
+@timed('trajectory.time_optimal_segment')
+def segment_angles(start, end, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION,
+                   jerk=DEFAULT_JERK, step=SOLVER_STEP):
+    """ Joint angles [M x 6] of the move sampled by the step, from start to end inclusive. """
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    profiles = segment_profiles(start, end, velocity, acceleration, jerk)
+    joint_times = np.array([durations.sum() for durations, _ in profiles])
+    duration = joint_times.max()
+    times = np.append(np.arange(0, duration, step), duration) if duration > 0 else np.zeros(1)
+    angles = np.tile(start, (times.size, 1))
+    direction = np.sign(end - start)
+    for j, (durations, jerks) in enumerate(profiles):
+        if joint_times[j] > 0:
+            # stretched profile: the joint arrives together with the slowest one
+            angles[:, j] += direction[j] * evaluate_profile(durations, jerks, times * joint_times[j] / duration)
+    angles[-1] = end
+    return times, angles
+
+
+def path_profile(start_pose, end_pose, linear_limits=DEFAULT_LINEAR_LIMITS,
+                 rotation_limits=DEFAULT_ROTATION_LIMITS):
+    """ Minimal time profile of the linear move: durations [7], jerks [7] and the length of the profile.
+    The tool travel or rotation, whichever is slower, gives the profile; the other one follows it in proportion.
+    """
+
+    distance, angle = path_length(start_pose, end_pose)
+    profiles = [min_time_profile(distance, *linear_limits) + (distance,),
+                min_time_profile(angle, *rotation_limits) + (angle,)]
+    return max(profiles, key=lambda profile: profile[0].sum())
+
+
+@timed('trajectory.linear_segment')
+def linear_segment_angles(start_pose, end_pose, start_angles, velocity=DEFAULT_VELOCITY,
+                          acceleration=DEFAULT_ACCELERATION, jerk=DEFAULT_JERK, step=SOLVER_STEP,
+                          linear_limits=DEFAULT_LINEAR_LIMITS, rotation_limits=DEFAULT_ROTATION_LIMITS):
+    """ Times [M] and joint angles [M x 6] of the linear move from start_pose to end_pose [7] sampled by the step.
+    The joints start from start_angles [6] and keep their branch (see robot_solution.modeling.linear.solve_path).
+    """
+
+    durations, jerks, length = path_profile(start_pose, end_pose, linear_limits, rotation_limits)
+    duration = durations.sum()
+    times = np.append(np.arange(0, duration, step), duration) if duration > 0 else np.zeros(1)
+    fractions = evaluate_profile(durations, jerks, times) / length if length > 0 else np.zeros(times.size)
+    angles = solve_path(interpolate_poses(start_pose, end_pose, fractions), start_angles)
+    if times.size < 3:
+        return times, angles
+    # the joints speed up near singularities: the whole move is slowed down to their limits
+    joint_velocity = np.abs(np.diff(angles, axis=0)).max(axis=0) / step
+    joint_acceleration = np.abs(np.diff(angles, 2, axis=0)).max(axis=0) / step ** 2
+    slowdown = max(1., (joint_velocity / velocity).max(), np.sqrt((joint_acceleration / acceleration).max()))
+    if slowdown > 1:
+        duration *= slowdown
+        times = np.append(np.arange(0, duration, step), duration)
+        fractions = evaluate_profile(durations, jerks, times / slowdown) / length
+        angles = solve_path(interpolate_poses(start_pose, end_pose, fractions), start_angles)
+    return times, angles
+
+
+def simulation_rows(times, angles):
+    """ Simulation rows [M x N_COLUMNS] of the timed joint angles: time, angles, joint positions
+    and tool quaternion. Columns not given by the kinematic model are zero. """
+    rows = np.zeros((times.size, N_COLUMNS))
+    joint_pos, poses = find_joint_pos_batch(angles)
+    rows[:, TIME_COLUMN] = times
+    rows[:, ANGLE_COLUMNS] = angles
+    rows[:, JOINT_POS_COLUMNS] = joint_pos.transpose(0, 2, 1).reshape(times.size, -1)
+    rows[:, QUAT_COLUMNS] = poses[:, 3:]
+    return rows
+
+
+def iter_time_optimal(track, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION, jerk=DEFAULT_JERK,
+                      step=SOLVER_STEP, poses=None, linear=None):
+    """ Time-optimal mode of robot_solution.segments.iter_trajectory: yields simulation rows
+    of the track [n x 6] segment by segment, the first row of every next segment is dropped.
+    Segments ending at the points marked in linear [n] are linear moves between the poses [n x 7],
+    the next segment starts from the joint angles the linear move ends with.
+    """
+
+    track = np.asarray(track, dtype=float)
+    if track.shape[0] < 2:
+        yield simulation_rows(np.zeros(track.shape[0]), track)
+        return
+    elapsed, start = 0., track[0]
+    for k in range(track.shape[0] - 1):
+        if linear is not None and linear[k + 1]:
+            times, angles = linear_segment_angles(poses[k], poses[k + 1], start, velocity, acceleration, jerk, step)
+        else:
+            times, angles = segment_angles(start, track[k + 1], velocity, acceleration, jerk, step)
+        rows = simulation_rows(times + elapsed, angles)
+        elapsed, start = elapsed + times[-1], angles[-1]
+        yield rows if k == 0 else rows[1:]
+
+
+def get_time_optimal_trajectory(track, velocity=DEFAULT_VELOCITY, acceleration=DEFAULT_ACCELERATION,
+                                jerk=DEFAULT_JERK, step=SOLVER_STEP, poses=None, linear=None):
+    """ Simulation rows of the whole track with the time-optimal timing. """
+    return np.vstack(list(iter_time_optimal(track, velocity, acceleration, jerk, step, poses, linear)))
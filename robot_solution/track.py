@@ -0,0 +1,133 @@
+""" Track of the waypoints.
+
+All waypoint values are kept in one gap buffer of rows: joint angles, pose, point number,
+the flag of the point given by pose and the flag of the linear move to the point.
+Appending and editing near the previous edit are amortized O(1), columns are contiguous arrays,
+so a track of many thousands of points needs no per-point objects.
+"""
+
+import numpy as np
+
+from robot_solution.buffers import GapBuffer
+from robot_solution.modeling.chain import find_joint_pos_batch
+from robot_solution.modeling.point import Point
+
+ANGLES = slice(0, 6)  # joint angles 1..6, degrees
+POSE = slice(6, 13)  # x, y, z, quat1..quat4
+NUMBER = 13  # number of the point shown to the user
+GIVEN_BY_POSE = 14  # 1 if the angles are a solution of the pose given by user
+LINEAR = 15  # 1 if the tool comes to the point by the straight line (robot_solution.modeling.linear)
+ROW_SIZE = 16
+
+
+class Track:
+    """ Waypoints of the robot track. """
+
+    def __init__(self, capacity=1024):
+        self._rows = GapBuffer((ROW_SIZE,), capacity=capacity)
+        self.last_number = 0  # numbers of deleted points are not reused
+
+    @classmethod
+    def from_rows(cls, rows, last_number=None):
+        """ Track of the rows [n x ROW_SIZE]. """
+        track = cls()
+        track._rows = GapBuffer.from_rows(np.asarray(rows, dtype=float))
+        track.last_number = int(rows[:, NUMBER].max(initial=0)) if last_number is None else last_number
+        return track
+
+    @classmethod
+    def from_angles(cls, angles, poses=None, given_by_pose=False):
+        """ Track of the joint angles [n x 6] and their poses [n x 7] (solved if not given).
+        given_by_pose: whether the angles are solutions of the poses given by user.
+        """
+
+        angles = np.asarray(angles, dtype=float).reshape(-1, 6)
+        rows = np.zeros((angles.shape[0], ROW_SIZE))
+        rows[:, ANGLES] = angles
+        rows[:, POSE] = find_joint_pos_batch(angles)[1] if poses is None else poses
+        rows[:, NUMBER] = np.arange(1, angles.shape[0] + 1)
+        rows[:, GIVEN_BY_POSE] = given_by_pose
+        return cls.from_rows(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _row(self, point, number, linear):
+        row = np.empty(ROW_SIZE)
+        row[ANGLES] = point.angles
+        row[POSE] = point.pose
+        row[NUMBER] = number
+        row[GIVEN_BY_POSE] = point.given_by_pose
+        row[LINEAR] = linear
+        return row
+
+    def append(self, point, linear=False):
+        self.insert(len(self), point, linear)
+
+    def insert(self, index, point, linear=False):
+        """ Inserts the point before the index, the point gets the next number.
+        linear: whether the tool comes to the point by the straight line.
+        """
+
+        self.last_number += 1
+        self._rows.insert(index, self._row(point, self.last_number, linear))
+
+    def replace(self, index, point, linear=None):
+        """ Replaces the point keeping its number (and its move type if linear is None). """
+        row = self._rows[index]
+        self._rows[index] = self._row(point, row[NUMBER], row[LINEAR] if linear is None else linear)
+
+    def delete(self, index):
+        self._rows.delete(index)
+
+    def clear(self):
+        self._rows.clear()
+        self.last_number = 0
+
+    def point(self, index):
+        """ Point object of the waypoint. """
+        row = self._rows[index]
+        return Point.from_state(row[POSE], row[ANGLES], bool(row[GIVEN_BY_POSE]))
+
+    def number(self, index):
+        return int(self._rows[index][NUMBER])
+
+    @property
+    def rows(self):
+        """ Contiguous rows [n x ROW_SIZE], invalidated by the next edit. """
+        return self._rows.data
+
+    @property
+    def angles(self):
+        """ Joint angles [n x 6] (a view, invalidated by the next edit). """
+        return self.rows[:, ANGLES]
+
+    @property
+    def poses(self):
+        return self.rows[:, POSE]
+
+    @property
+    def given_by_pose(self):
+        return self.rows[:, GIVEN_BY_POSE].astype(bool)
+
+    @property
+    def linear(self):
+        """ Flags of the points the tool comes to by the straight line [n]. """
+        return self.rows[:, LINEAR].astype(bool)
+
+    def is_linear(self, index):
+        return bool(self._rows[index][LINEAR])
+
+    def set_angles(self, angles):
+        """ Sets joint angles of all points, e.g. other solutions of the same poses. """
+        self.rows[:, ANGLES] = angles
+
+    def snapshot(self):
+        """ Independent copy of the track. """
+        return Track.from_rows(self.rows.copy(), self.last_number)
+
+    def __getitem__(self, index):
+        """ Point by index or a copy of the track slice. """
+        if isinstance(index, slice):
+            return Track.from_rows(self.rows[index].copy(), self.last_number)
+        return self.point(index)
@@ -0,0 +1,204 @@
+""" Content-addressed on-disk cache of computed trajectories.
+
+A trajectory is stored as a binary .npy file named by the hash of the track angles,
+solver settings and solver source, so a changed track or solver never hits a stale entry.
+The frozen application has no solver sources, its executable identifies the solver instead.
+If the solver cannot be identified, nothing is cached.
+The least recently used files are removed when the cache exceeds its size. The directory is
+created by the first stored trajectory, a cache that cannot be written only misses.
+"""
+
+import hashlib
+import importlib.util
+import os
+import sys
+import numpy as np
+
+DEFAULT_MAX_BYTES = 512 * 2 ** 20  # 512 MB
+CACHE_VERSION = 1  # changes of the stored format
+# modules computing the cached trajectories in all modes
+SOLVER_MODULES = ('robot_solution.trajectory', 'robot_solution.segments', 'robot_solution.timing',
+                  'robot_solution.modeling.linear', 'robot_solution.modeling.chain')
+
+
+def default_directory():
+    """ Per-user cache directory: %LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache otherwise. """
+    if os.name == 'nt' and os.environ.get('LOCALAPPDATA'):
+        root = os.environ['LOCALAPPDATA']
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'robot_solution', 'trajectory_cache')
+
+
+def _module_bytes(module):
+    """ Source of the module or its compiled file (an extension or a .pyc without the source),
+    None if there is no such file (a module in the archive of the frozen application).
+    The module is found without importing it.
+    """
+
+    try:
+        spec = importlib.util.find_spec(module)
+        source = spec.loader.get_source(module)
+        if source is not None:
+            return source.encode()
+        with open(spec.origin, 'rb') as file:
+            return file.read()
+    except (OSError, TypeError, AttributeError, ImportError):
+        return None
+
+
+def _executable_bytes():
+    """ Path, size and modification time of the frozen application executable or None. """
+    if not getattr(sys, 'frozen', False):
+        return None
+    try:
+        stat = os.stat(sys.executable)
+    except OSError:
+        return None
+    return f'{sys.executable} {stat.st_size} {stat.st_mtime_ns}'.encode()
+
+
+def solver_fingerprint():
+    """ Hash of the solver modules, the frozen application executable stands for the modules without files.
+    None if a module cannot be identified.
+    """
+
+    digest = hashlib.sha256(f'version {CACHE_VERSION}'.encode())
+    for module in SOLVER_MODULES:
+        data = _module_bytes(module) or _executable_bytes()
+        if data is None:
+            return None
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def track_key(track, settings=None, fingerprint=''):
+    """ Key of the trajectory: hash of the track angles [n x 6] and solver settings (dict). """
+    track = np.ascontiguousarray(track, dtype=np.float64)
+    digest = hashlib.sha256(fingerprint.encode())
+    digest.update(repr(track.shape).encode())
+    digest.update(track.tobytes())
+    digest.update(repr(sorted((settings or {}).items())).encode())
+    return digest.hexdigest()
+
+
+def compute_trajectory(track, settings=None, poses=None):
+    """ Simulation rows of the track [n x 6] computed in the mode of the settings. """
+    settings = settings or {}
+    track = np.asarray(track, dtype=float)
+    linear = None
+    if settings.get('linear'):
+        if poses is None:
+            raise ValueError('Linear moves need the track poses')
+        linear = np.zeros(track.shape[0], dtype=bool)
+        linear[settings['linear']] = True
+    if 'time_optimal' in settings:
+        from robot_solution.timing import get_time_optimal_trajectory
+        velocity, acceleration, jerk = (np.array(limits) for limits in settings['time_optimal'])
+        return get_time_optimal_trajectory(track, velocity, acceleration, jerk, poses=poses, linear=linear)
+    if settings.get('segments'):
+        from robot_solution.segments import iter_trajectory
+        time_limits = settings.get('linear_time_limits')
+        if time_limits is not None:
+            time_limits = tuple(np.array(limits) for limits in time_limits)
+        return np.vstack(list(iter_trajectory(track, poses=poses, linear=linear, time_limits=time_limits)))
+    from robot_solution.trajectory import get_trajectory
+    return get_trajectory(track)
+
+
+class TrajectoryCache:
+    """ Directory of computed trajectories with size-bounded LRU eviction.
+    It is disabled (never hits nor stores) if the solver cannot be identified.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = default_directory() if directory is None else directory
+        self.max_bytes = max_bytes
+        self.fingerprint = solver_fingerprint()
+
+    @property
+    def enabled(self):
+        return self.fingerprint is not None
+
+    def path(self, track, settings=None):
+        return os.path.join(self.directory, track_key(track, settings, self.fingerprint) + '.npy')
+
+    def get(self, track, settings=None):
+        """ Returns the stored trajectory uxSim or None. """
+        if not self.enabled:
+            return None
+        path = self.path(track, settings)
+        try:
+            uxSim = np.load(path)
+        except (OSError, ValueError):
+            return None
+        # access time is the modification time, it is not updated by all file systems
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return uxSim
+
+    def put(self, track, uxSim, settings=None):
+        """ Stores the trajectory and evicts the least recently used ones if needed.
+        Raises OSError if the cache directory cannot be written.
+        """
+
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(track, settings)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            np.save(file, np.asarray(uxSim))
+        os.replace(temp_path, path)
+        self.evict()
+
+    def trajectory(self, track, settings=None, poses=None):
+        """ Returns the stored trajectory or computes and stores it by the settings
+        (see app.trajectory_worker.TrajectoryWorker.settings). Linear moves need the track poses [n x 7].
+        """
+
+        uxSim = self.get(track, settings)
+        if uxSim is None:
+            uxSim = compute_trajectory(track, settings, poses)
+            self.put(track, uxSim, settings)
+        return uxSim
+
+    def _entries(self):
+        """ Stored files sorted from the least recently used: (path, size, time). """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        """ Total size of the stored files, bytes. """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """ Removes the least recently used files while the cache is larger than max_bytes. """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for path, _, _ in self._entries():
+            os.remove(path)
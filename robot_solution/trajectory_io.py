@@ -0,0 +1,102 @@
+""" Binary trajectory files.
+
+File layout:
+    magic b'RTRAJ001', header length (uint32, little-endian), JSON header, column data.
+The header describes rows number, data type, column names and data offset. Columns are
+stored one after another, so a memory-mapped reader touches only the columns it reads.
+"""
+
+import json
+import struct
+import numpy as np
+
+from robot_solution.modeling.columns import uxsim_columns
+
+MAGIC = b'RTRAJ001'
+EXTENSION = '.rtraj'
+ALIGNMENT = 64  # data offset alignment, bytes
+JOINT_POS_COLUMNS = [name for name in uxsim_columns() if name.startswith('joint')]
+
+
+def write_trajectory(path, uxSim, columns=None):
+    """ Writes simulation rows [T x M] to the binary file.
+    columns: M column names, names of uxSim by default.
+    """
+
+    uxSim = np.asarray(uxSim)
+    columns = uxsim_columns(uxSim.shape[1]) if columns is None else list(columns)
+    if len(columns) != uxSim.shape[1]:
+        raise ValueError(f'{len(columns)} column names for {uxSim.shape[1]} columns')
+    header = {'rows': uxSim.shape[0], 'dtype': uxSim.dtype.newbyteorder('<').str, 'columns': columns}
+    header_bytes = json.dumps(header).encode()
+    offset = len(MAGIC) + 4 + len(header_bytes)
+    header_bytes += b' ' * (-offset % ALIGNMENT)
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<I', len(header_bytes)))
+        file.write(header_bytes)
+        for k in range(uxSim.shape[1]):
+            file.write(np.ascontiguousarray(uxSim[:, k], dtype=header['dtype']).tobytes())
+
+
+class TrajectoryFile:
+    """ Lazy reader of the binary trajectory file.
+    Only the header is read on opening, the column data is memory-mapped on the first access.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a trajectory file')
+            header_length, = struct.unpack('<I', file.read(4))
+            header = json.loads(file.read(header_length).decode())
+        self.n_rows = header['rows']
+        self.dtype = np.dtype(header['dtype'])
+        self.columns = header['columns']
+        self._offset = len(MAGIC) + 4 + header_length
+        self._data = None
+        self._index = {name: k for k, name in enumerate(self.columns)}
+
+    @property
+    def shape(self):
+        return self.n_rows, len(self.columns)
+
+    @property
+    def data(self):
+        """ Memory-mapped columns [M x T]. """
+        if self._data is None:
+            self._data = np.memmap(self.path, dtype=self.dtype, mode='r', offset=self._offset,
+                                   shape=(len(self.columns), self.n_rows))
+        return self._data
+
+    def column(self, key):
+        """ Memory-mapped column [T] by name or number. """
+        return self.data[self._index[key] if isinstance(key, str) else key]
+
+    def read(self, keys=None):
+        """ Reads columns given by names or numbers (all by default) to array [T x k]. """
+        if keys is None:
+            return np.array(self.data.T)
+        return np.stack([self.column(key) for key in keys], axis=1)
+
+    def joint_positions(self):
+        """ Joint positions 1..7 [T x 21], m. """
+        return self.read(JOINT_POS_COLUMNS)
+
+    def close(self):
+        self._data = None
+
+
+def read_trajectory(path):
+    """ Reads all simulation rows of the binary file [T x M]. """
+    return TrajectoryFile(path).read()
+
+
+def export_csv(path, trajectory, columns=None):
+    """ Exports simulation rows [T x M] or an opened TrajectoryFile to CSV with column names header. """
+    if isinstance(trajectory, TrajectoryFile):
+        columns = trajectory.columns if columns is None else columns
+        trajectory = trajectory.read()
+    columns = uxsim_columns(trajectory.shape[1]) if columns is None else columns
+    np.savetxt(path, trajectory, delimiter=',', header=','.join(columns), comments='')
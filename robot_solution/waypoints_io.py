@@ -0,0 +1,153 @@
+""" Import and export of waypoint lists.
+
+Waypoints are given by joint angles (columns angle1..angle6, degrees) or by Cartesian poses
+(columns x, y, z in m and quat1..quat4). Files are CSV with the column names header or binary
+files of robot_solution.trajectory_io with the same column names.
+Cartesian waypoints are validated and solved in chunks on a process pool, the solutions are
+chosen along the track by the minimal joint travel. Errors are collected into the report.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from robot_solution.modeling.chain import solve_forward_batch
+from robot_solution.modeling.branches import select_branches
+from robot_solution.modeling.reachability import get_reachability_index
+from robot_solution.track import Track
+from robot_solution.trajectory_io import write_trajectory, TrajectoryFile, EXTENSION
+
+JOINT_COLUMNS = [f'angle{j + 1}' for j in range(6)]
+CARTESIAN_COLUMNS = ['x', 'y', 'z'] + [f'quat{j + 1}' for j in range(4)]
+CHUNK_SIZE = 500  # poses solved by one task of the pool
+QUAT_TOL = 1e-3  # allowed deviation of the quaternion norm from 1
+
+
+class ImportReport:
+    """ Result of the waypoints import: the track of valid waypoints and errors by file rows. """
+
+    def __init__(self, path, kind, n_rows):
+        self.path = path
+        self.kind = kind  # 'joint' or 'cartesian'
+        self.n_rows = n_rows
+        self.track = Track()
+        self.errors = []  # (row number from 1, message)
+        self.warnings = []  # (row number from 1, message)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def summary(self):
+        return (f'{self.path}: {len(self.track)} of {self.n_rows} points imported, '
+                f'{len(self.errors)} errors, {len(self.warnings)} warnings')
+
+    def lines(self):
+        """ Summary and messages of the rows. """
+        return [self.summary()] + [f'row {row}: error: {message}' for row, message in self.errors] + \
+               [f'row {row}: warning: {message}' for row, message in self.warnings]
+
+
+def read_waypoints(path):
+    """ Reads waypoint values [n x 6] or [n x 7] and their kind ('joint' or 'cartesian'). """
+    if path.endswith(EXTENSION):
+        file = TrajectoryFile(path)
+        columns = file.columns
+        read = file.read
+    else:
+        with open(path) as csv_file:
+            columns = [name.strip() for name in csv_file.readline().lstrip('#').split(',')]
+        # genfromtxt gives a row [m] for one line (ndmin needs numpy 1.23)
+        values = np.atleast_2d(np.genfromtxt(path, delimiter=',', skip_header=1))
+        read = lambda keys: values[:, [columns.index(key) for key in keys]] if values.size else \
+            np.empty((0, len(keys)))
+    for kind, names in [('joint', JOINT_COLUMNS), ('cartesian', CARTESIAN_COLUMNS)]:
+        if all(name in columns for name in names):
+            return read(names), kind
+    raise ValueError(f'{path}: columns {", ".join(JOINT_COLUMNS)} or {", ".join(CARTESIAN_COLUMNS)} '
+                     f'are required, got {", ".join(columns)}')
+
+
+def _solve_chunk(poses):
+    return solve_forward_batch(poses)[0]
+
+
+def solve_poses(poses, workers=None, chunk_size=CHUNK_SIZE):
+    """ All forward solutions [N x B x 6] (nan for missing) of poses [N x 7], solved in chunks
+    on the process pool (in this process if there is one chunk or workers is 1).
+    Workers are spawned, not forked: the pool is started from the GUI threads too
+    (the frozen application needs multiprocessing.freeze_support in its entry point).
+    """
+
+    if workers == 1 or poses.shape[0] <= chunk_size:
+        return _solve_chunk(poses)
+    chunks = [poses[start:start + chunk_size] for start in range(0, poses.shape[0], chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        solutions = list(executor.map(_solve_chunk, chunks))
+    n_branches = max(chunk.shape[1] for chunk in solutions)
+    result = np.full((poses.shape[0], n_branches, 6), np.nan)
+    start = 0
+    for chunk in solutions:
+        result[start:start + chunk.shape[0], :chunk.shape[1]] = chunk
+        start += chunk.shape[0]
+    return result
+
+
+def _validate_poses(poses, report):
+    """ Normalizes quaternions. Returns the masks of rows worth solving and of rows probably out of
+    the workspace by the reachability index (only a hint for the messages, they are solved too).
+    """
+
+    valid = ~np.isnan(poses).any(axis=1)
+    norms = np.linalg.norm(poses[:, 3:], axis=1)
+    valid &= norms > QUAT_TOL
+    for row in np.flatnonzero(~valid):
+        report.errors.append((row + 1, 'missing values or zero quaternion'))
+    for row in np.flatnonzero(valid & (np.abs(norms - 1) > QUAT_TOL)):
+        report.warnings.append((row + 1, f'quaternion norm {norms[row]:.4f} is normalized'))
+    poses[valid, 3:] /= norms[valid, None]
+    index = get_reachability_index()
+    outside = np.zeros_like(valid)
+    if index is not None:
+        outside = valid & ~index.query(np.where(valid[:, None], poses, 0))
+    return valid, outside
+
+
+def import_waypoints(path, workers=None):
+    """ Reads and validates waypoints, solves Cartesian ones. Returns ImportReport. """
+    values, kind = read_waypoints(path)
+    report = ImportReport(path, kind, values.shape[0])
+    if kind == 'joint':
+        valid = ~np.isnan(values).any(axis=1)
+        for row in np.flatnonzero(~valid):
+            report.errors.append((row + 1, 'missing values'))
+        report.track = Track.from_angles(values[valid])
+        return report
+    poses = values.copy()
+    valid, outside = _validate_poses(poses, report)
+    solutions = solve_poses(poses[valid], workers) if valid.any() else np.full((0, 1, 6), np.nan)
+    candidates = np.full((poses.shape[0],) + solutions.shape[1:], np.nan)
+    candidates[valid] = solutions
+    solved = valid & ~np.isnan(candidates).any(axis=-1).all(axis=-1)
+    for row in np.flatnonzero(valid & ~solved):
+        report.errors.append((row + 1, 'pose is out of the workspace' if outside[row] else 'pose is unreachable'))
+    report.errors.sort()
+    if solved.any():
+        angles, _ = select_branches(candidates[solved])
+        report.track = Track.from_angles(angles, poses[solved], given_by_pose=True)
+    return report
+
+
+def export_waypoints(path, track, kind='joint'):
+    """ Writes the track waypoints by joint angles or Cartesian poses to CSV or the binary file. """
+    columns, values = (JOINT_COLUMNS, track.angles) if kind == 'joint' else (CARTESIAN_COLUMNS, track.poses)
+    if path.endswith(EXTENSION):
+        write_trajectory(path, np.ascontiguousarray(values), columns)
+    else:
+        np.savetxt(path, values, delimiter=',', header=','.join(columns), comments='')
+
+
+def default_kind(track):
+    """ Cartesian if all waypoints are given by poses, joint otherwise. """
+    return 'cartesian' if len(track) and track.given_by_pose.all() else 'joint'
+
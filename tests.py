@@ -1,13 +1,33 @@
 """ Contains tests of different implementations. Look into the __main__ section. """
 
+import os
+import pickle
+import tempfile
+import time
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 
-from robot_solution.modeling.transform import myquat2rotm
+from robot_solution.modeling.transform import myquat2rotm, myquat2eiler, myeiler2quat
+from robot_solution.modeling.transform_array import quat2eiler_array, eiler2quat_array
 from robot_solution.modeling.simulation import find_Trans_JointAngle_JointPos
 from robot_solution.modeling.solution import solve_straight, solve_forward
+from robot_solution.modeling.chain import solve_forward_batch, find_joint_pos_batch, get_chain
+from robot_solution.modeling.reachability import ReachabilityIndex
+from robot_solution.modeling.limits import get_joint_limits
+from robot_solution.modeling.branches import select_track_branches
+from robot_solution.modeling.collision import check_collisions, self_collision_pairs, Box, Plane
 from robot_solution.trajectory import get_trajectory, generate_random_track
+from robot_solution.trajectory_cache import TrajectoryCache
+from robot_solution import instrumentation
+from robot_solution.timing import cycle_time, get_time_optimal_trajectory
+from robot_solution.modeling.linear import linear_move
+from robot_solution.track import Track
+from robot_solution.modeling.point import Point
+from robot_solution.segments import iter_trajectory, create_segment_cache, segments_match_solver
+from robot_solution.trajectory_io import write_trajectory, TrajectoryFile, EXTENSION
+from robot_solution.waypoints_io import import_waypoints, export_waypoints
+from app.playback import TrajectoryPlayer, PlaybackClock
+from app.lod import TraceLod, segment_distances
 
 
 # robot_solution.robot_solution.solution.solve_straight
@@ -37,6 +57,70 @@ def test_solve_forward():
     print('Joint angles:', '\n', angles,'\n')
 
 
+# robot_solution.modeling.chain.solve_forward_batch
+def test_solve_forward_batch():
+    """ Tests the batch forward task solution on poses of random joint angles. """
+    print('This is test of batch forward solution.')
+    angles = np.random.uniform(-170, 170, (1000, 6))
+    poses = np.array([solve_straight(np.hstack((a, 0 * a))) for a in angles])
+    allSolutionsDeg, reachable = solve_forward_batch(poses)
+    print('Solutions shape:', allSolutionsDeg.shape, 'reachable:', reachable.mean())
+    # the initial angles must be one of the branches
+    error = np.abs((allSolutionsDeg - angles[:, None, :] + 180) % 360 - 180).max(axis=2)
+    print('Max error of the initial angles:', np.nanmin(error, axis=1).max(), '\n')
+
+
+# robot_solution.modeling.branches.select_track_branches
+def test_branch_selection():
+    """ Tests the joint travel of the track with selected branches against the first solutions. """
+    print('This is test of branch selection.')
+    track = generate_random_track()
+    poses = np.array([solve_straight(np.hstack((a, 0 * a))) for a in track])
+    first = solve_forward_batch(poses)[0]
+    first = np.array([branches[~np.isnan(branches).any(axis=1)][0] for branches in first])
+    selected = select_track_branches(poses)
+    for name, angles in [('First solutions', first), ('Selected solutions', selected)]:
+        print(f'{name} joint travel:', np.abs(np.diff(angles, axis=0)).sum())
+    print('Travel of the initial track:', np.abs(np.diff(track, axis=0)).sum(), '\n')
+
+
+# robot_solution.modeling.transform_array
+def test_orientation_arrays():
+    """ Tests array conversions of quaternions and Euler angles against the scalar ones. """
+    print('This is test of array orientation conversions.')
+    quat = np.random.uniform(-1, 1, (1000, 4))
+    eiler = quat2eiler_array(quat)
+    # angles are compared modulo the full turn
+    eiler_error = np.abs((eiler - np.array([myquat2eiler(q) for q in quat]) + 180) % 360 - 180).max()
+    print('Max error of Euler angles:', eiler_error)
+    quat = eiler2quat_array(eiler)
+    scalar_quat = np.array([myeiler2quat(e) for e in eiler])
+    # q and -q are the same orientation
+    quat_error = np.minimum(np.abs(quat - scalar_quat).max(axis=1), np.abs(quat + scalar_quat).max(axis=1)).max()
+    print('Max error of quaternions:', quat_error, '\n')
+    assert eiler_error < 1e-9 and quat_error < 1e-9, 'array conversions differ from the scalar ones'
+
+
+# robot_solution.modeling.reachability.ReachabilityIndex
+def test_reachability_index():
+    """ Tests the reachability index on poses of random joint angles and random poses. """
+    print('This is test of reachability index.')
+    start = time.perf_counter()
+    index = ReachabilityIndex.build(samples=500000)
+    print(f'Index {index.shape} built in {time.perf_counter() - start:.3f} s')
+    limits = get_joint_limits()
+    _, poses = find_joint_pos_batch(np.random.uniform(limits[:, 0], limits[:, 1], (10000, 6)))
+    print('Reachable poses found:', index.query(poses).mean())
+    print('Index matches the robot:', index.matches(get_chain(), limits),
+          'other limits:', index.matches(get_chain(), limits / 2))
+    random_poses = np.hstack((np.random.uniform(-3, 3, (10000, 3)), np.random.randn(10000, 4)))
+    print('Random poses flagged reachable:', index.query(random_poses).mean())
+    start = time.perf_counter()
+    for pose in random_poses[:1000]:
+        index.contains(pose)
+    print(f'Single query time, us: {(time.perf_counter() - start) * 1000:.2f}', '\n')
+
+
 # robot_solution.robot_solution.simulation.find_Trans_JointAngle_JointPos
 def count_jointpose_by_angles():
     """ Tests transformation of joint angles to its positions. """
@@ -53,6 +137,19 @@ def count_jointpose_by_angles():
     print('\n')
 
 
+# robot_solution.modeling.chain.find_joint_pos_batch
+def count_jointpose_batch():
+    """ Tests batch transformation of joint angles to joint positions and tool poses. """
+    print('This is test of count joint positions of many joint states at once.')
+    angles = np.random.uniform(-170, 170, (100, 6))
+    x = np.hstack((angles, 0 * angles))
+    JointPos, pose = find_joint_pos_batch(x)
+    JointPosScalar = np.array([find_Trans_JointAngle_JointPos(x0)[2] for x0 in x])
+    print('Joint positions shape:', JointPos.shape, 'max error:', np.abs(JointPos - JointPosScalar).max())
+    poseScalar = np.array([solve_straight(x0) for x0 in x])
+    print('Max error of tool positions:', np.abs(pose[:, :3] - poseScalar[:, :3]).max(), '\n')
+
+
 # robot_solution.trajectory.generate_random_track
 def test_random_track():
     """ Tests generation of random track. """
@@ -61,6 +158,135 @@ def test_random_track():
     print('Random track is:\n', track, '\n')
 
 
+# robot_solution.modeling.point.Point
+def test_point():
+    """ Tests the point without Qt: structured result of the forward solution and pickling. """
+    print('This is test of point.')
+    point = Point()
+    point.angles = np.array([10, 20, 30, 40, 50, 60])
+    copy = pickle.loads(pickle.dumps(point))
+    print('Pickled point equals:', np.allclose(copy.pose, point.pose), np.allclose(copy.angles, point.angles))
+    print('Reachable:', point.try_solve_forward(point.pose.copy()))
+    print('Unreachable:', point.try_solve_forward(np.array([5., 5, 5, 1, 0, 0, 0])), '\n')
+
+
+# robot_solution.track.Track
+def test_track():
+    """ Tests building and editing of a long track. """
+    print('This is test of track container.')
+    angles = np.random.uniform(-170, 170, (20000, 6))
+    poses = find_joint_pos_batch(angles)[1]
+    track = Track()
+    start = time.perf_counter()
+    for pose, point_angles in zip(poses, angles):
+        track.append(Point.from_state(pose, point_angles))
+    print(f'{len(track)} points appended in {time.perf_counter() - start:.3f} s')
+    start = time.perf_counter()
+    for k in range(1000):
+        track.insert(10000 + k, track.point(k))
+        track.delete(10000 + k + 1)
+    print(f'1000 inserts and deletes in {time.perf_counter() - start:.3f} s')
+    snapshot = track.snapshot()
+    print('Snapshot equals track:', np.array_equal(snapshot.angles, track.angles), 'numbers:',
+          [track.number(k) for k in [0, 9999, 10000, 19999]], '\n')
+
+
+# robot_solution.waypoints_io.import_waypoints
+def test_waypoints_import():
+    """ Tests import of a long Cartesian waypoints list with invalid rows. """
+    print('This is test of waypoints import.')
+    angles = np.random.uniform(-170, 170, (5000, 6))
+    track = Track.from_angles(angles, given_by_pose=True)
+    export_waypoints('waypoints_test.csv', track, 'cartesian')
+    with open('waypoints_test.csv', 'a') as file:
+        file.write('5,5,5,1,0,0,0\n0,0,0,0,0,0,0\n')
+    start = time.perf_counter()
+    report = import_waypoints('waypoints_test.csv')
+    print(f'{report.n_rows} rows imported in {time.perf_counter() - start:.3f} s')
+    print('\n'.join(report.lines()))
+    print('Poses are kept:', np.allclose(report.track.poses, track.poses))
+    export_waypoints('waypoints_test.csv', track[:1], 'cartesian')
+    report = import_waypoints('waypoints_test.csv')
+    assert report.ok and len(report.track) == 1, report.lines()
+    print('One row imported:', report.summary(), '\n')
+
+
+# robot_solution.modeling.collision.check_collisions
+def test_collisions():
+    """ Tests collision checking of a long trajectory with obstacles. """
+    print('This is test of collision checking.')
+    times = np.linspace(0, 1, 100000)[:, None]
+    angles = np.sin(2 * np.pi * times * np.array([1, 2, 3, 1.5, 2.5, 0.7])) * np.array([170, 100, 130, 170, 120, 170])
+    joint_pos = find_joint_pos_batch(angles)[0].transpose(0, 2, 1)
+    points = np.concatenate((np.zeros((times.size, 1, 3)), joint_pos), axis=1)
+    obstacles = [Plane([0, 0, 0], [0, 0, 1], 'floor'), Box([0.6, -0.3, 0], [1.0, 0.3, 0.5], 'table')]
+    start = time.perf_counter()
+    collisions = check_collisions(points, obstacles)
+    print(f'{times.size} frames checked in {time.perf_counter() - start:.3f} s')
+    print(f'{len(collisions)} collisions, the first ones:', *collisions[:3], sep='\n')
+    home = np.concatenate((np.zeros((1, 1, 3)), find_joint_pos_batch(np.zeros((1, 6)))[0].transpose(0, 2, 1)), axis=1)
+    print('Home position collisions:', check_collisions(home, obstacles))
+    # spherical wrist: joints 4 and 5 coincide, links 3 and 5 touch there and are excluded
+    wrist = np.array([[[0, 0, 0], [0, 0, .4], [0, 0, .8], [.5, 0, .8], [.8, 0, .8], [.8, 0, .8], [.9, 0, .8], [1, 0, .8]]])
+    print('Spherical wrist collisions:', check_collisions(wrist),
+          'with the exclusion:', check_collisions(wrist, self_pairs=self_collision_pairs([(3, 5)])), '\n')
+
+
+# app.lod.TraceLod
+def test_trace_lod():
+    """ Tests levels of detail of long joint traces. """
+    print('This is test of joint traces simplification.')
+    times = np.linspace(0, 1, 100000)[:, None]
+    angles = np.sin(2 * np.pi * times * np.array([1, 2, 3, 1.5, 2.5, 0.7])) * np.array([170, 100, 130, 170, 120, 170])
+    positions = find_joint_pos_batch(angles)[0] * 1000
+    lod = TraceLod(positions.shape[2])
+    start = time.perf_counter()
+    for chunk in range(0, times.size, 1000):
+        lod.append(positions[chunk:chunk + 1000])
+    print(f'{times.size} samples simplified in {time.perf_counter() - start:.3f} s')
+    for level, tolerance in enumerate(lod.tolerances):
+        samples = lod.indices(level, 6, times.size - 1)
+        error = max(segment_distances(positions[first + 1:last, :, 6], positions[first, :, 6], positions[last, :, 6])
+                    .max(initial=0) for first, last in zip(samples[:-1], samples[1:]))
+        print(f'Level {level}: {samples.size} samples, error {error:.3f} mm (tolerance {tolerance})')
+    print()
+
+
+# app.playback.PlaybackClock
+def test_playback_clock():
+    """ Tests the playback clock with a manual wall time. """
+    print('This is test of playback clock.')
+    wall = [0.]
+    clock = PlaybackClock(speed=2, timer=lambda: wall[0])
+    clock.start()
+    wall[0] = 1.
+    print('Time after 1 s at 2x:', clock.time())
+    clock.set_speed(0.5)
+    wall[0] = 3.
+    print('Time after 2 s more at 0.5x:', clock.time())
+    clock.pause()
+    wall[0] = 10.
+    clock.seek(0.25)
+    print('Paused and seeked time:', clock.time(), 'speed limited to:', PlaybackClock(speed=100).speed, '\n')
+
+
+# robot_solution.instrumentation
+def test_instrumentation():
+    """ Tests stage timers: overhead when disabled and percentiles when enabled. """
+    print('This is test of instrumentation.')
+    timed_function = instrumentation.timed('test.stage')(lambda: None)
+    start = time.perf_counter()
+    for _ in range(100000):
+        timed_function()
+    print(f'Disabled timer call: {(time.perf_counter() - start) * 10:.2f} us')
+    instrumentation.enable()
+    for _ in range(1000):
+        timed_function()
+    instrumentation.enable(False)
+    print('Stats:', instrumentation.stats()['stages']['test.stage'], '\n')
+    instrumentation.reset()
+
+
 # robot_solution.trajectory.get_trajectory
 def test_get_trajectory():
     """ Tests generation of trajectory from random track. """
@@ -75,12 +301,103 @@ def test_get_trajectory():
     plot_robot_movement(points=points)
 
 
+# robot_solution.trajectory_cache.TrajectoryCache
+def test_trajectory_cache():
+    """ Tests reuse of the computed trajectory. """
+    print('This is test of trajectory cache.')
+    cache = TrajectoryCache('trajectory_cache')
+    track = generate_random_track()
+    for attempt in ['computed', 'cached']:
+        start = time.perf_counter()
+        uxSim = cache.trajectory(track)
+        print(f'Trajectory {attempt} in {time.perf_counter() - start:.3f} s, shape: {uxSim.shape}')
+    print('Cache size, MB:', cache.size() / 2 ** 20, '\n')
+
+
+# robot_solution.segments.iter_trajectory
+def test_segment_cache():
+    """ Tests recomputation of the edited track by segments. """
+    print('This is test of segment-wise recomputation.')
+    cache = create_segment_cache()
+    track = generate_random_track()
+    uxSim = np.vstack(list(iter_trajectory(track, cache)))
+    track[len(track) // 2] = generate_random_track()[0]  # edit one point
+    start = time.perf_counter()
+    uxSim_edited = np.vstack(list(iter_trajectory(track, cache)))
+    print(f'Edited trajectory in {time.perf_counter() - start:.3f} s, cache: {cache.stats()}')
+    uxSim_full = get_trajectory(track)
+    print('Segments match the solver:', segments_match_solver())
+    assert uxSim_full.shape == uxSim_edited.shape, (uxSim_edited.shape, uxSim_full.shape)
+    print('Max difference with full computation:', np.max(np.abs(uxSim_edited - uxSim_full)), '\n')
+    assert np.allclose(uxSim_edited, uxSim_full, rtol=0, atol=1e-6), 'segments differ from full computation'
+
+
+# robot_solution.timing
+def test_time_optimal():
+    """ Tests the time-optimal timing against the timing of get_trajectory. """
+    print('This is test of time-optimal timing.')
+    track = generate_random_track()
+    uxSim = get_trajectory(track)
+    duration, segments = cycle_time(track)
+    print('Solver duration, s:', (uxSim.shape[0] - 1) * 0.01, 'time-optimal cycle time, s:', duration)
+    print('Segment durations, s:', segments)
+    rows = get_time_optimal_trajectory(track)
+    velocities = np.abs(np.diff(rows[:, 37:43], axis=0)) / np.diff(rows[:, 0])[:, None]
+    print('Peak joint velocities, deg/s:', velocities.max(axis=0), '\n')
+
+
+# robot_solution.modeling.linear.linear_move
+def test_linear_move():
+    """ Tests the dense linear move: tool deviation from the line and joint continuity. """
+    print('This is test of linear move.')
+    start_angles = np.array([10., -20., 30., 15., 40., -25.])
+    start_pose = find_joint_pos_batch(start_angles)[1][0]
+    end_pose = start_pose.copy()
+    end_pose[:3] += [-0.1, 0.05, 0.02]
+    start = time.perf_counter()
+    poses, angles = linear_move(start_pose, end_pose, start_angles, step=1e-5)
+    print(f'{poses.shape[0]} samples solved in {time.perf_counter() - start:.4f} s')
+    tool = find_joint_pos_batch(angles)[1]
+    print('Max tool deviation, m:', np.abs(tool[:, :3] - poses[:, :3]).max())
+    print('Max joint step, deg:', np.abs(np.diff(angles, axis=0)).max())
+    print('Start angles error, deg:', np.abs(angles[0] - start_angles).max())
+    track = np.vstack((start_angles, angles[-1]))
+    duration, _ = cycle_time(track, poses=np.vstack((start_pose, end_pose)), linear=[False, True])
+    print('Linear move time, s:', duration, '\n')
+
+
+# robot_solution.trajectory_io.TrajectoryFile
+def test_trajectory_file():
+    """ Tests the binary trajectory file against CSV. """
+    print('This is test of binary trajectory file.')
+    uxSim = get_trajectory(generate_random_track())
+    with tempfile.TemporaryDirectory() as directory:
+        binary_path = os.path.join(directory, 'traj_test' + EXTENSION)
+        csv_path = os.path.join(directory, 'traj_test.csv')
+        start = time.perf_counter()
+        write_trajectory(binary_path, uxSim)
+        np.savetxt(csv_path, uxSim, delimiter=',')
+        print(f'Files written in {time.perf_counter() - start:.3f} s')
+        start = time.perf_counter()
+        points_csv = np.genfromtxt(csv_path, delimiter=',', usecols=range(43, 64))
+        print(f'CSV joint positions read in {time.perf_counter() - start:.3f} s')
+        start = time.perf_counter()
+        file = TrajectoryFile(binary_path)
+        points = file.joint_positions()
+        print(f'Binary joint positions read in {time.perf_counter() - start:.5f} s')
+        file.close()  # the mapped file is removed with the directory
+    print('Max difference:', np.max(np.abs(points - points_csv)), '\n')
+
+
 ''' Functions for animation '''
 def plot_robot_movement(points=np.empty(0), filename='traj_out.csv'):
     """ Plots robot animation by given joint points [nPoints x 3]
-    or by the file traj_out.csv. """
+    or by the file traj_out.csv (traj_out.rtraj). """
     if not points.size:
-        points = np.genfromtxt(filename, delimiter=',', skip_header=19, usecols=range(43, 64))
+        if filename.endswith(EXTENSION):
+            points = TrajectoryFile(filename).joint_positions()
+        else:
+            points = np.genfromtxt(filename, delimiter=',', skip_header=19, usecols=range(43, 64))
         # add zero point
         points = np.hstack((np.zeros((points.shape[0], 3)), points)) * 1000  # m -> mm
     N = points.shape[1] // 3
@@ -96,22 +413,11 @@ def plot_robot_movement(points=np.empty(0), filename='traj_out.csv'):
     ax.set_ylim((-1700, 1700))
     ax.set_zlim((-500, 2500))
     fig.suptitle('Движение 6-осного робота', fontsize=10)
-    # create lines
-    line_init, = ax.plot(x[0, :], y[0, :], z[0, :], lw=2, c='b', marker='.',
-                         markersize=8, label='Исходное положение')
-    line, = ax.plot(x[0, :], y[0, :], z[0, :], lw=2, c='g', marker='.',
-                    markersize=8, label='Текущее положение')
-    # create lines of joints track
-    joint_lines = np.empty(N, dtype=object)
-    for j in range(N):
-        joint_lines[j], = ax.plot(
-            x[0, j], y[0, j], z[0, j], c='#6b6b6b', lw=0.5)
-    # Creating the Animation object
+    # create lines and the player
     # SolverStep = 0.01 s = 10 ms: interval = 10
-    line_ani = animation.FuncAnimation(
-        fig, func_ani, frames=points.shape[0], repeat=False,
-        fargs=(x, y, z, line, joint_lines), interval=10, blit=False)
+    player = TrajectoryPlayer(ax, x, y, z, interval=10)
     ax.legend(loc='upper right', fontsize=8, frameon=False)
+    player.start()
     plt.show()
 
 
@@ -128,25 +434,31 @@ def plot_velocities(input_points=np.empty(0), filename='traj_in.csv'):
         plt.show()
 
 
-def func_ani(ind, x, y, z, line, joint_lines):
-    """ Iterable animation function. """
-    N = x.shape[1]
-    line.set_data(np.vstack((x[ind, :], y[ind, :])))
-    line.set_3d_properties(z[ind, :])
-    # update joint lines
-    for j in range(N):
-        joint_lines[j].set_data(np.vstack((x[:ind + 1, j], y[:ind + 1, j])))
-        joint_lines[j].set_3d_properties(z[:ind + 1, j])
-    return [line, ]
-
 
 if __name__ == '__main__':
     np.set_printoptions(precision=4, suppress=True) # output settings
 
     test_solve_straight()
     test_solve_forward()
+    test_solve_forward_batch()
+    test_branch_selection()
+    test_orientation_arrays()
+    test_reachability_index()
     count_jointpose_by_angles()
+    count_jointpose_batch()
     test_random_track()
+    test_point()
+    test_track()
+    test_trajectory_cache()
+    test_segment_cache()
+    test_time_optimal()
+    test_linear_move()
+    test_trajectory_file()
+    test_waypoints_import()
+    test_collisions()
+    test_trace_lod()
+    test_playback_clock()
+    test_instrumentation()
 
     test_get_trajectory()
     # plot_robot_movement()
\ No newline at end of file